@@ -7,18 +7,168 @@
 
 import time
 import hmac
-import json
+import uuid
+import base64
 import hashlib
 import requests
 import traceback
+from urllib.parse import quote
 from utils.log import lg
-from datetime import datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 from utils.config import Config
+from utils.metrics import API_REQUESTS, API_LATENCY
+from utils.tracing import traced, span
+from app.dns_provider import DnsProvider
 
 config = Config()
 
 
-class Aliyun:
+def percent_encode(value) -> str:
+    """阿里云 RPC 签名使用的 RFC3986 编码"""
+    return quote(str(value), safe="~")
 
 
+class Aliyun(DnsProvider):
+    """
+    阿里云云解析 DNS  API文档 https://help.aliyun.com/document_detail/29739.html
+    RPC 风格接口，HMAC-SHA1 签名，连接复用同一个 Session
+    """
 
+    name = "Aliyun"
+    endpoint = "https://alidns.aliyuncs.com/"
+    version = "2015-01-09"
+
+    # 这些错误码说明缓存的记录已经不存在
+    RECORD_GONE = ("DomainRecordNotBelongToUser", "IncorrectRecordId", "InvalidRecordId.NotFound")
+
+    def __init__(self, debug=False):
+        """
+        :param debug: 是否开启Debug日志
+        """
+        super().__init__()
+        self.debug = debug
+        self.access_key_id = config.get_jsonpath('$.aliyun.access_key_id', '')
+        self.access_key_secret = config.get_jsonpath('$.aliyun.access_key_secret', '')
+        self.endpoint = config.get_jsonpath('$.aliyun.endpoint', '') or self.endpoint
+        self.timeout = config.get_jsonpath('$.aliyun.timeout', 7)
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
+
+    def signature(self, params: dict, method: str = "GET") -> str:
+        """
+        计算签名
+        :param params:  全部请求参数（不含 Signature）
+        :param method:  请求方法
+        """
+        canonicalized = "&".join(f"{percent_encode(k)}={percent_encode(v)}" for k, v in sorted(params.items()))
+        string_to_sign = f"{method}&{percent_encode('/')}&{percent_encode(canonicalized)}"
+        if self.debug:
+            lg.debug(f"待签名字符串: \n{string_to_sign}")
+        digest = hmac.new(f"{self.access_key_secret}&".encode("utf-8"), string_to_sign.encode("utf-8"), hashlib.sha1).digest()
+        return base64.b64encode(digest).decode("utf-8")
+
+    @traced("aliyun.request", lambda args, kwargs: {"endpoint": args[1] if len(args) > 1 else kwargs.get("action")})
+    def requst(self, action: str, params: dict, method: str = "GET") -> dict:
+        """
+        :param action:  接口名
+        :param params:  接口参数
+        :return: 返回数据，失败时包含 Code/Message
+        """
+        with span("aliyun.sign"):
+            query = {
+                "Format": "JSON",
+                "Version": self.version,
+                "AccessKeyId": self.access_key_id,
+                "SignatureMethod": "HMAC-SHA1",
+                "Timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "SignatureVersion": "1.0",
+                "SignatureNonce": uuid.uuid4().hex,
+                "Action": action,
+                **{k: v for k, v in params.items() if v is not None},
+            }
+            query["Signature"] = self.signature(query, method)
+
+        start = time.perf_counter()
+        try:
+            try:
+                with span("network", endpoint=action):
+                    r = self.session.request(method, self.endpoint, params=query, timeout=self.timeout)
+                API_REQUESTS.inc(api="aliyun", endpoint=action, status=r.status_code)
+            except requests.exceptions.RequestException:
+                API_REQUESTS.inc(api="aliyun", endpoint=action, status="error")
+                raise
+            finally:
+                API_LATENCY.observe(time.perf_counter() - start, api="aliyun", endpoint=action)
+            resp = r.json()
+            if self.debug:
+                lg.debug(f"返回数据: {resp}")
+            return resp
+        except Exception as e:
+            lg.error(f"Aliyun请求异常: {traceback.format_exc()}")
+            return {"Code": "RequestError", "Message": str(e)}
+
+    @staticmethod
+    def _record(record: dict) -> dict:
+        return {
+            "id": record.get("RecordId"),
+            "name": record.get("RR"),
+            "type": record.get("Type"),
+            "value": record.get("Value"),
+            "ttl": record.get("TTL", 600),
+            "line": record.get("Line", "default"),
+        }
+
+    def lookup(self, domain: str, name: str, record_type: str = "TXT") -> list:
+        resp = self.requst("DescribeSubDomainRecords", {"SubDomain": f"{name}.{domain}", "DomainName": domain,
+                                                        "Type": record_type, "PageSize": 100})
+        if resp.get("Code"):
+            lg.error(f"查询阿里云 {domain} 域名的 {name} 记录失败，异常原因：{resp.get('Message')}")
+            return []
+        return [self._record(i) for i in resp.get("DomainRecords", {}).get("Record", [])
+                if i.get("RR") == name and i.get("Type") == record_type]
+
+    def _upsert(self, domain: str, name: str, value: str, record: dict) -> dict:
+        if record:
+            return self.requst("UpdateDomainRecord", {"RecordId": record["id"], "RR": name, "Type": "TXT",
+                                                      "Value": value, "TTL": record["ttl"]})
+        return self.requst("AddDomainRecord", {"DomainName": domain, "RR": name, "Type": "TXT", "Value": value})
+
+    def upsert_txt(self, domain: str, name: str, value: str) -> bool:
+        record = self.find_record(domain, name)
+        if record and record["value"] == value:
+            return True
+        resp = self._upsert(domain, name, value, record)
+        if record and resp.get("Code") in self.RECORD_GONE:
+            # 缓存的记录已被删除，重新查询后再试一次
+            self.forget_record(domain, name)
+            record = self.find_record(domain, name)
+            resp = self._upsert(domain, name, value, record)
+
+        # 记录值未变化时阿里云返回 DomainRecordDuplicate，视为成功
+        if resp.get("Code") and resp.get("Code") != "DomainRecordDuplicate":
+            self.forget_record(domain, name)
+            lg.error(f"设置阿里云 {domain} 域名的 {name} 记录失败，异常原因：{resp.get('Code')} {resp.get('Message')}")
+            return False
+        self.cache_record(domain, {"id": resp.get("RecordId") or record.get("id"), "name": name, "type": "TXT",
+                                   "value": value, "ttl": record.get("ttl", 600) if record else 600,
+                                   "line": record.get("line", "default") if record else "default"})
+        old_value = f" 从 {record.get('value')}" if record else ""
+        lg.info(f"将 {domain} 域名的 {name} 记录值{old_value} 设置为 {value} 成功")
+        return True
+
+    def delete_txt(self, domain: str, name: str) -> bool:
+        record = self.find_record(domain, name)
+        if not record:
+            return True
+        resp = self.requst("DeleteDomainRecord", {"RecordId": record["id"]})
+        self.forget_record(domain, name)
+        if resp.get("Code") and resp.get("Code") not in self.RECORD_GONE:
+            lg.error(f"删除阿里云 {domain} 域名的 {name} 记录失败，异常原因：{resp.get('Code')} {resp.get('Message')}")
+            return False
+        return True
+
+
+if __name__ == '__main__':
+    aliyun = Aliyun(debug=True)
+    lg.debug(aliyun.lookup("example.com", "_acme-challenge"))
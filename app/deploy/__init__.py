@@ -0,0 +1,6 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 14:02
+# Email: leiyong711@163.com
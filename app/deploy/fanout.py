@@ -0,0 +1,191 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 14:40
+# Email: leiyong711@163.com
+
+import os
+import time
+import tempfile
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import lg
+from utils.config import Config
+from utils.constants import TEMP_PATH
+from utils.cert_tools import write_files, list_files, validate_key_pairs
+from app.deploy.transport import build_transport
+
+config = Config()
+
+# 所有域名共用一个有界线程池，同时推送的目标数量不会超过 max_workers
+executor = ThreadPoolExecutor(max_workers=int(config.get_jsonpath("$.deploy.max_workers", 8)),
+                              thread_name_prefix="deploy")
+
+
+class TargetStatus:
+    """单个部署目标的结果"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.ok = False
+        self.staged = False
+        self.changed = False
+        self.attempts = 0
+        self.error = ""
+        self.seconds = 0.0
+
+    def __repr__(self):
+        state = "成功" if self.ok else f"失败({self.error})"
+        return f"{self.name}: {state}, 变化: {self.changed}, 尝试 {self.attempts} 次, 耗时 {self.seconds:.2f}s"
+
+
+def get_targets(domain_conf: dict) -> list:
+    """
+    域名的部署目标列表
+    优先使用 ssl_deployment_targets，未配置时使用 ssl_deployment_path
+    """
+    targets = domain_conf.get("ssl_deployment_targets") or domain_conf.get("ssl_deployment_path") or []
+    if isinstance(targets, (str, dict)):
+        targets = [targets]
+    return list(targets)
+
+
+def validate_files(files: dict) -> (bool, str):
+    """在本地临时目录中校验私钥与证书匹配，只校验一次，再推送到各个目标"""
+    os.makedirs(TEMP_PATH, exist_ok=True)
+    with tempfile.TemporaryDirectory(prefix="validate-", dir=TEMP_PATH) as tmp:
+        write_files(files, tmp)
+        return validate_key_pairs(list_files(tmp))
+
+
+def _with_retry(status: TargetStatus, func, retries: int, interval: float):
+    attempts = 0
+    while True:
+        attempts += 1
+        status.attempts = max(status.attempts, attempts)
+        try:
+            return func()
+        except Exception as e:
+            status.error = str(e) or e.__class__.__name__
+            if attempts > retries:
+                raise
+            lg.warning(f"部署目标 {status.name} 第 {attempts} 次失败，{interval} 秒后重试: {status.error}")
+            time.sleep(interval)
+
+
+def deploy_to_targets(files: dict, targets: list, all_or_nothing: bool = None, retries: int = None,
+                      retry_interval: float = None) -> (bool, bool, list):
+    """
+    并发推送证书到多个部署目标
+    :param files:           {相对路径: 内容}
+    :param targets:         部署目标配置列表（字符串为本机目录，字典为远程目标）
+    :param all_or_nothing:  全部目标暂存成功后才替换，任一暂存失败则全部放弃；
+                            替换阶段有目标失败时，已替换的目标回滚为原文件，回滚失败的目标在结果中标记
+    :param retries:         单个目标失败重试次数
+    :param retry_interval:  重试间隔（秒）
+    :return: (是否全部成功, 是否有目标发生变化, [TargetStatus])
+    """
+    if all_or_nothing is None:
+        all_or_nothing = bool(config.get_jsonpath("$.deploy.all_or_nothing", False))
+    if retries is None:
+        retries = int(config.get_jsonpath("$.deploy.retries", 2))
+    if retry_interval is None:
+        retry_interval = float(config.get_jsonpath("$.deploy.retry_interval", 3))
+
+    transports, statuses = [], []
+    for target in targets:
+        try:
+            transport = build_transport(target)
+            transports.append(transport)
+            statuses.append(TargetStatus(transport.name))
+        except Exception as e:
+            status = TargetStatus(str(target))
+            status.error = str(e)
+            transports.append(None)
+            statuses.append(status)
+    if not transports:
+        return False, False, statuses
+
+    def stage(transport, status):
+        start = time.time()
+        try:
+            status.staged = _with_retry(status, lambda: transport.stage(files), retries, retry_interval)
+            status.ok = True
+        except Exception:
+            status.ok = False
+            transport.abort()
+        status.seconds += time.time() - start
+
+    def commit(transport, status):
+        start = time.time()
+        try:
+            status.changed = _with_retry(status, transport.commit, retries, retry_interval)
+        except Exception:
+            status.ok = False
+            transport.abort()
+        status.seconds += time.time() - start
+
+    def rollback(transport, status):
+        """其他目标替换失败时撤销本目标已完成的替换"""
+        status.ok = False
+        if not status.changed:
+            status.error = "其他部署目标替换失败，本目标内容未变化"
+            return
+        try:
+            transport.rollback()
+            status.changed = False
+            status.error = "其他部署目标替换失败，已回滚为原文件"
+        except Exception as e:
+            status.error = f"其他部署目标替换失败，回滚失败，目标仍为新文件: {e}"
+            lg.error(f"部署目标 {status.name} 回滚失败: {traceback.format_exc()}")
+
+    def stage_and_commit(transport, status):
+        stage(transport, status)
+        if status.ok:
+            commit(transport, status)
+
+    pairs = [(t, s) for t, s in zip(transports, statuses) if t is not None]
+    if all_or_nothing:
+        list(executor.map(lambda p: stage(*p), pairs))
+        if all(s.ok for s in statuses):
+            list(executor.map(lambda p: commit(*p), pairs))
+            if not all(s.ok for s in statuses):
+                list(executor.map(lambda p: rollback(*p), [(t, s) for t, s in pairs if s.ok]))
+        else:
+            for transport, status in pairs:
+                transport.abort()
+                if status.ok:
+                    status.ok = False
+                    status.error = "其他部署目标失败，已放弃"
+    else:
+        list(executor.map(lambda p: stage_and_commit(*p), pairs))
+
+    for status in statuses:
+        if status.ok:
+            lg.info(f"部署目标 {status}")
+        else:
+            lg.error(f"部署目标 {status}")
+    return all(s.ok for s in statuses), any(s.changed for s in statuses), statuses
+
+
+def deploy_bundle(bundle, domain_conf: dict) -> (bool, bool, list):
+    """
+    部署证书包到域名配置的全部目标
+    :param bundle:      CertBundle
+    :param domain_conf: domain_list 中的域名配置
+    :return: (是否全部成功, 是否有目标发生变化, [TargetStatus])
+    """
+    targets = get_targets(domain_conf)
+    if not targets:
+        lg.error(f"域名 {domain_conf.get('domain')} 未配置 ssl_deployment_path 或 ssl_deployment_targets")
+        return False, False, []
+    try:
+        status, text = validate_files(bundle.files)
+    except Exception:
+        lg.error(f"校验证书包失败，原因:\n{traceback.format_exc()}")
+        return False, False, []
+    if not status:
+        lg.error(f"域名 {domain_conf.get('domain')} 证书校验失败，已放弃部署: {text}")
+        return False, False, []
+    return deploy_to_targets(bundle.files, targets)
@@ -0,0 +1,249 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 00:20
+# Email: leiyong711@163.com
+
+import re
+import time
+import hashlib
+import requests
+import traceback
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.x509 import ocsp
+from cryptography.x509.oid import ExtensionOID, AuthorityInformationAccessOID, ExtendedKeyUsageOID
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.serialization import Encoding
+from cryptography.hazmat.primitives.asymmetric import padding, rsa, ec
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from utils.metrics import OCSP_FETCHES
+from utils.tracing import span
+from app.letsencrypt.bundle import pem_blocks
+from app.letsencrypt.bundle_store import bundle_store
+from app.deploy.fanout import get_targets, deploy_to_targets
+
+config = Config()
+
+DUAL_FULLCHAIN = re.compile(r"^fullchain\.([a-z]+)\.pem$")
+
+
+class OcspError(Exception):
+    """OCSP 响应获取或校验失败"""
+
+
+def _utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _this_update(response) -> datetime:
+    return _utc(getattr(response, "this_update_utc", None) or response.this_update)
+
+
+def _next_update(response):
+    value = getattr(response, "next_update_utc", None) or response.next_update
+    return _utc(value) if value else None
+
+
+def verify_signature(public_key, signature: bytes, data: bytes, hash_algorithm) -> None:
+    """按公钥类型校验签名，失败抛出 cryptography.exceptions.InvalidSignature"""
+    if isinstance(public_key, rsa.RSAPublicKey):
+        public_key.verify(signature, data, padding.PKCS1v15(), hash_algorithm)
+    elif isinstance(public_key, ec.EllipticCurvePublicKey):
+        public_key.verify(signature, data, ec.ECDSA(hash_algorithm))
+    else:
+        public_key.verify(signature, data)
+
+
+def responder_url(cert: x509.Certificate) -> str:
+    """证书 AIA 扩展中的 OCSP 地址，没有时返回空字符串"""
+    try:
+        aia = cert.extensions.get_extension_for_oid(ExtensionOID.AUTHORITY_INFORMATION_ACCESS).value
+    except x509.ExtensionNotFound:
+        return ""
+    return next((i.access_location.value for i in aia if i.access_method == AuthorityInformationAccessOID.OCSP), "")
+
+
+def validate_response(data: bytes, cert: x509.Certificate, issuer: x509.Certificate, skew: float = 300):
+    """
+    校验 OCSP 响应：状态成功、序列号一致、证书状态 GOOD、在有效期内，签名来自签发者或签发者授权的 OCSP 签名证书
+    :return: OCSPResponse
+    """
+    try:
+        response = ocsp.load_der_ocsp_response(data)
+    except ValueError as e:
+        raise OcspError(f"响应无法解析: {e}")
+    if response.response_status != ocsp.OCSPResponseStatus.SUCCESSFUL:
+        raise OcspError(f"响应状态 {response.response_status.name}")
+    if response.serial_number != cert.serial_number:
+        raise OcspError("响应中的证书序列号与证书不一致")
+    if response.certificate_status != ocsp.OCSPCertStatus.GOOD:
+        raise OcspError(f"证书状态 {response.certificate_status.name}")
+
+    now = datetime.now(timezone.utc)
+    next_update = _next_update(response)
+    if _this_update(response) > now + timedelta(seconds=skew):
+        raise OcspError("响应 thisUpdate 晚于当前时间")
+    if not next_update or next_update < now:
+        raise OcspError("响应已过期或缺少 nextUpdate")
+
+    signer = issuer
+    if response.certificates:
+        # 委托签名：OCSP 签名证书必须由签发者签发且带有 OCSPSigning 用途
+        delegate = response.certificates[0]
+        if delegate.issuer != issuer.subject:
+            raise OcspError("OCSP 签名证书不是由证书签发者签发")
+        try:
+            verify_signature(issuer.public_key(), delegate.signature, delegate.tbs_certificate_bytes,
+                             delegate.signature_hash_algorithm)
+        except InvalidSignature:
+            raise OcspError("OCSP 签名证书的签名校验失败")
+        try:
+            usages = delegate.extensions.get_extension_for_oid(ExtensionOID.EXTENDED_KEY_USAGE).value
+        except x509.ExtensionNotFound:
+            usages = []
+        if ExtendedKeyUsageOID.OCSP_SIGNING not in usages:
+            raise OcspError("OCSP 签名证书缺少 OCSPSigning 用途")
+        signer = delegate
+    try:
+        verify_signature(signer.public_key(), response.signature, response.tbs_response_bytes,
+                         response.signature_hash_algorithm)
+    except InvalidSignature:
+        raise OcspError("响应签名校验失败")
+    return response
+
+
+def staple_entries(bundle) -> list:
+    """
+    证书包中需要装订的证书
+    双证书包（fullchain.<算法>.pem）每个算法一个 ocsp.<算法>.der，其余证书包为 ocsp.der
+    :return: [(装订文件名, 叶子证书DER, 签发者证书DER)]
+    """
+    entries = []
+    for name, data in sorted(bundle.files.items()):
+        match = DUAL_FULLCHAIN.match(name)
+        if not match:
+            continue
+        certs = [der for kind, der in pem_blocks(data) if kind == "CERTIFICATE"]
+        if len(certs) > 1:
+            entries.append((f"ocsp.{match.group(1)}.der", certs[0], certs[1]))
+    if entries:
+        return entries
+    chain = bundle.chain_der()
+    return [("ocsp.der", bundle.leaf_der(), chain[0])] if chain else []
+
+
+class OcspStapler:
+    """
+    OCSP 装订文件管理
+    为每个已部署的证书预先获取 OCSP 响应，校验后原子写入部署目录（nginx ssl_stapling_file），
+    在 thisUpdate 到 nextUpdate 之间超过 refresh_ratio 时提前刷新，多个证书并发获取
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.ocsp.enabled', False))
+        self.refresh_ratio = float(config.get_jsonpath('$.ocsp.refresh_ratio', 0.5))
+        self.timeout = float(config.get_jsonpath('$.ocsp.timeout', 10))
+        self.max_workers = int(config.get_jsonpath('$.ocsp.max_workers', 4))
+        self.responder = config.get_jsonpath('$.ocsp.responder_url', '')  # 覆盖证书中的 OCSP 地址，用于内网代理或测试
+        self.session = requests.Session()
+        # {域名/装订文件名: {fingerprint, this_update, next_update, fetched_at}}
+        self.store = JsonStore("ocsp", {})
+
+    def due(self, key: str, fingerprint: str, now: float = None) -> bool:
+        """是否需要刷新：证书变化、从未获取或已超过刷新点"""
+        now = now or time.time()
+        with self.store.lock:
+            item = self.store.data.get(key)
+        if not item or item.get("fingerprint") != fingerprint:
+            return True
+        return now >= item["this_update"] + (item["next_update"] - item["this_update"]) * self.refresh_ratio
+
+    def fetch(self, leaf_der: bytes, issuer_der: bytes) -> tuple:
+        """
+        获取并校验 OCSP 响应
+        :return: (响应DER, OCSPResponse)
+        """
+        cert = x509.load_der_x509_certificate(leaf_der)
+        issuer = x509.load_der_x509_certificate(issuer_der)
+        url = self.responder or responder_url(cert)
+        if not url:
+            raise OcspError("证书中没有 OCSP 地址")
+        request = ocsp.OCSPRequestBuilder().add_certificate(cert, issuer, hashes.SHA1()).build()
+        with span("ocsp.fetch", url=url):
+            r = self.session.post(url, data=request.public_bytes(Encoding.DER),
+                                  headers={"Content-Type": "application/ocsp-request"}, timeout=self.timeout)
+        if r.status_code != 200:
+            raise OcspError(f"OCSP 服务返回 HTTP {r.status_code}")
+        return r.content, validate_response(r.content, cert, issuer)
+
+    def refresh_domain(self, domain_conf: dict, bundle=None, force: bool = False) -> bool:
+        """
+        刷新一个域名的装订文件
+        :param bundle: 证书包，为空时使用当前部署的版本
+        :param force:  不检查刷新时间（新证书部署时使用）
+        :return: 是否有文件发生变化
+        """
+        domain = domain_conf['domain']
+        bundle = bundle or bundle_store.current(domain)
+        if not bundle:
+            return False
+        files, states = {}, {}
+        for name, leaf, issuer in staple_entries(bundle):
+            key = f"{domain}/{name}"
+            fingerprint = hashlib.sha256(leaf).hexdigest()
+            if not force and not self.due(key, fingerprint):
+                continue
+            try:
+                data, response = self.fetch(leaf, issuer)
+            except OcspError as e:
+                OCSP_FETCHES.inc(result="invalid")
+                lg.warning(f"域名 {domain} 获取 OCSP 响应失败: {e}")
+                continue
+            except Exception as e:
+                OCSP_FETCHES.inc(result="error")
+                lg.warning(f"域名 {domain} 获取 OCSP 响应异常: {e}")
+                continue
+            OCSP_FETCHES.inc(result="ok")
+            files[name] = data
+            states[key] = {"fingerprint": fingerprint, "fetched_at": time.time(),
+                           "this_update": _this_update(response).timestamp(),
+                           "next_update": _next_update(response).timestamp()}
+        if not files:
+            return False
+        status, changed, targets = deploy_to_targets(files, get_targets(domain_conf))
+        if status:
+            # 全部目标推送成功后才记录刷新时间，推送失败时下次检查重新获取并推送
+            with self.store.lock:
+                self.store.data.update(states)
+                self.store.save()
+            lg.info(f"域名 {domain} OCSP 装订文件已更新: {', '.join(files)}")
+        else:
+            failed = ", ".join(str(i) for i in targets if not i.ok)
+            lg.warning(f"域名 {domain} OCSP 装订文件推送失败，下次检查时重试: {failed}")
+        return changed
+
+    def refresh_all(self, domain_lists: dict) -> bool:
+        """
+        并发刷新所有域名的装订文件
+        :return: 是否有文件发生变化（需要重启 Nginx）
+        """
+        if not self.enabled:
+            return False
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ocsp") as pool:
+            futures = [pool.submit(self.refresh_domain, conf) for conf in domain_lists.values()]
+        changed = False
+        for future in futures:
+            try:
+                changed = future.result() or changed
+            except Exception:
+                lg.error(f"刷新 OCSP 装订文件异常: {traceback.format_exc()}")
+        return changed
+
+
+ocsp_stapler = OcspStapler()
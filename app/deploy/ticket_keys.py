@@ -0,0 +1,139 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 00:50
+# Email: leiyong711@163.com
+
+import os
+import json
+import time
+import base64
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from utils.metrics import TICKET_KEY_ROTATIONS
+from app.deploy.fanout import get_targets, deploy_to_targets
+
+config = Config()
+
+KEY_SIZES = (48, 80)  # nginx 支持的密钥文件长度，80 字节为 AES256
+
+
+def _new_key(size: int) -> str:
+    return base64.b64encode(os.urandom(size)).decode()
+
+
+class TicketKeyManager:
+    """
+    TLS 会话票据密钥（nginx ssl_session_ticket_key）轮换
+    所有节点共用同一组密钥，任一节点签发的票据在其他节点上都能恢复会话。密钥文件名固定，nginx 配置不需要随轮换修改：
+      ticket.current.key      当前密钥，用于加密新票据
+      ticket.next.key         下一个密钥，提前一个周期分发到所有节点，只用于解密，轮换时各节点推送先后不一致也不会恢复失败
+      ticket.previous.<n>.key 之前的密钥，只用于解密，保留 keep_previous 个
+    密钥保存在 state/ticket_keys.json，程序重启后保持同一组密钥
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.session_tickets.enabled', False))
+        self.rotate_hours = float(config.get_jsonpath('$.session_tickets.rotate_hours', 12))
+        self.keep_previous = max(int(config.get_jsonpath('$.session_tickets.keep_previous', 2)), 1)
+        self.key_size = int(config.get_jsonpath('$.session_tickets.key_size', 80))
+        if self.key_size not in KEY_SIZES:
+            lg.warning(f"session_tickets.key_size 只支持 {KEY_SIZES}，已改为 80")
+            self.key_size = 80
+        # {next, keys: [当前, 之前1, 之前2, ...], rotated_at, deployed_at}
+        self.store = JsonStore("ticket_keys", {})
+
+    def targets(self) -> list:
+        """部署目标：session_tickets.targets，未配置时为所有域名的部署目标（去重）"""
+        targets = config.get_jsonpath('$.session_tickets.targets', []) or []
+        if not targets:
+            for conf in (config.get_jsonpath("$.domain_list", {}) or {}).values():
+                targets.extend(get_targets(conf))
+        unique = {}
+        for target in ([targets] if isinstance(targets, (str, dict)) else targets):
+            unique.setdefault(json.dumps(target, sort_keys=True, ensure_ascii=False), target)
+        return list(unique.values())
+
+    def files(self) -> dict:
+        """{文件名: 密钥内容}"""
+        with self.store.lock:
+            keys, next_key = list(self.store.data["keys"]), self.store.data["next"]
+        files = {"ticket.current.key": base64.b64decode(keys[0]), "ticket.next.key": base64.b64decode(next_key)}
+        for i, key in enumerate(keys[1:], 1):
+            files[f"ticket.previous.{i}.key"] = base64.b64decode(key)
+        return files
+
+    def due(self, now: float = None) -> bool:
+        """没有密钥、密钥长度或保留数量与配置不一致、或超过轮换周期时需要轮换"""
+        now = now or time.time()
+        with self.store.lock:
+            data = self.store.data
+            if not data.get("keys") or len(data["keys"]) != self.keep_previous + 1:
+                return True
+            if len(base64.b64decode(data["keys"][0])) != self.key_size:
+                return True
+            return now - data.get("rotated_at", 0) >= self.rotate_hours * 3600
+
+    def rotate(self) -> None:
+        """下一个密钥成为当前密钥，当前密钥移入之前的密钥，并生成新的下一个密钥"""
+        with self.store.lock:
+            data = self.store.data
+            keys = data.get("keys") or []
+            if keys and len(base64.b64decode(keys[0])) != self.key_size:
+                keys = []  # 密钥长度变化，旧密钥整体作废
+            if not keys:
+                # 首次生成时补齐所有文件，nginx 引用的文件必须全部存在
+                keys = [_new_key(self.key_size) for _ in range(self.keep_previous + 1)]
+                data["next"] = _new_key(self.key_size)
+            else:
+                keys.insert(0, data.get("next") or _new_key(self.key_size))
+                data["next"] = _new_key(self.key_size)
+            while len(keys) < self.keep_previous + 1:
+                keys.append(_new_key(self.key_size))
+            data["keys"], data["rotated_at"] = keys[:self.keep_previous + 1], time.time()
+            self.store.save()
+
+    def deploy(self) -> (bool, bool):
+        """
+        推送密钥文件到全部部署目标
+        :return: (是否全部成功, 是否有目标发生变化)
+        """
+        targets = self.targets()
+        if not targets:
+            lg.error("会话票据密钥没有可用的部署目标")
+            return False, False
+        status, changed, _ = deploy_to_targets(self.files(), targets)
+        if status:
+            with self.store.lock:
+                self.store.data["deployed_at"] = time.time()
+                self.store.save()
+        return status, changed
+
+    def check(self, force: bool = False) -> bool:
+        """
+        按周期轮换并推送密钥，上次推送失败时重新推送
+        :param force: 立即轮换
+        :return: 是否需要重启 Nginx
+        """
+        if not self.enabled:
+            return False
+        rotated = force or self.due()
+        if rotated:
+            self.rotate()
+        else:
+            with self.store.lock:
+                deployed = self.store.data.get("deployed_at", 0) >= self.store.data.get("rotated_at", 0)
+            if deployed:
+                return False
+        status, changed = self.deploy()
+        TICKET_KEY_ROTATIONS.inc(result="ok" if status else "failed")
+        if status and rotated:
+            lg.info(f"会话票据密钥已轮换，保留 {self.keep_previous} 个之前的密钥")
+        elif not status:
+            lg.error("会话票据密钥推送失败，下次检查时重试")
+        return changed
+
+
+ticket_keys = TicketKeyManager()
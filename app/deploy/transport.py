@@ -0,0 +1,335 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 14:05
+# Email: leiyong711@163.com
+
+import os
+import shlex
+import shutil
+import tempfile
+import threading
+import subprocess
+from utils.log import lg
+from utils.config import Config
+from utils.constants import TEMP_PATH
+from utils.cert_tools import make_staging_dir, write_files, atomic_install, sha256_bytes, sha256_file, classify_pem
+
+config = Config()
+
+
+class TransportError(Exception):
+    """部署目标传输失败"""
+
+
+def _read_file(path: str) -> bytes:
+    """文件内容，不存在时返回 None"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+class Transport:
+    """
+    部署目标传输基类
+    部署分两个阶段：stage 把文件放到目标旁的暂存位置并判断内容是否变化，commit 原子替换，
+    abort 清理暂存，rollback 把最近一次 commit 替换的文件恢复为原内容，
+    全部成功或全部失败的模式依赖这几个操作
+    """
+
+    type = ""
+
+    def __init__(self, path: str, **kwargs):
+        self.path = path
+        self.options = kwargs
+
+    @property
+    def name(self) -> str:
+        return self.path
+
+    def stage(self, files: dict) -> bool:
+        """
+        暂存文件
+        :param files: {相对路径: 内容}
+        :return: 内容是否与目标不同（不同才需要 commit）
+        """
+        raise NotImplementedError
+
+    def commit(self) -> bool:
+        """
+        原子替换暂存的文件
+        :return: 是否有文件发生变化
+        """
+        raise NotImplementedError
+
+    def abort(self) -> None:
+        raise NotImplementedError
+
+    def rollback(self) -> None:
+        """撤销最近一次 commit：替换前存在的文件恢复原内容，新增的文件删除，失败时抛出异常"""
+        raise NotImplementedError
+
+
+class LocalTransport(Transport):
+    """本机目录"""
+
+    type = "local"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(path, **kwargs)
+        self.staging_dir = ""
+        self.previous = {}  # {相对路径: 替换前的内容，不存在为 None}
+
+    def stage(self, files: dict) -> bool:
+        self.abort()
+        self.previous = {}
+        for name, data in files.items():
+            path = os.path.join(self.path, name)
+            if sha256_bytes(data) != sha256_file(path):
+                self.previous[name] = _read_file(path)
+        if not self.previous:
+            return False
+        self.staging_dir = make_staging_dir(self.path)
+        write_files(files, self.staging_dir)
+        return True
+
+    def commit(self) -> bool:
+        if not self.staging_dir:
+            return False
+        try:
+            return atomic_install(self.staging_dir, self.path)
+        finally:
+            self.staging_dir = ""
+
+    def abort(self) -> None:
+        if self.staging_dir:
+            shutil.rmtree(self.staging_dir, ignore_errors=True)
+            self.staging_dir = ""
+
+    def rollback(self) -> None:
+        previous, self.previous = self.previous, {}
+        restore = {name: data for name, data in previous.items() if data is not None}
+        if restore:
+            staging_dir = make_staging_dir(self.path)
+            write_files(restore, staging_dir)
+            atomic_install(staging_dir, self.path)
+        for name in previous:
+            if previous[name] is None and os.path.isfile(os.path.join(self.path, name)):
+                os.remove(os.path.join(self.path, name))
+
+
+class RsyncTransport(Transport):
+    """
+    远程节点，通过 rsync over SSH 上传到目标旁的暂存目录，再用 ssh 执行 mv 原子替换
+    配置项: host, path, user, port, identity_file, reload_command(替换后在远程执行的重载命令)
+    """
+
+    type = "rsync"
+
+    def __init__(self, path: str, host: str = "", user: str = "", port: int = 22, identity_file: str = "",
+                 reload_command: str = "", **kwargs):
+        super().__init__(path, **kwargs)
+        if not host:
+            raise TransportError(f"远程部署目标 {path} 未配置 host")
+        self.host = host
+        self.user = user
+        self.port = int(port)
+        self.identity_file = identity_file
+        self.reload_command = reload_command
+        self.timeout = int(config.get_jsonpath("$.deploy.command_timeout", 60))
+        self.rsync_path = config.get_jsonpath("$.deploy.rsync_path", "rsync")
+        self.ssh_path = config.get_jsonpath("$.deploy.ssh_path", "ssh")
+        path = path.rstrip("/")
+        self.remote_staging = f"{os.path.dirname(path)}/.{os.path.basename(path)}.staging"
+        self.remote_backup = f"{os.path.dirname(path)}/.{os.path.basename(path)}.backup"
+        self.local_dir = ""
+        self.changed = []
+        self.committed = []  # 最近一次 commit 替换的文件，原文件备份在 remote_backup
+
+    @property
+    def name(self) -> str:
+        return f"{self.destination}:{self.path}"
+
+    @property
+    def destination(self) -> str:
+        return f"{self.user}@{self.host}" if self.user else self.host
+
+    def _ssh_command(self) -> list:
+        cmd = [self.ssh_path, "-p", str(self.port), "-o", "BatchMode=yes"]
+        if self.identity_file:
+            cmd += ["-i", self.identity_file]
+        return cmd
+
+    def _run(self, cmd: list) -> str:
+        try:
+            r = subprocess.run(cmd, capture_output=True, text=True, timeout=self.timeout)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise TransportError(f"{self.name} 执行命令失败: {e}")
+        if r.returncode != 0:
+            raise TransportError(f"{self.name} 执行命令失败({r.returncode}): {r.stderr.strip()}")
+        return r.stdout
+
+    def _ssh(self, script: str) -> str:
+        return self._run(self._ssh_command() + [self.destination, script])
+
+    def _rsync(self, src: str, dst: str, dry_run: bool = False) -> str:
+        cmd = [self.rsync_path, "-r", "--checksum", "--itemize-changes", "-e", " ".join(self._ssh_command())]
+        if dry_run:
+            cmd.append("--dry-run")
+        return self._run(cmd + [src, f"{self.destination}:{dst}"])
+
+    def stage(self, files: dict) -> bool:
+        self.abort()
+        os.makedirs(TEMP_PATH, exist_ok=True)
+        self.local_dir = tempfile.mkdtemp(prefix="rsync-", dir=TEMP_PATH)
+        write_files(files, self.local_dir)
+
+        # 先以 --dry-run 比较校验和，内容一致的目标不上传
+        self._ssh(f"mkdir -p {shlex.quote(self.path)}")
+        diff = self._rsync(self.local_dir + "/", self.path + "/", dry_run=True)
+        self.changed = [line.split(" ", 1)[1] for line in diff.splitlines()
+                        if line.startswith("<f") and " " in line]
+        if not self.changed:
+            return False
+
+        self._ssh(f"rm -rf {shlex.quote(self.remote_staging)} && mkdir -p {shlex.quote(self.remote_staging)}")
+        self._rsync(self.local_dir + "/", self.remote_staging + "/")
+        return True
+
+    def commit(self) -> bool:
+        if not self.changed:
+            self.abort()
+            return False
+        backup = shlex.quote(self.remote_backup)
+        moves = [f"rm -rf {backup}", f"mkdir -p {backup}"]
+        # 私钥最后替换，与 atomic_install 一致；替换前先备份原文件，供 rollback 恢复
+        names = sorted(self.changed, key=lambda name: classify_pem(self._local_bytes(name)) == "key")
+        for name in names:
+            src = shlex.quote(f"{self.remote_staging}/{name}")
+            dst = shlex.quote(f"{self.path}/{name}")
+            bak = shlex.quote(f"{self.remote_backup}/{name}")
+            moves.append(f"{{ [ ! -f {dst} ] || {{ mkdir -p $(dirname {bak}) && cp -p {dst} {bak}; }}; }}")
+            moves.append(f"mkdir -p $(dirname {dst}) && mv -f {src} {dst}")
+        self._ssh(" && ".join(moves + ["sync", f"rm -rf {shlex.quote(self.remote_staging)}"]))
+        self.abort()
+        self.committed = names
+        if self.reload_command:
+            lg.info(f"部署目标 {self.name} 证书已替换，执行重载命令: {self.reload_command}")
+            self._ssh(self.reload_command)
+        return True
+
+    def _local_bytes(self, name: str) -> bytes:
+        try:
+            with open(os.path.join(self.local_dir, name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def abort(self) -> None:
+        if self.local_dir:
+            shutil.rmtree(self.local_dir, ignore_errors=True)
+            self.local_dir = ""
+        self.changed = []
+
+    def rollback(self) -> None:
+        if not self.committed:
+            return
+        restores = []
+        for name in reversed(self.committed):
+            dst = shlex.quote(f"{self.path}/{name}")
+            bak = shlex.quote(f"{self.remote_backup}/{name}")
+            restores.append(f"if [ -f {bak} ]; then mv -f {bak} {dst}; else rm -f {dst}; fi")
+        self._ssh(" && ".join(restores + ["sync", f"rm -rf {shlex.quote(self.remote_backup)}"]))
+        self.committed = []
+        if self.reload_command:
+            lg.info(f"部署目标 {self.name} 证书已回滚，执行重载命令: {self.reload_command}")
+            self._ssh(self.reload_command)
+
+
+class FakeTransport(Transport):
+    """
+    内存中的部署目标，用于测试和压测
+    fail_stage / fail_commit / fail_rollback 为前 N 次调用抛出异常
+    """
+
+    type = "fake"
+    stores = {}
+    lock = threading.Lock()
+
+    def __init__(self, path: str, fail_stage: int = 0, fail_commit: int = 0, fail_rollback: int = 0, **kwargs):
+        super().__init__(path, **kwargs)
+        self.fail_stage = int(fail_stage)
+        self.fail_commit = int(fail_commit)
+        self.fail_rollback = int(fail_rollback)
+        self.staged = None
+        self.previous = None
+
+    @property
+    def files(self) -> dict:
+        with self.lock:
+            return self.stores.setdefault(self.path, {})
+
+    def stage(self, files: dict) -> bool:
+        if self.fail_stage > 0:
+            self.fail_stage -= 1
+            raise TransportError(f"{self.name} 模拟暂存失败")
+        current = self.files
+        changed = any(sha256_bytes(data) != sha256_bytes(current.get(name, b"")) for name, data in files.items())
+        self.staged = dict(files) if changed else None
+        self.previous = {name: current.get(name) for name in files} if changed else None
+        return changed
+
+    def commit(self) -> bool:
+        if self.fail_commit > 0:
+            self.fail_commit -= 1
+            raise TransportError(f"{self.name} 模拟替换失败")
+        if self.staged is None:
+            return False
+        with self.lock:
+            self.stores[self.path] = {**self.stores.get(self.path, {}), **self.staged}
+        self.staged = None
+        return True
+
+    def abort(self) -> None:
+        self.staged = None
+
+    def rollback(self) -> None:
+        if self.fail_rollback > 0:
+            self.fail_rollback -= 1
+            raise TransportError(f"{self.name} 模拟回滚失败")
+        if self.previous is None:
+            return
+        with self.lock:
+            files = self.stores.setdefault(self.path, {})
+            for name, data in self.previous.items():
+                if data is None:
+                    files.pop(name, None)
+                else:
+                    files[name] = data
+        self.previous = None
+
+
+TRANSPORTS = {
+    LocalTransport.type: LocalTransport,
+    RsyncTransport.type: RsyncTransport,
+    "ssh": RsyncTransport,
+    FakeTransport.type: FakeTransport,
+}
+
+
+def build_transport(target) -> Transport:
+    """
+    根据配置创建部署目标
+    :param target: 字符串（本机目录）或字典 {type: local/rsync/ssh/fake, path: ..., ...}
+    """
+    if isinstance(target, str):
+        return LocalTransport(target)
+    options = dict(target)
+    types = options.pop("type", "local")
+    transport = TRANSPORTS.get(types)
+    if not transport:
+        raise TransportError(f"不支持的部署目标类型: {types}")
+    return transport(**options)
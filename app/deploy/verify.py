@@ -0,0 +1,123 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 15:30
+# Email: leiyong711@163.com
+
+import ssl
+import time
+import socket
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from utils.log import lg
+from utils.config import Config
+
+config = Config()
+
+
+class ProbeResult:
+    """单个 SNI 的握手结果"""
+
+    def __init__(self, domain: str, sni: str, address: str, port: int, expected: str):
+        self.domain = domain
+        self.sni = sni
+        self.address = address
+        self.port = port
+        self.expected = expected
+        self.fingerprint = ""
+        self.connect_ms = 0.0
+        self.handshake_ms = 0.0
+        self.error = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and self.fingerprint == self.expected
+
+    def __repr__(self):
+        if self.error:
+            state = f"失败({self.error})"
+        elif self.ok:
+            state = "证书一致"
+        else:
+            state = f"证书不一致(实际 {self.fingerprint[:16]}，期望 {self.expected[:16]})"
+        return f"{self.sni} -> {self.address}:{self.port} {state}, 连接 {self.connect_ms:.1f}ms, 握手 {self.handshake_ms:.1f}ms"
+
+
+def probe(result: ProbeResult, timeout: float) -> ProbeResult:
+    """建立 TLS 连接，记录服务端证书指纹和握手耗时（只比对指纹，不校验证书链）"""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    try:
+        start = time.perf_counter()
+        with socket.create_connection((result.address, result.port), timeout=timeout) as sock:
+            connected = time.perf_counter()
+            with ctx.wrap_socket(sock, server_hostname=result.sni) as ssock:
+                handshaked = time.perf_counter()
+                der = ssock.getpeercert(binary_form=True)
+        result.connect_ms = (connected - start) * 1000
+        result.handshake_ms = (handshaked - connected) * 1000
+        result.fingerprint = hashlib.sha256(der).hexdigest() if der else ""
+        if not der:
+            result.error = "服务端未返回证书"
+    except (OSError, ssl.SSLError) as e:
+        result.error = str(e) or e.__class__.__name__
+    return result
+
+
+def build_probes(domain_conf: dict, expected: str) -> list:
+    """
+    域名需要探测的 SNI 列表
+    verify_hosts 未配置时探测域名本身，verify_address 未配置时使用全局 tls_verify.address，都未配置时直接连接 SNI
+    """
+    domain = domain_conf.get("domain", "")
+    hosts = domain_conf.get("verify_hosts") or [domain]
+    address = domain_conf.get("verify_address") or config.get_jsonpath("$.tls_verify.address", "")
+    port = int(domain_conf.get("verify_port") or config.get_jsonpath("$.tls_verify.port", 443))
+    return [ProbeResult(domain, sni, address or sni, port, expected) for sni in hosts]
+
+
+def verify_fingerprints(expectations: dict) -> dict:
+    """
+    并发探测所有域名
+    :param expectations: {域名: (域名配置, 期望的叶子证书指纹)}
+    :return: {域名: [ProbeResult]}
+    """
+    timeout = float(config.get_jsonpath("$.tls_verify.timeout", 5))
+    max_workers = int(config.get_jsonpath("$.tls_verify.max_workers", 64))
+    probes = []
+    for domain, (domain_conf, expected) in expectations.items():
+        probes.extend(build_probes(domain_conf, expected))
+
+    results = {}
+    if not probes:
+        return results
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(probes)), thread_name_prefix="tls-probe") as pool:
+        for result in pool.map(lambda p: probe(p, timeout), probes):
+            results.setdefault(result.domain, []).append(result)
+    return results
+
+
+def verify_until_stable(expectations: dict) -> dict:
+    """
+    Nginx 重启后需要一点时间才能接受连接，失败的域名按 tls_verify.retries 重试
+    :return: {域名: [ProbeResult]}，只包含最后一次的结果
+    """
+    retries = int(config.get_jsonpath("$.tls_verify.retries", 3))
+    interval = float(config.get_jsonpath("$.tls_verify.retry_interval", 3))
+    results = verify_fingerprints(expectations)
+    for _ in range(retries):
+        pending = {d: e for d, e in expectations.items() if not all(r.ok for r in results.get(d, []))}
+        if not pending:
+            break
+        time.sleep(interval)
+        results.update(verify_fingerprints(pending))
+
+    for domain, items in results.items():
+        for r in items:
+            if r.ok:
+                lg.info(f"TLS 握手校验 {r}")
+            else:
+                lg.error(f"TLS 握手校验 {r}")
+    return results
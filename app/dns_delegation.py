@@ -0,0 +1,164 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 21:50
+# Email: leiyong711@163.com
+
+import threading
+from collections import OrderedDict
+from utils.log import lg
+from utils.config import Config
+from utils.tracing import span
+from app.dns_provider import ACME_CHALLENGE, get_provider
+from app.rfc2136 import Message, DnsError, TYPE_CNAME, CLASS_IN, exchange, decode_name
+
+config = Config()
+
+
+def normalize(name: str) -> str:
+    return (name or "").strip().rstrip(".").lower()
+
+
+class ChallengeDelegation:
+    """
+    CNAME 委派验证
+    每个域名的 _acme-challenge.<域名> 预先 CNAME 到我们自己控制的验证区域，
+    验证记录只写入该区域，待验证的多个域名合并为一次批量更新，不再需要各域名 DNS 服务商的密钥
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.dns_delegation.enabled', False))
+        self.zone = normalize(config.get_jsonpath('$.dns_delegation.zone', ''))
+        self.provider_name = config.get_jsonpath('$.dns_delegation.dns_service_providers', 'RFC2136')
+        self.all_domains = bool(config.get_jsonpath('$.dns_delegation.all_domains', True))
+        self.resolver = config.get_jsonpath('$.dns_delegation.resolver', '223.5.5.5')
+        self.resolver_port = int(config.get_jsonpath('$.dns_delegation.resolver_port', 53))
+        self.timeout = float(config.get_jsonpath('$.dns_delegation.timeout', 5))
+        self.published = {}     # {主机记录: {记录中当前的值}}
+        self.misdelegated = {}  # {域名: 实际 CNAME}
+        self.lock = threading.Lock()
+        if self.enabled and not self.zone:
+            lg.error("已开启 CNAME 委派验证，但未配置验证区域 dns_delegation.zone，委派验证不生效")
+            self.enabled = False
+
+    def is_delegated(self, domain_conf: dict) -> bool:
+        """域名是否使用委派验证，域名配置 challenge_delegation 优先于 all_domains"""
+        if not self.enabled:
+            return False
+        return bool(domain_conf.get("challenge_delegation", self.all_domains))
+
+    def target(self, domain_conf: dict) -> str:
+        """_acme-challenge.<域名> 应指向的 CNAME，默认 <域名>.<验证区域>，可用 challenge_cname 单独指定"""
+        return normalize(domain_conf.get("challenge_cname") or f"{domain_conf['domain']}.{self.zone}")
+
+    def record_name(self, domain_conf: dict) -> str:
+        """CNAME 目标在验证区域中的主机记录"""
+        target = self.target(domain_conf)
+        if not target.endswith(f".{self.zone}"):
+            raise ValueError(f"域名 {domain_conf['domain']} 的委派目标 {target} 不在验证区域 {self.zone} 中")
+        return target[:-len(self.zone) - 1]
+
+    def resolve_cname(self, fqdn: str) -> str:
+        """
+        通过递归解析服务器查询 CNAME
+        :return: CNAME 目标，没有 CNAME 时返回空字符串
+        """
+        message = Message(flags=0x0100)
+        message.question.append((fqdn, TYPE_CNAME, CLASS_IN))
+        response = Message.from_wire(exchange(message.to_wire(), self.resolver, self.resolver_port, self.timeout))
+        if response.id != message.id:
+            raise DnsError("响应与请求不匹配")
+        for name, rtype, _, _, rdata in response.answer:
+            if rtype == TYPE_CNAME and normalize(name) == normalize(fqdn):
+                return normalize(decode_name(rdata, 0)[0])
+        return ""
+
+    def check(self, domain_lists: dict) -> dict:
+        """
+        检查各委派域名的 CNAME 是否正确指向验证区域
+        :param domain_lists: domain_list 配置
+        :return: {域名: (是否正确, 实际 CNAME 或错误原因)}
+        """
+        results = {}
+        for v in domain_lists.values():
+            if not v.get('domain') or not self.is_delegated(v):
+                continue
+            fqdn = f"{ACME_CHALLENGE}.{v['domain']}"
+            expected = self.target(v)
+            try:
+                actual = self.resolve_cname(fqdn) or "未配置 CNAME"
+            except (OSError, DnsError) as e:
+                actual = f"查询失败: {e}"
+            results[v['domain']] = (actual == expected, actual)
+            if actual == expected:
+                lg.info(f"域名 {v['domain']} CNAME 委派检查通过")
+            else:
+                lg.error(f"域名 {v['domain']} CNAME 委派错误，{fqdn} 应指向 {expected}，实际为 {actual}")
+
+        with self.lock:
+            self.misdelegated = {domain: actual for domain, (ok, actual) in results.items() if not ok}
+        return results
+
+    def publish(self, items: list) -> dict:
+        """
+        将待验证的记录一次性写入验证区域
+        同一主机记录的多个值（如泛域名和主域名同时验证）在服务商支持时写入同一个记录集，
+        不支持时只写入最后一个值，其余的值在逐个验证时由 set_txt_record 重新写入
+        :param items: [(域名配置, TXT 记录值)]
+        :return: {域名: 是否成功}
+        """
+        provider = get_provider(self.provider_name)
+        if not provider:
+            return {v['domain']: False for v, _ in items}
+
+        names, values = {}, OrderedDict()  # {域名: 主机记录}, {主机记录: [记录值]}
+        for v, value in items:
+            try:
+                name = self.record_name(v)
+            except ValueError as e:
+                lg.error(str(e))
+                names[v['domain']] = None
+                continue
+            names[v['domain']] = name
+            if value not in values.setdefault(name, []):
+                values[name].append(value)
+            if v['domain'] in self.misdelegated:
+                lg.warning(f"域名 {v['domain']} CNAME 委派检查未通过，验证记录写入后仍可能验证失败")
+        for name, group in values.items():
+            if len(group) > 1 and not provider.multi_value_txt:
+                lg.info(f"{provider.name} 同一主机记录只能保存一个值，{name}.{self.zone} 本次写入最后一个值，"
+                        f"其余 {len(group) - 1} 个在逐个验证时写入")
+                values[name] = group[-1:]
+
+        batch = [(self.zone, name, value) for name, group in values.items() for value in group]
+        with span("dns_delegation.publish", records=len(batch)):
+            written = provider.upsert_txt_batch(batch) if batch else {}
+        results = {}
+        with self.lock:
+            for name, group in values.items():
+                if written.get((self.zone, name), False):
+                    self.published[name] = set(group)
+                else:
+                    self.published.pop(name, None)
+            for domain, name in names.items():
+                results[domain] = bool(name) and written.get((self.zone, name), False)
+        lg.info(f"验证区域 {self.zone} 批量写入 {len(batch)} 条验证记录，成功 {sum(results.values())}/{len(results)} 个域名")
+        return results
+
+    def is_published(self, domain_conf: dict, value: str) -> bool:
+        """记录值当前是否在验证区域的记录中（没有被之后写入的值覆盖）"""
+        try:
+            name = self.record_name(domain_conf)
+        except ValueError:
+            return False
+        with self.lock:
+            return value in self.published.get(name, ())
+
+    def set_txt_record(self, domain_conf: dict, value: str) -> bool:
+        """单个域名写入验证区域，记录中已有该值时直接返回成功"""
+        if self.is_published(domain_conf, value):
+            return True
+        return self.publish([(domain_conf, value)]).get(domain_conf['domain'], False)
+
+delegation = ChallengeDelegation()
@@ -0,0 +1,152 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 20:40
+# Email: leiyong711@163.com
+
+import importlib
+import threading
+from utils.log import lg
+
+ACME_CHALLENGE = "_acme-challenge"
+
+# dns_service_providers 配置值 -> "模块:类"，首次使用时才导入
+PROVIDERS = {
+    "Qcloud": "app.qcloud_v3:Qcloud",
+    "Aliyun": "app.aliyun:Aliyun",
+    "RFC2136": "app.rfc2136:Rfc2136",
+}
+
+
+def last_values(items: list) -> list:
+    """
+    同一主机记录只保留最后一个值，用于一个主机记录只能保存一个值的服务商
+    :param items: [(域名, 主机记录, 记录值)]
+    """
+    return [(domain, name, value) for (domain, name), value in {(d, n): v for d, n, v in items}.items()]
+
+
+class DnsProvider:
+    """
+    DNS 服务商接口
+    记录统一为 {"id", "name", "type", "value", "ttl", "line"}，name 为主机记录（如 _acme-challenge）
+    查询到的记录按 (域名, 主机记录, 类型) 缓存，修改时直接使用缓存的记录 ID，记录失效时重新查询一次
+    """
+
+    name = ""
+    multi_value_txt = False  # upsert_txt_batch 能否在同一主机记录中同时保存多个值（如泛域名和主域名同时验证），为 True 时需重写 upsert_txt_batch
+
+    def __init__(self):
+        self.records = {}
+        self.records_lock = threading.Lock()
+
+    def cached_record(self, domain: str, name: str, record_type: str = "TXT") -> dict:
+        with self.records_lock:
+            return self.records.get((domain, name, record_type))
+
+    def cache_record(self, domain: str, record: dict) -> None:
+        with self.records_lock:
+            self.records[(domain, record["name"], record["type"])] = record
+
+    def forget_record(self, domain: str, name: str, record_type: str = "TXT") -> None:
+        with self.records_lock:
+            self.records.pop((domain, name, record_type), None)
+
+    def find_record(self, domain: str, name: str, record_type: str = "TXT") -> dict:
+        """优先使用缓存，没有时查询服务商"""
+        record = self.cached_record(domain, name, record_type)
+        if record:
+            return record
+        records = self.lookup(domain, name, record_type)
+        if records:
+            self.cache_record(domain, records[0])
+            return records[0]
+        return {}
+
+    def lookup(self, domain: str, name: str, record_type: str = "TXT") -> list:
+        """
+        查询解析记录
+        :param domain:      域名
+        :param name:        主机记录
+        :param record_type: 记录类型
+        :return: [记录]
+        """
+        raise NotImplementedError
+
+    def upsert_txt(self, domain: str, name: str, value: str) -> bool:
+        """
+        设置 TXT 记录，存在时修改，不存在时新增
+        :param domain:  域名
+        :param name:    主机记录
+        :param value:   记录值
+        """
+        raise NotImplementedError
+
+    def upsert_txt_batch(self, items: list) -> dict:
+        """
+        批量设置 TXT 记录，服务商没有批量接口时逐条设置
+        同一主机记录只写入最后一个值（前面的值会被覆盖，不再发送）
+        :param items: [(域名, 主机记录, 记录值)]
+        :return: {(域名, 主机记录): 是否成功}
+        """
+        return {(domain, name): self.upsert_txt(domain, name, value) for domain, name, value in last_values(items)}
+
+    def delete_txt(self, domain: str, name: str) -> bool:
+        """
+        删除 TXT 记录，记录不存在时视为成功
+        :param domain:  域名
+        :param name:    主机记录
+        """
+        raise NotImplementedError
+
+
+_instances = {}
+_lock = threading.Lock()
+
+
+def register(name: str, path: str) -> None:
+    """
+    注册 DNS 服务商
+    :param name: dns_service_providers 配置值
+    :param path: "模块:类"
+    """
+    PROVIDERS[name] = path
+
+
+def get_provider(name: str):
+    """
+    获取 DNS 服务商实例，首次使用时导入模块并创建实例
+    :param name: dns_service_providers 配置值
+    :return: DnsProvider，不支持时返回 None
+    """
+    provider = _instances.get(name)
+    if provider:
+        return provider
+    path = PROVIDERS.get(name)
+    if not path:
+        lg.error(f"暂不支持 {name} DNS服务商，可选: {'/'.join(PROVIDERS)}")
+        return None
+    with _lock:
+        if name not in _instances:
+            module, cls = path.split(":")
+            try:
+                _instances[name] = getattr(importlib.import_module(module), cls)()
+            except Exception as e:
+                lg.error(f"DNS服务商 {name} 初始化失败: {e}")
+                return None
+        return _instances[name]
+
+
+def set_txt_record(provider_name: str, domain: str, value: str, name: str = ACME_CHALLENGE) -> bool:
+    """
+    设置域名的 TXT 验证记录
+    :param provider_name: dns_service_providers 配置值
+    :param domain:        域名
+    :param value:         记录值
+    :param name:          主机记录，默认 _acme-challenge
+    """
+    provider = get_provider(provider_name)
+    if not provider:
+        return False
+    return provider.upsert_txt(domain, name, value)
@@ -0,0 +1,181 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 22:20
+# Email: leiyong711@163.com
+
+from collections import OrderedDict
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from utils.user_limiter import user_limiter
+from app.letsencrypt.api import LetsencryptAPI
+
+config = Config()
+
+
+class AccountPool:
+    """
+    多个证书平台账号
+    每个账号有独立的 UserLimiter 计数和用户类型，域名固定绑定到一个账号（已有订单所在的账号，
+    或域名配置的 account），没有订单的新域名分配给当日剩余次数最多的账号。
+    域名同时固定一个主订单，绑定关系和主订单保存在 state/accounts.json。
+    新申请的订单（关联订单、对冲订单、独立通道订单）在绑定账号当日次数用完时改由剩余次数最多的账号申请，
+    订单所在的账号记录在 owners 中，之后对该订单的操作都使用这个账号
+    """
+
+    def __init__(self):
+        self.clients = OrderedDict()
+        accounts = config.get_jsonpath("$.letsencrypt.accounts", []) or []
+        for account in accounts:
+            name = account.get("name") or account.get("user_name", "")
+            self.clients[name] = LetsencryptAPI(token=account.get("token", ""), user_name=account.get("user_name", ""),
+                                                user_type=account.get("user_type", "normal"),
+                                                api_host=account.get("api_host"))
+        if not self.clients:
+            client = LetsencryptAPI()
+            self.clients[client.user_name] = client
+        # pins: {域名: 账号名}  orders: {域名: 主订单证书ID}  owners: {新申请的证书ID: 账号名}
+        self.store = JsonStore("accounts", {"pins": {}, "orders": {}, "owners": {}})
+        self.store.data.setdefault("orders", {})
+        self.store.data.setdefault("owners", {})
+
+    @property
+    def primary(self) -> LetsencryptAPI:
+        return next(iter(self.clients.values()))
+
+    def remaining(self, client: LetsencryptAPI) -> float:
+        """账号当日剩余请求次数"""
+        return user_limiter.get_user_stats(client.user_name)['remaining']
+
+    def least_loaded(self) -> LetsencryptAPI:
+        """当日剩余次数最多的账号，相同时按配置顺序"""
+        return max(self.clients.values(), key=self.remaining)
+
+    def name_of(self, client: LetsencryptAPI) -> str:
+        return next(name for name, i in self.clients.items() if i is client)
+
+    def pin(self, domain: str, name: str) -> None:
+        with self.store.lock:
+            if self.store.data["pins"].get(domain) == name:
+                return
+            self.store.data["pins"][domain] = name
+            self.store.save()
+
+    def pin_order(self, domain: str, cert_id: str) -> None:
+        """固定域名的主订单，独立通道或对冲订单部署后成为域名的当前订单"""
+        with self.store.lock:
+            if self.store.data["orders"].get(domain) == str(cert_id):
+                return
+            self.store.data["orders"][domain] = str(cert_id)
+            self.store.save()
+
+    def for_new_order(self, api: LetsencryptAPI) -> LetsencryptAPI:
+        """
+        申请新订单使用的账号，绑定账号当日还有剩余次数时使用绑定账号，否则使用剩余次数最多的账号
+        :param api: 域名绑定的账号
+        """
+        if self.remaining(api) > 0:
+            return api
+        client = self.least_loaded()
+        if client is not api:
+            lg.info(f"证书平台账号 {self.name_of(api)} 今日次数已用完，新订单改由账号 {self.name_of(client)} 申请")
+        return client
+
+    def track_order(self, cert_id: str, client: LetsencryptAPI) -> None:
+        """记录新申请的订单所在的账号"""
+        with self.store.lock:
+            self.store.data["owners"][str(cert_id)] = self.name_of(client)
+            self.store.save()
+
+    def client_of(self, cert_id: str, default: LetsencryptAPI) -> LetsencryptAPI:
+        """
+        订单所在的账号（证书ID只在所属账号下有效）
+        :param default: 没有记录时使用的账号（域名绑定的账号）
+        """
+        with self.store.lock:
+            name = self.store.data["owners"].get(str(cert_id))
+        return self.clients.get(name, default)
+
+    def account_name(self, domain: str, domain_conf: dict = None) -> str:
+        """
+        域名会使用的账号名，只读取绑定关系，不创建绑定（用于续期计划等统计）
+        :param domain:      域名
+        :param domain_conf: domain_list 中的域名配置
+        """
+        with self.store.lock:
+            name = self.store.data["pins"].get(domain)
+        if name in self.clients:
+            return name
+        name = (domain_conf or {}).get("account")
+        return name if name in self.clients else self.name_of(self.least_loaded())
+
+    def account_for(self, domain: str, domain_conf: dict = None) -> LetsencryptAPI:
+        """
+        域名绑定的账号，尚未绑定时使用域名配置的 account，都没有时分配给剩余次数最多的账号
+        :param domain:      域名
+        :param domain_conf: domain_list 中的域名配置
+        """
+        with self.store.lock:
+            name = self.store.data["pins"].get(domain)
+        if name in self.clients:
+            return self.clients[name]
+        name = (domain_conf or {}).get("account")
+        if name not in self.clients:
+            if name:
+                lg.warning(f"域名 {domain} 配置的账号 {name} 不存在，改为分配给剩余次数最多的账号")
+            name = self.name_of(self.least_loaded())
+        self.pin(domain, name)
+        lg.info(f"域名 {domain} 绑定到证书平台账号 {name}")
+        return self.clients[name]
+
+    def order_lists(self, exclude: set = frozenset()) -> dict:
+        """
+        汇总所有账号的证书列表，每个域名选出一个主订单，并把域名绑定到主订单所在的账号（证书ID只在所属账号下有效）
+        同一个域名有多个订单时使用已固定的主订单，没有固定或固定的订单已不存在时取创建时间最新的订单
+        （相同时按账号配置顺序），选出的订单固定为主订单，之后每次检查都使用同一个订单
+        :param exclude: 不能作为主订单的证书ID（双证书的关联订单、进行中的独立通道和对冲订单，它们是同一域名的其它订单）
+        :return: {域名: 订单}
+        """
+        fetched = [(name, client.order_list()) for name, client in self.clients.items()]
+        candidates = OrderedDict()
+        for name, order_list in fetched:
+            for order in order_list:
+                if str(order.get('id')) in exclude:
+                    continue
+                candidates.setdefault(order['domains'][0].replace("*.", ""), []).append((name, order))
+
+        orders, owners = {}, {}
+        with self.store.lock:
+            pins, primary = self.store.data["pins"], self.store.data["orders"]
+            for domain, items in candidates.items():
+                pinned = [i for i in items if str(i[1].get('id')) == primary.get(domain)]
+                # max 在创建时间相同时返回第一个，即配置顺序靠前的账号
+                owners[domain], orders[domain] = pinned[0] if pinned else max(items, key=lambda i: str(i[1].get('time_add') or ''))
+
+            repinned = {domain: str(order.get('id')) for domain, order in orders.items() if primary.get(domain) != str(order.get('id'))}
+            for domain, cert_id in repinned.items():
+                if primary.get(domain):
+                    lg.warning(f"域名 {domain} 的主订单 {primary[domain]} 已不在证书列表中，改用订单 {cert_id}")
+                primary[domain] = cert_id
+            changed = {domain: name for domain, name in owners.items() if pins.get(domain) != name}
+            for domain, name in changed.items():
+                if pins.get(domain) in self.clients:
+                    lg.warning(f"域名 {domain} 原绑定账号 {pins[domain]}，订单位于账号 {name}，改为绑定到 {name}")
+                pins[domain] = name
+            # 所有账号都取到证书列表时，清理已删除订单的账号记录
+            listed = {str(order.get('id')) for _, order_list in fetched for order in order_list}
+            stale = [i for i in self.store.data["owners"] if i not in listed] if all(i[1] for i in fetched) else []
+            for cert_id in stale:
+                del self.store.data["owners"][cert_id]
+            if changed or repinned or stale:
+                self.store.save()
+        return orders
+
+    def quota(self) -> dict:
+        """:return: {用户名: UserLimiter.get_user_stats}"""
+        return {client.user_name: user_limiter.get_user_stats(client.user_name) for client in self.clients.values()}
+
+
+accounts = AccountPool()
@@ -9,27 +9,47 @@ config = Config(True)
 
 import os
 import math
-import zipfile
+import time
+import hashlib
+import tempfile
 import requests
 import traceback
 from utils.log import lg
 from utils.config import Config
-from utils.constants import APP_PATH
+from utils.constants import TEMP_PATH
 from utils.user_limiter import user_limiter
+from utils.metrics import API_REQUESTS, API_LATENCY, LIMITER_WAIT
+from utils.tracing import traced, span
+from app.letsencrypt.bundle import CertBundle, BundleError
+from app.deploy.fanout import deploy_bundle
+
+DOWNLOAD_CHUNK_SIZE = 16 * 1024        # 下载分块大小
+DOWNLOAD_SPOOL_SIZE = 1024 * 1024      # 超过该大小的下载内容落到临时文件
+DOWNLOAD_MAX_SIZE = 20 * 1024 * 1024   # 证书包大小上限
 
 # config = Config()
 
 
 class LetsencryptAPI:
 
-    def __init__(self):
-        self.token = config.get_jsonpath("$.letsencrypt.token", "")
-        self.api_host = config.get_jsonpath("$.letsencrypt.api_host", "")
-        self.user_name = config.get_jsonpath("$.letsencrypt.user_name", "")
+    def __init__(self, token: str = None, user_name: str = None, user_type: str = None, api_host: str = None):
+        """
+        参数为空时使用 letsencrypt 配置中的账号
+        :param user_type: 用户类型 normal/vip/svip，决定该账号在 UserLimiter 中的每日次数
+        """
+        self.token = token if token is not None else config.get_jsonpath("$.letsencrypt.token", "")
+        self.api_host = api_host or config.get_jsonpath("$.letsencrypt.api_host", "")
+        self.user_name = user_name if user_name is not None else config.get_jsonpath("$.letsencrypt.user_name", "")
+        if user_type:
+            user_limiter.set_user_type(self.user_name, user_type)
 
+    @traced("letsencrypt.request", lambda args, kwargs: {"endpoint": kwargs.get("url", args[1] if len(args) > 1 else "")})
     def request(self, url, method='GET', resp='JSON', **kwargs):
         # 检查用户限制（包括自动等待并发限制）
-        limit_ok, limit_msg = user_limiter.check_all_limits(self.user_name)
+        wait_start = time.perf_counter()
+        with span("limiter.wait"):
+            limit_ok, limit_msg = user_limiter.check_all_limits(self.user_name)
+        LIMITER_WAIT.observe(time.perf_counter() - wait_start, user=self.user_name)
         if not limit_ok:
             lg.error(f"用户限制检查失败: {limit_msg}")
             return {'isError': True, 'error': limit_msg, 'isOk': False}
@@ -41,8 +61,12 @@ class LetsencryptAPI:
         self.headers = {
             "Authorization": f"Bearer {self.token}:{self.user_name}"
         }
+        start = time.perf_counter()
         try:
-            response = requests.request(method, self.api_host + url, headers=self.headers, timeout=5, **kwargs)
+            with span("network", endpoint=url):
+                response = requests.request(method, self.api_host + url, headers=self.headers, timeout=5, **kwargs)
+            API_REQUESTS.inc(api="letsencrypt", endpoint=url, status=response.status_code)
+            API_LATENCY.observe(time.perf_counter() - start, api="letsencrypt", endpoint=url)
             
             # 记录响应状态和内容用于调试
             # lg.debug(f"API请求: {method} {self.api_host + url}")
@@ -61,6 +85,8 @@ class LetsencryptAPI:
                 return {}
                 
         except requests.exceptions.RequestException as e:
+            API_REQUESTS.inc(api="letsencrypt", endpoint=url, status="error")
+            API_LATENCY.observe(time.perf_counter() - start, api="letsencrypt", endpoint=url)
             lg.error(f"网络请求异常: {e}")
             return {}
         except Exception as e:
@@ -215,29 +241,69 @@ class LetsencryptAPI:
             return True
         return False
 
+    def certificate_delete(self, cert_id: str) -> tuple:
+        """
+        证书删除
+        :param cert_id: 证书ID
+        :return: (是否成功, 失败原因)
+        """
+        r = self.request(url='/api/user/OrderDetail/del', params={"id": cert_id})
+        if not r.get('isError', True) and r.get('isOk', False):
+            return True, ""
+        return False, r.get('error', '')
+
+    @traced("certificate_download")
     def certificate_download(self, cert_id: str, types: str = ""):
-        """证书下载"""
+        """
+        证书下载
+        分块流式读取响应，边读边计算 sha256，小文件留在内存中，超过阈值自动落到临时文件，
+        下载完成后校验压缩包及其中的 PEM 成员
+        :return: CertBundle，失败返回 None
+        """
         params = {
             "id": cert_id,
         }
         if types:
             params.update({"type": types})
-        r = self.request(url='/api/user/OrderDetail/down', params=params, resp="File")
-        # lg.debug(r.headers)
-        # if r.headers.get('Content-Type', '') != "application/zip; charset=utf-8":
-        #     return ""
-        if r.status_code != 200:
-            lg.error(f"证书下载失败，原因: {r.text}")
-            return ""
+        r = self.request(url='/api/user/OrderDetail/down', params=params, resp="File", stream=True)
+        if isinstance(r, dict):
+            lg.error(f"证书下载失败，原因: {r.get('error', '网络请求异常')}")
+            return None
+        try:
+            if r.status_code != 200:
+                lg.error(f"证书下载失败，原因: {r.text}")
+                return None
 
-        # 判断文件夹是否存在否，不存在则创建
-        if not os.path.exists(f"{APP_PATH}/temp"):
-            os.mkdir(f"{APP_PATH}/temp")
+            max_size = config.get_jsonpath("$.letsencrypt.download_max_size", DOWNLOAD_MAX_SIZE)
+            digest = hashlib.sha256()
+            size = 0
+            os.makedirs(TEMP_PATH, exist_ok=True)
+            with tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_SIZE, dir=TEMP_PATH) as f:
+                for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_size:
+                        lg.error(f"证书 {cert_id} 下载失败，文件超过 {max_size} 字节上限")
+                        return None
+                    digest.update(chunk)
+                    f.write(chunk)
 
-        with open(f"{APP_PATH}/temp/{cert_id}.zip", 'wb') as f:
-            f.write(r.content)
-            lg.info(f"证书下载成功！保存路径：{APP_PATH}/temp/{cert_id}.zip")
-        return f"{APP_PATH}/temp/{cert_id}.zip"
+                expected = r.headers.get('Content-Length')
+                if expected and expected.isdigit() and int(expected) != size and not r.headers.get('Content-Encoding'):
+                    lg.error(f"证书 {cert_id} 下载不完整，期望 {expected} 字节，实际 {size} 字节")
+                    return None
+
+                f.seek(0)
+                bundle = CertBundle.from_zip(cert_id, f, digest.hexdigest())
+            lg.info(f"证书下载成功！大小 {size} 字节，sha256: {bundle.sha256}")
+            return bundle
+        except BundleError as e:
+            lg.error(f"证书 {cert_id} 完整性校验失败: {e}")
+            return None
+        except requests.exceptions.RequestException as e:
+            lg.error(f"证书 {cert_id} 下载中断: {e}")
+            return None
+        finally:
+            r.close()
 
     def get_user_limit_stats(self) -> dict:
         """获取用户限制统计信息"""
@@ -256,28 +322,26 @@ class LetsencryptAPI:
         
         return stats
 
-    def deploy_ssl(self, zipfile_path, domain):
+    @traced("deploy_ssl")
+    def deploy_ssl(self, bundle, domain):
         """
         部署SSL
-        :param zipfile_path: 证书压缩包
+        校验私钥与证书匹配后并发推送到域名配置的全部部署目标，每个目标先暂存再原子替换，
+        内容与已部署文件完全一致的目标跳过
+        :param bundle: 证书包 CertBundle
         :param domain: 域名
-        :return:
+        :return: (是否成功, 证书文件是否发生变化, 各部署目标结果)
         """
         domain = domain.replace(".", "@", -1)
-        ssl_deployment_path = config.get_jsonpath(f'$.domain_list.{domain}.ssl_deployment_path')
-        if not os.path.exists(f"{ssl_deployment_path}"):
-            os.mkdir(f"{ssl_deployment_path}")
-        zip_file = zipfile.ZipFile(zipfile_path, 'r')
-        zip_file.extractall(ssl_deployment_path)
-        zip_file.close()
-        try:
-            os.remove(zipfile_path)
-        except:
-            ...
+        domain_conf = config.get_jsonpath(f'$.domain_list.{domain}', {})
+        if not bundle:
+            lg.error(f"域名 {domain} 证书包为空，无法部署")
+            return False, False, []
+        return deploy_bundle(bundle, domain_conf)
 
 
 if __name__ == '__main__':
     api = LetsencryptAPI()
     # data = api.certificate_details('1mj9ko')
     data = api.certificate_download('1mj9ko')
-    lg.debug(data)
+    lg.debug(data.files.keys() if data else data)
@@ -0,0 +1,161 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 11:05
+# Email: leiyong711@163.com
+
+import re
+import base64
+import hashlib
+import zipfile
+import binascii
+from utils.cert_tools import classify_pem
+
+PEM_BLOCK = re.compile(rb"-----BEGIN ([A-Z0-9 ]+)-----\r?\n(.*?)\r?\n-----END \1-----", re.S)
+
+
+class BundleError(Exception):
+    """证书包校验失败"""
+
+
+def pem_blocks(data: bytes) -> list:
+    """
+    解析 PEM 内容中的所有块
+    :return: [(类型, DER字节), ...]
+    """
+    blocks = []
+    for kind, body in PEM_BLOCK.findall(data):
+        try:
+            der = base64.b64decode(b"".join(body.split()), validate=True)
+        except binascii.Error:
+            raise BundleError(f"PEM 块 {kind.decode()} 不是合法的 base64 内容")
+        blocks.append((kind.decode(), der))
+    return blocks
+
+
+def pem_encode(der: bytes, kind: str = "CERTIFICATE") -> bytes:
+    """DER 编码为 PEM 块，每行 64 个字符"""
+    body = base64.b64encode(der)
+    lines = b"\n".join(body[i:i + 64] for i in range(0, len(body), 64))
+    return f"-----BEGIN {kind}-----\n".encode() + lines + f"\n-----END {kind}-----\n".encode()
+
+
+def der_sequence_ok(der: bytes) -> bool:
+    """检查 DER 是否为一个长度自洽的 ASN.1 SEQUENCE（X.509 证书的最外层结构）"""
+    if len(der) < 2 or der[0] != 0x30:
+        return False
+    length, offset = der[1], 2
+    if length & 0x80:
+        n = length & 0x7f
+        if n == 0 or n > 4 or len(der) < 2 + n:
+            return False
+        length, offset = int.from_bytes(der[2:2 + n], 'big'), 2 + n
+    return offset + length == len(der)
+
+
+class CertBundle:
+    """
+    内存中的证书包
+    下载时边读边计算 sha256，解压后只保留各成员的内容，部署直接使用，不再落盘中转
+    """
+
+    def __init__(self, cert_id: str, files: dict, sha256: str):
+        """
+        :param cert_id: 证书ID
+        :param files:   {压缩包内路径: 文件内容}
+        :param sha256:  压缩包 sha256
+        """
+        self.cert_id = cert_id
+        self.files = files
+        self.sha256 = sha256
+
+    @classmethod
+    def from_zip(cls, cert_id: str, fileobj, sha256: str = "") -> "CertBundle":
+        """
+        从压缩包读取并校验证书包
+        :param cert_id: 证书ID
+        :param fileobj: 压缩包文件对象或路径
+        :param sha256:  压缩包 sha256，为空时自动计算
+        """
+        if not sha256:
+            if isinstance(fileobj, str):
+                with open(fileobj, 'rb') as f:
+                    sha256 = hashlib.sha256(f.read()).hexdigest()
+            else:
+                fileobj.seek(0)
+                sha256 = hashlib.sha256(fileobj.read()).hexdigest()
+                fileobj.seek(0)
+        try:
+            with zipfile.ZipFile(fileobj, 'r') as zip_file:
+                bad = zip_file.testzip()
+                if bad:
+                    raise BundleError(f"证书压缩包成员 {bad} CRC 校验失败")
+                files = {i.filename: zip_file.read(i) for i in zip_file.infolist() if not i.is_dir()}
+        except zipfile.BadZipFile as e:
+            raise BundleError(f"证书压缩包格式错误: {e}")
+
+        bundle = cls(cert_id, files, sha256)
+        bundle.verify()
+        return bundle
+
+    def verify(self) -> None:
+        """校验 PEM 成员：证书能解析为 DER，私钥块完整，且至少各有一个"""
+        keys = certs = 0
+        for name, data in self.files.items():
+            kind = classify_pem(data)
+            if not kind:
+                continue
+            blocks = pem_blocks(data)
+            if not blocks:
+                raise BundleError(f"证书包成员 {name} 的 PEM 内容不完整")
+            for block_type, der in blocks:
+                if block_type == "CERTIFICATE":
+                    if not der_sequence_ok(der):
+                        raise BundleError(f"证书包成员 {name} 中的证书无法解析")
+                    certs += 1
+                elif block_type.endswith("PRIVATE KEY"):
+                    keys += 1
+        if not keys or not certs:
+            raise BundleError(f"证书包中缺少私钥或证书，私钥 {keys} 个，证书 {certs} 个")
+
+    def leaf_der(self) -> bytes:
+        """叶子证书 DER：各证书文件的首个证书中，没有在其他文件里作为上级证书出现的那一个"""
+        firsts, issuers = [], set()
+        for name, data in sorted(self.files.items()):
+            if classify_pem(data) != "cert":
+                continue
+            certs = [der for kind, der in pem_blocks(data) if kind == "CERTIFICATE"]
+            if certs:
+                firsts.append(certs[0])
+                issuers.update(certs[1:])
+        for der in firsts:
+            if der not in issuers:
+                return der
+        return firsts[0] if firsts else b""
+
+    def chain_der(self) -> list:
+        """叶子证书之后的上级证书 DER，按包内出现顺序去重，优先取叶子证书所在文件中的顺序"""
+        leaf = self.leaf_der()
+        files = [[der for kind, der in pem_blocks(data) if kind == "CERTIFICATE"]
+                 for _, data in sorted(self.files.items()) if classify_pem(data) == "cert"]
+        files.sort(key=lambda certs: leaf not in certs)
+        chain = []
+        for certs in files:
+            for der in certs:
+                if der != leaf and der not in chain:
+                    chain.append(der)
+        return chain
+
+    def private_key(self) -> bytes:
+        """第一个私钥文件的内容"""
+        return next((data for _, data in sorted(self.files.items()) if classify_pem(data) == "key"), b"")
+
+    @property
+    def fingerprint(self) -> str:
+        """叶子证书 sha256 指纹"""
+        return hashlib.sha256(self.leaf_der()).hexdigest()
+
+    @property
+    def size(self) -> int:
+        return sum(len(i) for i in self.files.values())
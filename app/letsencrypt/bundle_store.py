@@ -0,0 +1,243 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 13:20
+# Email: leiyong711@163.com
+
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+from utils.log import lg
+from utils.config import Config
+from utils.constants import CACHE_PATH
+from app.letsencrypt.bundle import CertBundle
+
+config = Config()
+
+
+class BundleStore:
+    """
+    证书包本地内容寻址存储
+    对象以 证书ID-叶子证书指纹 为键保存在 objects 目录，history 目录按域名记录最近部署过的 N 个版本，
+    同一证书部署到多个路径、重启失败后重新部署、回滚到上一版本都直接读本地，不再消耗下载配额
+    """
+
+    def __init__(self, root: str = ""):
+        self.root = root or config.get_jsonpath("$.bundle_cache.path", "") or os.path.join(CACHE_PATH, "bundles")
+        self.keep_versions = int(config.get_jsonpath("$.bundle_cache.keep_versions", 3))
+        self.max_size = int(config.get_jsonpath("$.bundle_cache.max_size_mb", 50)) * 1024 * 1024
+        self.max_age = int(config.get_jsonpath("$.bundle_cache.max_age_days", 180)) * 86400
+        self.objects_path = os.path.join(self.root, "objects")
+        self.history_path = os.path.join(self.root, "history")  # 目录在第一次写入时创建，导入模块不产生文件
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def make_key(cert_id: str, fingerprint: str) -> str:
+        return f"{cert_id}-{fingerprint}"
+
+    def _object_dir(self, key: str) -> str:
+        return os.path.join(self.objects_path, key)
+
+    def _history_file(self, domain: str) -> str:
+        return os.path.join(self.history_path, f"{domain.replace('*', '_')}.json")
+
+    @staticmethod
+    def _listdir(path: str) -> list:
+        return os.listdir(path) if os.path.isdir(path) else []
+
+    def _read_meta(self, key: str) -> dict:
+        try:
+            with open(os.path.join(self._object_dir(key), "meta.json"), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_json(self, path: str, data) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def put(self, bundle: CertBundle, domain: str = "", time_end: str = "") -> str:
+        """
+        保存证书包，已存在时只刷新使用时间
+        :param bundle:   证书包
+        :param domain:   部署的域名，记录到该域名的版本历史
+        :param time_end: 证书到期时间（证书平台返回的 time_end）
+        :return: 对象键
+        """
+        key = self.make_key(bundle.cert_id, bundle.fingerprint)
+        with self.lock:
+            obj_dir = self._object_dir(key)
+            if not os.path.isdir(obj_dir):
+                os.makedirs(self.objects_path, exist_ok=True)
+                staging = tempfile.mkdtemp(prefix=f".{key}.", dir=self.objects_path)
+                files_dir = os.path.join(staging, "files")
+                for name, data in bundle.files.items():
+                    dst = os.path.normpath(os.path.join(files_dir, name))
+                    if not dst.startswith(os.path.normpath(files_dir) + os.sep):
+                        continue
+                    os.makedirs(os.path.dirname(dst), exist_ok=True)
+                    with open(dst, 'wb') as f:
+                        f.write(data)
+                meta = {
+                    "cert_id": bundle.cert_id,
+                    "fingerprint": bundle.fingerprint,
+                    "sha256": bundle.sha256,
+                    "time_end": time_end,
+                    "size": bundle.size,
+                    "created": time.time(),
+                    "last_used": time.time(),
+                }
+                self._write_json(os.path.join(staging, "meta.json"), meta)
+                os.replace(staging, obj_dir)
+                lg.info(f"证书包已缓存: {key}")
+            else:
+                self._touch(key, time_end)
+
+            if domain:
+                self.mark_deployed(domain, key)
+            self.evict(keep=key)
+        return key
+
+    def _touch(self, key: str, time_end: str = "") -> None:
+        meta = self._read_meta(key)
+        if not meta:
+            return
+        meta["last_used"] = time.time()
+        if time_end:
+            meta["time_end"] = time_end
+        self._write_json(os.path.join(self._object_dir(key), "meta.json"), meta)
+
+    def get(self, key: str):
+        """读取证书包，不存在返回 None"""
+        with self.lock:
+            meta = self._read_meta(key)
+            if not meta:
+                return None
+            files_dir = os.path.join(self._object_dir(key), "files")
+            files = {}
+            for dirpath, _, filenames in os.walk(files_dir):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    with open(path, 'rb') as f:
+                        files[os.path.relpath(path, files_dir).replace(os.sep, "/")] = f.read()
+            self._touch(key)
+        return CertBundle(meta["cert_id"], files, meta.get("sha256", ""))
+
+    def lookup(self, cert_id: str, time_end: str = ""):
+        """
+        查找证书ID对应的缓存证书包
+        :param cert_id:  证书ID
+        :param time_end: 证书到期时间，传入时只返回到期时间一致的版本（即平台上的当前证书）
+        :return: CertBundle / None
+        """
+        with self.lock:
+            best_key, best_created = "", -1
+            for key in self._listdir(self.objects_path):
+                if not key.startswith(f"{cert_id}-"):
+                    continue
+                meta = self._read_meta(key)
+                if not meta or meta.get("cert_id") != cert_id:
+                    continue
+                if time_end and meta.get("time_end") != time_end:
+                    continue
+                if meta.get("created", 0) > best_created:
+                    best_key, best_created = key, meta.get("created", 0)
+            return self.get(best_key) if best_key else None
+
+    def history(self, domain: str) -> list:
+        """域名的部署版本历史，最新的在最前面"""
+        try:
+            with open(self._history_file(domain), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def current(self, domain: str):
+        """域名当前部署的证书包，没有记录返回 None"""
+        history = self.history(domain)
+        return self.get(history[0]) if history else None
+
+    def current_fingerprint(self, domain: str) -> str:
+        """域名当前部署版本的叶子证书指纹，没有记录返回空字符串"""
+        history = self.history(domain)
+        return self._read_meta(history[0]).get("fingerprint", "") if history else ""
+
+    def mark_deployed(self, domain: str, key: str) -> None:
+        """记录域名当前部署的版本，只保留最近 keep_versions 个"""
+        with self.lock:
+            history = [key] + [i for i in self.history(domain) if i != key]
+            self._write_json(self._history_file(domain), history[:self.keep_versions])
+
+    def rollback(self, domain: str) -> tuple:
+        """
+        查找可回滚的上一版本，不修改历史；重新部署成功后调用 commit_rollback 记录
+        :return: (对象键, CertBundle)，没有可回滚的版本时返回 ("", None)
+        """
+        with self.lock:
+            history = self.history(domain)
+            for key in history[1:]:
+                bundle = self.get(key)
+                if bundle:
+                    return key, bundle
+            lg.warning(f"域名 {domain} 没有可回滚的证书版本")
+            return "", None
+
+    def commit_rollback(self, domain: str, key: str) -> None:
+        """回滚版本部署成功：从历史中移除比 key 新的版本"""
+        with self.lock:
+            history = self.history(domain)
+            if key not in history:
+                return
+            index = history.index(key)
+            self._write_json(self._history_file(domain), history[index:])
+            lg.info(f"域名 {domain} 回滚证书版本 {history[0]} -> {key}")
+
+    def evict(self, keep: str = "") -> None:
+        """
+        按时间和总大小淘汰缓存，任何域名历史中引用的版本都不会被淘汰
+        :param keep: 额外保留的对象键（刚写入的证书包）
+        """
+        with self.lock:
+            protected = {keep}
+            for name in self._listdir(self.history_path):
+                if name.endswith(".json"):
+                    protected.update(self.history(name[:-5]))
+
+            now = time.time()
+            entries = []
+            for key in self._listdir(self.objects_path):
+                if key.startswith("."):
+                    continue
+                meta = self._read_meta(key)
+                if key not in protected and now - meta.get("created", 0) > self.max_age:
+                    self._remove(key, "超过保存期限")
+                    continue
+                entries.append((meta.get("last_used", 0), meta.get("size", 0), key))
+
+            total = sum(i[1] for i in entries)
+            for last_used, size, key in sorted(entries):
+                if total <= self.max_size:
+                    break
+                if key in protected:
+                    continue
+                self._remove(key, "缓存超过容量上限")
+                total -= size
+
+    def _remove(self, key: str, reason: str) -> None:
+        shutil.rmtree(self._object_dir(key), ignore_errors=True)
+        lg.info(f"证书包缓存 {key} 已淘汰，原因: {reason}")
+
+
+bundle_store = BundleStore()
+
+
+if __name__ == '__main__':
+    for name in sorted(bundle_store._listdir(bundle_store.history_path)):
+        lg.info(f"{name[:-5]}: {bundle_store.history(name[:-5])}")
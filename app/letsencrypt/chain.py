@@ -0,0 +1,180 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 01:20
+# Email: leiyong711@163.com
+
+import certifi
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+from utils.log import lg
+from utils.config import Config
+from utils.cert_tools import classify_pem
+from utils.metrics import CHAIN_BYTES_SAVED
+from app.letsencrypt.bundle import CertBundle, pem_blocks, pem_encode
+
+config = Config()
+
+LAYOUT = ("fullchain.pem", "chain.pem", "cert.pem", "privkey.pem")
+TLS_CERT_OVERHEAD = 3  # TLS Certificate 消息中每个证书的长度前缀
+
+
+def _not_after(cert: x509.Certificate) -> datetime:
+    value = getattr(cert, "not_valid_after_utc", None) or cert.not_valid_after
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _spki(cert: x509.Certificate) -> bytes:
+    return cert.public_key().public_bytes(Encoding.DER, PublicFormat.SubjectPublicKeyInfo)
+
+
+def issued_by(cert: x509.Certificate, issuer: x509.Certificate) -> bool:
+    """cert 是否由 issuer 直接签发（名称一致且签名校验通过）"""
+    try:
+        cert.verify_directly_issued_by(issuer)
+        return True
+    except (ValueError, TypeError, InvalidSignature):
+        return False
+
+
+def handshake_bytes(ders: list) -> int:
+    """证书链在 TLS Certificate 消息中占用的字节数"""
+    return sum(len(der) + TLS_CERT_OVERHEAD for der in ders)
+
+
+class TrustStore:
+    """信任库：按主题索引的根证书，从 PEM 文件加载"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.by_subject = {}
+        with open(path, 'rb') as f:
+            for kind, der in pem_blocks(f.read()):
+                if kind != "CERTIFICATE":
+                    continue
+                try:
+                    cert = x509.load_der_x509_certificate(der)
+                except ValueError:
+                    continue
+                self.by_subject.setdefault(cert.subject.public_bytes(), []).append(cert)
+
+    def __len__(self):
+        return sum(len(i) for i in self.by_subject.values())
+
+    def anchored(self, cert: x509.Certificate) -> bool:
+        """cert 由信任库中的根证书直接签发"""
+        return any(issued_by(cert, root) for root in self.by_subject.get(cert.issuer.public_bytes(), []))
+
+    def contains(self, cert: x509.Certificate) -> bool:
+        """信任库中有主题和公钥都相同的根证书（包括自签名根证书和同一根证书的交叉签名版本）"""
+        spki = _spki(cert)
+        return any(_spki(root) == spki for root in self.by_subject.get(cert.subject.public_bytes(), []))
+
+
+class ChainOptimizer:
+    """
+    证书链优化
+    下载后解析证书包中的全部证书，从叶子证书出发按广度优先找到信任库的最短有效路径，
+    去掉根证书、交叉签名等握手时不需要发送的证书，输出固定文件布局：
+      fullchain.pem  叶子证书 + 中间证书
+      chain.pem      中间证书
+      cert.pem       叶子证书
+      privkey.pem    私钥
+    证书包中原有的证书文件同样改写为优化后的证书链，nginx 原有配置不需要修改
+    找不到到信任库的路径时保留原证书包
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.chain_optimization.enabled', False))
+        self.trust_store_path = config.get_jsonpath('$.chain_optimization.trust_store', '') or certifi.where()
+        self.rewrite_original = bool(config.get_jsonpath('$.chain_optimization.rewrite_original', True))
+        self._trust_store = None
+        self._lock = threading.Lock()
+
+    @property
+    def trust_store(self) -> TrustStore:
+        with self._lock:
+            if self._trust_store is None:
+                self._trust_store = TrustStore(self.trust_store_path)
+                lg.info(f"已加载信任库 {self.trust_store_path}，根证书 {len(self._trust_store)} 个")
+            return self._trust_store
+
+    def shortest_path(self, leaf: x509.Certificate, pool: list) -> list:
+        """
+        从叶子证书到信任库的最短有效路径
+        :param pool: 候选中间证书
+        :return: [中间证书]（不含叶子证书和根证书），叶子证书直接由根证书签发时为空列表，找不到路径返回 None
+        """
+        store, now = self.trust_store, datetime.now(timezone.utc)
+        # 自签名证书和信任库中已有的证书不需要发送，过期证书不能作为路径的一部分
+        candidates = [c for c in pool if c.subject != c.issuer and not store.contains(c) and _not_after(c) > now]
+        queue, seen = deque([(leaf, [])]), set()
+        while queue:
+            cert, path = queue.popleft()
+            if store.anchored(cert):
+                return path
+            for i, issuer in enumerate(candidates):
+                if i in seen or issuer.subject != cert.issuer or not issued_by(cert, issuer):
+                    continue
+                seen.add(i)
+                queue.append((issuer, path + [issuer]))
+        return None
+
+    @staticmethod
+    def served(bundle: CertBundle, leaf_der: bytes, chain: list) -> list:
+        """原证书包握手时发送的证书：以叶子证书开头的最长证书文件，只有单独的叶子证书文件时为叶子证书加全部上级证书"""
+        files = [[der for kind, der in pem_blocks(data) if kind == "CERTIFICATE"]
+                 for data in bundle.files.values() if classify_pem(data) == "cert"]
+        served = max((certs for certs in files if certs and certs[0] == leaf_der), key=len, default=[])
+        return served if len(served) > 1 else [leaf_der] + chain
+
+    def optimize(self, domain: str, bundle: CertBundle) -> CertBundle:
+        """
+        优化证书包中的证书链
+        :param domain: 域名，用于日志和指标
+        :return: 优化后的证书包，证书ID 和叶子证书不变
+        """
+        leaf_der, chain = bundle.leaf_der(), bundle.chain_der()
+        try:
+            leaf = x509.load_der_x509_certificate(leaf_der)
+            pool = [x509.load_der_x509_certificate(der) for der in chain]
+        except ValueError as e:
+            lg.warning(f"域名 {domain} 证书无法解析，跳过证书链优化: {e}")
+            return bundle
+        path = self.shortest_path(leaf, pool)
+        if path is None:
+            lg.warning(f"域名 {domain} 的证书链中找不到到信任库的有效路径，保留原证书链")
+            return bundle
+
+        optimized = [c.public_bytes(Encoding.DER) for c in path]
+        leaf_pem = pem_encode(leaf_der)
+        chain_pem = b"".join(pem_encode(der) for der in optimized)
+        files = {}
+        for name, data in bundle.files.items():
+            if name in LAYOUT:
+                continue
+            if self.rewrite_original and classify_pem(data) == "cert":
+                certs = [der for kind, der in pem_blocks(data) if kind == "CERTIFICATE"]
+                if certs and certs[0] == leaf_der:
+                    data = leaf_pem + chain_pem
+                elif chain_pem and leaf_der not in certs:
+                    data = chain_pem
+            files[name] = data
+        files.update({"fullchain.pem": leaf_pem + chain_pem, "chain.pem": chain_pem, "cert.pem": leaf_pem,
+                      "privkey.pem": bundle.private_key()})
+        if not chain_pem:
+            files.pop("chain.pem")  # 叶子证书直接由根证书签发，没有中间证书
+
+        before, after = handshake_bytes(self.served(bundle, leaf_der, chain)), handshake_bytes([leaf_der] + optimized)
+        CHAIN_BYTES_SAVED.set(before - after, domain=domain)
+        lg.info(f"域名 {domain} 证书链 {len(chain)} 个上级证书优化为 {len(optimized)} 个，"
+                f"握手证书 {before} 字节 -> {after} 字节，节省 {before - after} 字节")
+        return CertBundle(bundle.cert_id, files, bundle.sha256)
+
+
+chain_optimizer = ChainOptimizer()
@@ -0,0 +1,148 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 22:50
+# Email: leiyong711@163.com
+
+import time
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from utils.metrics import CHANNEL_BALANCE, CHANNEL_USED
+from app.letsencrypt.accounts import accounts
+
+config = Config()
+
+CRITICAL = "critical"  # 临近过期
+STALLED = "stalled"    # 共享通道卡住
+
+
+class ChannelPolicy:
+    """
+    独立通道使用策略
+    证书剩余天数低于 critical_days，或共享通道重新申请后超过 stall_minutes 仍未部署时，改用独立通道（quick=yes）新建订单。
+    独立通道余额取自 account_info 的 num_channel，按账号缓存；卡住的情况只能使用 reserve 以外的余额，
+    并受每日次数 max_per_day 限制，保证临近过期的证书始终有独立通道可用
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.independent_channel.enabled', False))
+        self.critical_days = int(config.get_jsonpath('$.independent_channel.critical_days', 1))
+        self.stall_minutes = float(config.get_jsonpath('$.independent_channel.stall_minutes', 60))
+        self.reserve = int(config.get_jsonpath('$.independent_channel.reserve', 1))
+        self.max_per_day = int(config.get_jsonpath('$.independent_channel.max_per_day', 3))
+        self.balance_ttl = float(config.get_jsonpath('$.independent_channel.balance_refresh_minutes', 30)) * 60
+        # balances: {用户名: {num, fetched_at}}  orders: {域名: {cert_id, user_name, reason, started_at}}  used: [{time, domain, user_name, reason}]
+        self.store = JsonStore("channel", {"balances": {}, "orders": {}, "used": []})
+
+    def balance(self, api) -> int:
+        """账号剩余独立通道数量，缓存 balance_refresh_minutes 分钟"""
+        with self.store.lock:
+            cached = self.store.data["balances"].get(api.user_name)
+            if cached and time.time() - cached["fetched_at"] < self.balance_ttl:
+                return cached["num"]
+        info = api.account_info()
+        if not info:
+            return cached["num"] if cached else 0
+        try:
+            num = int(info.get('num_channel') or 0)
+        except (TypeError, ValueError):
+            num = 0
+        self._set_balance(api.user_name, num)
+        return num
+
+    def _set_balance(self, user_name: str, num: int) -> None:
+        with self.store.lock:
+            self.store.data["balances"][user_name] = {"num": num, "fetched_at": time.time()}
+            self.store.save()
+        CHANNEL_BALANCE.set(num, user=user_name)
+
+    def used_today(self) -> int:
+        start = time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))
+        with self.store.lock:
+            return sum(1 for i in self.store.data["used"] if i["time"] >= start)
+
+    def reason(self, domain: str, days_remaining: int, renew_started_at: float = None) -> str:
+        """
+        是否需要使用独立通道
+        :param days_remaining:   证书剩余天数
+        :param renew_started_at: 共享通道开始重新申请的时间（run_state 记录）
+        :return: CRITICAL / STALLED，不需要时返回空字符串
+        """
+        if not self.enabled:
+            return ""
+        with self.store.lock:
+            if domain in self.store.data["orders"]:
+                return ""  # 已有独立通道订单在进行中
+        if days_remaining <= self.critical_days:
+            return CRITICAL
+        if renew_started_at and time.time() - renew_started_at > self.stall_minutes * 60:
+            return STALLED
+        return ""
+
+    def allow(self, api, reason: str) -> tuple:
+        """
+        按余额和每日次数配给独立通道
+        :return: (是否允许, 说明)
+        """
+        balance = self.balance(api)
+        if balance <= 0:
+            return False, f"账号 {api.user_name} 没有可用的独立通道"
+        if reason == STALLED:
+            if balance <= self.reserve:
+                return False, f"账号 {api.user_name} 独立通道剩余 {balance} 个，保留给临近过期的证书"
+            if self.used_today() >= self.max_per_day:
+                return False, f"今日已使用 {self.max_per_day} 次独立通道"
+        return True, f"账号 {api.user_name} 独立通道剩余 {balance} 个"
+
+    def apply(self, api, domain: str, order: dict, reason: str, algorithm: str = "RSA") -> tuple:
+        """
+        使用独立通道新建订单，绑定账号当日次数用完时由其它账号申请
+        :param api:    域名绑定的账号
+        :param order:  原订单（证书列表中的数据）
+        :return: (是否成功, 新证书ID 或 失败原因)
+        """
+        api = accounts.for_new_order(api)
+        allowed, text = self.allow(api, reason)
+        if not allowed:
+            lg.warning(f"域名 {domain} 需要使用独立通道（{reason}），但{text}")
+            return False, text
+        domains = order.get('domains') or [domain]
+        data = api.certificate_application(",".join(domains) if isinstance(domains, list) else domains,
+                                           algorithm=algorithm, quick='yes', ca=order.get('acme') or 'lets')
+        cert_id = data.get('id', '') if isinstance(data, dict) else data
+        if not cert_id:
+            return False, "独立通道申请证书失败"
+        accounts.track_order(cert_id, api)
+
+        now = time.time()
+        with self.store.lock:
+            self.store.data["orders"][domain] = {"cert_id": str(cert_id), "user_name": api.user_name,
+                                                 "reason": reason, "started_at": now}
+            self.store.data["used"] = [i for i in self.store.data["used"] if now - i["time"] < 30 * 86400]
+            self.store.data["used"].append({"time": now, "domain": domain, "user_name": api.user_name, "reason": reason})
+            balance = self.store.data["balances"].get(api.user_name, {}).get("num", 1)
+        self._set_balance(api.user_name, max(balance - 1, 0))
+        CHANNEL_USED.inc(user=api.user_name, reason=reason)
+        lg.info(f"域名 {domain} 已通过独立通道申请证书（{reason}），新证书ID {cert_id}")
+        return True, str(cert_id)
+
+    def cert_ids(self) -> set:
+        """进行中的独立通道订单的证书ID"""
+        with self.store.lock:
+            return {i["cert_id"] for i in self.store.data["orders"].values()}
+
+    def order_for(self, domain: str, cert_id: str) -> str:
+        """域名有进行中的独立通道订单时使用该订单，否则使用原订单"""
+        with self.store.lock:
+            return self.store.data["orders"].get(domain, {}).get("cert_id") or cert_id
+
+    def finish(self, domain: str) -> None:
+        """证书部署完成后结束独立通道订单，部署的订单由 accounts.pin_order 固定为域名的主订单，之后不再回到原订单"""
+        with self.store.lock:
+            if self.store.data["orders"].pop(domain, None):
+                self.store.save()
+
+
+channel_policy = ChannelPolicy()
@@ -0,0 +1,188 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 23:50
+# Email: leiyong711@163.com
+
+import time
+import hashlib
+from datetime import datetime
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from app.letsencrypt.accounts import accounts
+from app.letsencrypt.bundle import CertBundle, pem_encode
+
+config = Config()
+
+KEY_TYPES = ("ECC", "RSA")
+
+
+def key_types(domain_conf: dict) -> list:
+    """
+    域名需要的证书算法，第一个为主算法（证书平台上原有订单的算法）
+    :param domain_conf: domain_list 中的域名配置，key_types: [RSA, ECC]
+    """
+    types = [str(i).upper() for i in domain_conf.get("key_types") or [domain_conf.get("algorithm", "RSA")]]
+    return [i for i in dict.fromkeys(types) if i in KEY_TYPES] or ["RSA"]
+
+
+def is_dual(domain_conf: dict) -> bool:
+    return len(key_types(domain_conf)) > 1
+
+
+def dual_files(bundle: CertBundle, key_type: str) -> dict:
+    """
+    证书包转换为固定文件名：fullchain.<算法>.pem（叶子证书 + 上级证书）和 privkey.<算法>.pem
+    nginx 配置两组 ssl_certificate / ssl_certificate_key 即可同时提供 ECDSA 和 RSA 证书
+    """
+    suffix = key_type.lower()
+    fullchain = b"".join(pem_encode(der) for der in [bundle.leaf_der()] + bundle.chain_der())
+    return {f"fullchain.{suffix}.pem": fullchain, f"privkey.{suffix}.pem": bundle.private_key()}
+
+
+def combine(bundles: dict) -> CertBundle:
+    """
+    合并多个算法的证书包，一次部署、一次重启
+    文件名按算法排序，ECC 在前，叶子证书指纹取 ECC 证书（支持 ECDSA 的客户端握手时实际拿到的证书）
+    :param bundles: {算法: CertBundle}，第一个为主算法
+    """
+    files = {}
+    for key_type, bundle in bundles.items():
+        files.update(dual_files(bundle, key_type))
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(name.encode() + b"\0" + files[name])
+    # 证书ID 使用各订单ID拼接，避免与单个订单的缓存证书包混淆
+    return CertBundle("+".join(i.cert_id for i in bundles.values()), files, digest.hexdigest())
+
+
+class LinkedOrders:
+    """
+    同一域名不同算法的关联订单
+    主算法使用证书平台上原有的订单，其余算法各申请一个订单并记录在 state/linked_orders.json，
+    续期时一起重新申请，全部签发完成后合并部署。关联订单从申请或重新申请起超过 linked_timeout_minutes
+    仍未签发时不再阻塞主证书，先部署已签发的证书，关联订单在之后的每日检查中继续推进，签发后再一起部署
+    """
+
+    def __init__(self):
+        self.timeout = float(config.get_jsonpath('$.dual_certificate.linked_timeout_minutes', 120)) * 60
+        # {域名: {算法: {cert_id, started_at, deployed, notified}}}
+        self.store = JsonStore("linked_orders", {})
+        for linked in self.store.data.values():
+            for key_type, entry in linked.items():
+                if not isinstance(entry, dict):  # 旧格式 {算法: 证书ID}，之前的流程中已一起部署
+                    linked[key_type] = {"cert_id": str(entry), "started_at": 0, "deployed": True, "notified": False}
+
+    def linked(self, domain: str) -> dict:
+        """:return: {算法: 证书ID}"""
+        with self.store.lock:
+            return {key_type: entry["cert_id"] for key_type, entry in self.store.data.get(domain, {}).items()}
+
+    def cert_ids(self) -> set:
+        """全部关联订单的证书ID"""
+        with self.store.lock:
+            return {entry["cert_id"] for linked in self.store.data.values() for entry in linked.values()}
+
+    def _update(self, domain: str, types: list, **fields) -> None:
+        with self.store.lock:
+            linked = self.store.data.get(domain, {})
+            for key_type in types:
+                if key_type in linked:
+                    linked[key_type].update(fields)
+            self.store.save()
+
+    def ensure(self, api, domain_conf: dict, order: dict) -> dict:
+        """
+        缺少的算法申请新订单，绑定账号当日次数用完时由其它账号申请
+        :param api:   域名绑定的账号
+        :param order: 证书列表中的主订单
+        :return: {算法: 证书ID}
+        """
+        domain = domain_conf['domain']
+        linked = self.linked(domain)
+        for key_type in key_types(domain_conf)[1:]:
+            if linked.get(key_type):
+                continue
+            domains = order.get('domains') or [domain]
+            client = accounts.for_new_order(api)
+            data = client.certificate_application(",".join(domains) if isinstance(domains, list) else domains,
+                                                  algorithm=key_type, ca=order.get('acme') or 'lets')
+            cert_id = data.get('id', '') if isinstance(data, dict) else data
+            if not cert_id:
+                lg.error(f"域名 {domain} 申请 {key_type} 关联证书失败")
+                continue
+            accounts.track_order(cert_id, client)
+            linked[key_type] = str(cert_id)
+            lg.info(f"域名 {domain} 已申请 {key_type} 关联证书，证书ID {cert_id}")
+            with self.store.lock:
+                self.store.data.setdefault(domain, {})[key_type] = {"cert_id": str(cert_id), "started_at": time.time(),
+                                                                     "deployed": False, "notified": False}
+                self.store.save()
+        return linked
+
+    def renew(self, api, domain_conf: dict, types: list = None) -> None:
+        """
+        主订单重新申请时，关联订单一起重新申请，超时从此时开始计算
+        :param types: 只重新申请这些算法的订单，默认全部
+        """
+        domain, linked = domain_conf['domain'], self.linked(domain_conf['domain'])
+        for key_type in types or key_types(domain_conf)[1:]:
+            cert_id = linked.get(key_type)
+            if not cert_id:
+                continue
+            status, text = accounts.client_of(cert_id, api).certificate_reapplication(cert_id)
+            if status:
+                self._update(domain, [key_type], started_at=time.time(), deployed=False, notified=False)
+                lg.info(f"域名 {domain} {key_type} 关联证书开始重新申请")
+            else:
+                lg.warning(f"域名 {domain} {key_type} 关联证书重新申请失败: {text}")
+
+    def overdue(self, domain: str, key_type: str) -> bool:
+        """关联订单是否已超过等待时间，没有订单（申请失败）时视为超时，不阻塞主证书"""
+        with self.store.lock:
+            entry = self.store.data.get(domain, {}).get(key_type)
+        return not entry or time.time() - entry["started_at"] > self.timeout
+
+    def mark_notified(self, domain: str, types: list) -> bool:
+        """记录已通知超时，:return: 是否有尚未通知过的算法"""
+        with self.store.lock:
+            linked = self.store.data.get(domain, {})
+            if types and all(linked.get(i, {}).get("notified") for i in types):
+                return False
+        self._update(domain, types, notified=True)
+        return True
+
+    def pending(self, domain_conf: dict) -> list:
+        """还没有部署的关联证书的算法（新配置的算法、超时后仍未签发的关联订单）"""
+        with self.store.lock:
+            linked = self.store.data.get(domain_conf['domain'], {})
+            return [i for i in key_types(domain_conf)[1:] if not linked.get(i, {}).get("deployed")]
+
+    def deployed(self, domain: str, types: list) -> None:
+        """关联证书已随主证书一起部署"""
+        self._update(domain, types, deployed=True, notified=False)
+
+    def statuses(self, api, domain_conf: dict, apply_for_days_in_advance: int) -> list:
+        """
+        域名当前配置的关联订单的签发状态，已完成且剩余天数大于提前申请天数的视为签发完成
+        :return: [(算法, 证书ID, 证书详情, 是否签发完成)]
+        """
+        statuses = []
+        linked = self.linked(domain_conf['domain'])
+        for key_type in key_types(domain_conf)[1:]:
+            cert_id = linked.get(key_type)
+            if not cert_id:
+                continue
+            info = accounts.client_of(cert_id, api).certificate_details(cert_id)
+            try:
+                days = (datetime.strptime(info.get('time_end', ''), '%Y-%m-%d %H:%M:%S') - datetime.now()).days
+            except (ValueError, TypeError):
+                days = -1
+            statuses.append((key_type, cert_id, info,
+                             info.get('status_name') == "完成" and days > apply_for_days_in_advance))
+        return statuses
+
+
+linked_orders = LinkedOrders()
@@ -0,0 +1,156 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 23:20
+# Email: leiyong711@163.com
+
+import time
+from utils.log import lg
+from utils.config import Config
+from utils.state_store import JsonStore
+from utils.metrics import CA_ISSUANCE_LATENCY, CA_HEDGES
+from app.letsencrypt.accounts import accounts
+
+config = Config()
+
+CA_CHANNELS = ("lets", "zerossl", "buypass", "google")
+
+
+class CaHedger:
+    """
+    多 CA 对冲申请
+    续期订单在当前 CA 上超过耗时预算仍未签发时，按域名的 CA 偏好列表在下一个 CA 上再申请一个订单，
+    多个订单并行，最先签发完成的证书被部署，其余订单删除。每个 CA 的签发耗时按指数移动平均记录，
+    之后按耗时从快到慢排列偏好列表
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.ca_hedging.enabled', False))
+        self.default_preference = config.get_jsonpath('$.ca_hedging.preference', list(CA_CHANNELS)) or list(CA_CHANNELS)
+        self.budget = float(config.get_jsonpath('$.ca_hedging.latency_budget_minutes', 30)) * 60
+        self.max_orders = int(config.get_jsonpath('$.ca_hedging.max_orders', 2))
+        self.delete_loser = bool(config.get_jsonpath('$.ca_hedging.delete_loser', True))
+        self.alpha = float(config.get_jsonpath('$.ca_hedging.ewma_alpha', 0.3))
+        # latency: {CA: {ewma, samples}}  hedges: {域名: {orders: [{cert_id, ca, started_at}]}}
+        self.store = JsonStore("ca_hedging", {"latency": {}, "hedges": {}})
+
+    def preference(self, domain_conf: dict) -> list:
+        """域名的 CA 偏好列表，有耗时记录的 CA 按平均耗时排序，没有记录的按预算计算，耗时相同时保持配置顺序"""
+        preference = [i for i in (domain_conf.get('ca_preference') or self.default_preference) if i in CA_CHANNELS]
+        with self.store.lock:
+            latency = dict(self.store.data["latency"])
+        return sorted(preference, key=lambda ca: latency.get(ca, {}).get("ewma", self.budget))
+
+    def track(self, domain: str, cert_id: str, ca: str) -> None:
+        """共享通道开始续期时记录主订单"""
+        if not self.enabled:
+            return
+        with self.store.lock:
+            self.store.data["hedges"][domain] = {"orders": [{"cert_id": str(cert_id), "ca": ca or "lets",
+                                                             "started_at": time.time()}]}
+            self.store.save()
+
+    def orders(self, domain: str) -> list:
+        with self.store.lock:
+            return [dict(i) for i in self.store.data["hedges"].get(domain, {}).get("orders", [])]
+
+    def cert_ids(self) -> set:
+        """对冲进行中新发起的订单的证书ID（不含原订单）"""
+        with self.store.lock:
+            return {i["cert_id"] for hedge in self.store.data["hedges"].values() for i in hedge.get("orders", [])[1:]}
+
+    def order_for(self, domain: str, cert_id: str) -> str:
+        """对冲进行中时返回最新的订单（需要继续推进验证），否则返回原订单"""
+        with self.store.lock:
+            orders = self.store.data["hedges"].get(domain, {}).get("orders", [])
+            return orders[-1]["cert_id"] if len(orders) > 1 else cert_id
+
+    def pick(self, api, domain: str, cert_id: str, order_info: dict) -> tuple:
+        """
+        对冲进行中时检查所有订单，已签发完成的订单优先
+        :return: (证书ID, 证书详情)
+        """
+        orders = self.orders(domain)
+        if len(orders) < 2:
+            return cert_id, order_info
+        for order in orders:
+            if order["cert_id"] == cert_id:
+                continue
+            info = accounts.client_of(order["cert_id"], api).certificate_details(order["cert_id"])
+            if info.get('status_name') == "完成":
+                lg.info(f"域名 {domain} 对冲订单 {order['cert_id']}（{order['ca']}）最先签发完成")
+                return order["cert_id"], info
+        return cert_id, order_info
+
+    def maybe_hedge(self, api, domain_conf: dict, order: dict, cert_id: str, status: str) -> str:
+        """
+        最新的订单超过耗时预算时，在下一个 CA 上发起对冲申请，绑定账号当日次数用完时由其它账号申请
+        对冲订单的验证记录与原订单写在同一个 _acme-challenge 上，当前订单验证中时等验证结束（失败后回到待验证）再发起，
+        不覆盖 CA 正在校验的记录值
+        :param order:   证书列表中的原订单
+        :param cert_id: 当前推进的订单，不是最新的对冲订单时（如进行中的独立通道订单）不发起
+        :param status:  当前订单的状态
+        :return: 新证书ID，未发起时返回空字符串
+        """
+        domain = domain_conf['domain']
+        orders = self.orders(domain)
+        if not self.enabled or not orders or len(orders) >= self.max_orders or orders[-1]["cert_id"] != str(cert_id):
+            return ""
+        if time.time() - orders[-1]["started_at"] < self.budget:
+            return ""
+        if status == "验证中":
+            lg.info(f"域名 {domain} 在 {orders[-1]['ca']} 已超过耗时预算，等待当前验证结束后再发起对冲申请")
+            return ""
+        used = {i["ca"] for i in orders}
+        next_ca = next((ca for ca in self.preference(domain_conf) if ca not in used), "")
+        if not next_ca:
+            return ""
+
+        domains = order.get('domains') or [domain]
+        client = accounts.for_new_order(api)
+        data = client.certificate_application(",".join(domains) if isinstance(domains, list) else domains,
+                                              algorithm=domain_conf.get('algorithm', 'RSA'), ca=next_ca)
+        cert_id = data.get('id', '') if isinstance(data, dict) else data
+        if not cert_id:
+            lg.error(f"域名 {domain} 在 {next_ca} 发起对冲申请失败")
+            return ""
+        accounts.track_order(cert_id, client)
+        with self.store.lock:
+            self.store.data["hedges"][domain]["orders"].append({"cert_id": str(cert_id), "ca": next_ca,
+                                                                "started_at": time.time()})
+            self.store.save()
+        CA_HEDGES.inc(ca=next_ca)
+        lg.info(f"域名 {domain} 在 {orders[-1]['ca']} 超过 {self.budget / 60:g} 分钟未签发，已在 {next_ca} 发起对冲申请，证书ID {cert_id}")
+        return str(cert_id)
+
+    def record_latency(self, ca: str, seconds: float) -> None:
+        CA_ISSUANCE_LATENCY.observe(seconds, ca=ca)
+        with self.store.lock:
+            item = self.store.data["latency"].setdefault(ca, {"ewma": seconds, "samples": 0})
+            item["ewma"] = seconds if not item["samples"] else self.alpha * seconds + (1 - self.alpha) * item["ewma"]
+            item["samples"] += 1
+
+    def finish(self, api, domain: str, winner_id: str) -> None:
+        """证书部署完成，记录胜出 CA 的耗时，删除其余订单并结束对冲，胜出的订单由 accounts.pin_order 固定为域名的主订单"""
+        with self.store.lock:
+            hedge = self.store.data["hedges"].pop(domain, None)
+            if not hedge:
+                return
+            orders = hedge["orders"]
+        winner = next((i for i in orders if i["cert_id"] == winner_id), None)
+        if winner:
+            self.record_latency(winner["ca"], time.time() - winner["started_at"])
+        for order in orders:
+            # 胜出的不是对冲中的订单（如独立通道订单）时不删除任何订单
+            if not winner or order is winner or not self.delete_loser:
+                continue
+            status, text = accounts.client_of(order["cert_id"], api).certificate_delete(order["cert_id"])
+            if status:
+                lg.info(f"域名 {domain} 已删除落选订单 {order['cert_id']}（{order['ca']}）")
+            else:
+                lg.warning(f"域名 {domain} 删除落选订单 {order['cert_id']}（{order['ca']}）失败: {text}")
+        self.store.save()
+
+
+hedger = CaHedger()
@@ -0,0 +1,180 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 02:20
+# Email: leiyong711@163.com
+
+import sys
+import json
+import argparse
+from datetime import datetime, date, timedelta
+from collections import defaultdict
+from utils.log import lg
+from utils.config import Config
+from utils.run_state import run_state
+from utils.state_store import JsonStore
+from utils.user_limiter import user_limiter
+from app.letsencrypt.accounts import accounts
+
+config = Config()
+
+
+def _day(value: str) -> date:
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class RenewalPlanner:
+    """
+    续期计划
+    证书集中在同一周签发时会在同一天进入 apply_for_days_in_advance 窗口，一天内的续期请求超过 UserLimiter 每日次数。
+    计划把每个证书的续期日期安排在 [过期前 window_days 天, 过期前 apply_for_days_in_advance 天] 之间，
+    每个账号每天的预计请求数（每日检查 + 续期次数 × renewal_cost）不超过每日次数的 target_share，
+    优先选择未满的日期中离过期最近的一天。已安排的日期只要仍然有效就保持不变，
+    续期后的新证书按新的过期时间重新安排，签发日期会逐渐错开
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.renewal_planner.enabled', False))
+        self.window_days = int(config.get_jsonpath('$.renewal_planner.window_days', 30))
+        self.renewal_cost = int(config.get_jsonpath('$.renewal_planner.renewal_cost', 8))
+        self.target_share = float(config.get_jsonpath('$.renewal_planner.target_share', 0.5))
+        # {域名: {day, time_end, account}}
+        self.store = JsonStore("renewal_plan", {})
+
+    def window(self, time_end: str, apply_for_days_in_advance: int, today: date) -> (date, date):
+        """可续期的日期范围，已经进入提前申请天数的证书只能安排在今天"""
+        expiry = datetime.strptime(time_end, '%Y-%m-%d %H:%M:%S').date()
+        latest = expiry - timedelta(days=apply_for_days_in_advance)
+        earliest = expiry - timedelta(days=max(self.window_days, apply_for_days_in_advance))
+        if latest <= today:
+            return today, today
+        return max(earliest, today), latest
+
+    def capacity(self, daily_limit: float, domains: int) -> float:
+        """账号每天可安排的续期数量：目标份额扣除每日检查（证书列表 1 次 + 每个域名详情 1 次）后按续期次数折算"""
+        if daily_limit == float('inf'):
+            return float('inf')
+        return max((daily_limit * self.target_share - domains - 1) // self.renewal_cost, 1)
+
+    def plan(self, domains: dict = None, today: date = None) -> dict:
+        """
+        重新计算续期计划并保存
+        :param domains: {域名: run_state 记录}，默认使用 run_state 中最近一次检查的结果，只安排 domain_list 中配置的域名
+        :return: {域名: {day, time_end, account}}
+        """
+        domains = run_state.domains() if domains is None else domains
+        today = today or date.today()
+        confs = {v['domain']: v for v in (config.get_jsonpath("$.domain_list", {}) or {}).values() if v.get('domain')}
+        items, per_account = [], defaultdict(int)
+        for domain, item in domains.items():
+            # 已从 domain_list 中移除的域名不再安排续期
+            if domain not in confs or not item.get("time_end"):
+                continue
+            try:
+                earliest, latest = self.window(item["time_end"], int(item.get("apply_for_days_in_advance", 3)), today)
+            except (ValueError, TypeError):
+                continue
+            account = accounts.account_name(domain, confs[domain])
+            per_account[account] += 1
+            items.append((domain, item["time_end"], account, earliest, latest))
+
+        with self.store.lock:
+            previous = dict(self.store.data)
+        caps = {name: self.capacity(user_limiter.get_user_stats(accounts.clients[name].user_name)['daily_limit'], count)
+                for name, count in per_account.items()}
+        load, plan = defaultdict(int), {}
+
+        # 已安排且仍然有效的日期保持不变，其余按最晚可续期日期从早到晚安排（约束最紧的先安排）
+        pending = []
+        for domain, time_end, account, earliest, latest in items:
+            old = previous.get(domain, {})
+            if old.get("time_end") == time_end and old.get("account") == account and earliest <= _day(old["day"]) <= latest:
+                plan[domain] = old
+                load[(account, old["day"])] += 1
+            else:
+                pending.append((latest, earliest, domain, time_end, account))
+        overflow = []
+        for latest, earliest, domain, time_end, account in sorted(pending):
+            days = [earliest + timedelta(days=i) for i in range((latest - earliest).days + 1)]
+            # 未满的日期中最晚的一天（证书多用几天），都已满时取负载最低的一天
+            free = [d for d in days if load[(account, d.isoformat())] < caps[account]]
+            if free:
+                day = free[-1]
+            else:
+                day = min(days, key=lambda d: (load[(account, d.isoformat())], -d.toordinal()))
+                overflow.append(domain)
+            load[(account, day.isoformat())] += 1
+            plan[domain] = {"day": day.isoformat(), "time_end": time_end, "account": account}
+
+        with self.store.lock:
+            self.store.data.clear()
+            self.store.data.update(plan)
+            self.store.save()
+        if overflow:
+            lg.warning(f"以下域名的可续期窗口内每日续期数量已达上限，仍按负载最低的日期安排: {', '.join(overflow)}")
+        upcoming = self.schedule(today, days=7)
+        if upcoming:
+            lg.info("未来 7 天续期计划: " + "；".join(f"{day} {len(names)} 个" for day, names in upcoming.items()))
+        return plan
+
+    def due(self, domain: str, time_end: str, today: date = None) -> bool:
+        """计划的续期日期已到（计划对应的是当前证书）"""
+        if not self.enabled:
+            return False
+        with self.store.lock:
+            item = self.store.data.get(domain)
+        if not item or item.get("time_end") != time_end:
+            return False
+        return _day(item["day"]) <= (today or date.today())
+
+    def schedule(self, today: date = None, days: int = 30) -> dict:
+        """:return: {日期: [域名]}，今天起 days 天内，按日期排序"""
+        today = today or date.today()
+        end = today + timedelta(days=days)
+        result = defaultdict(list)
+        with self.store.lock:
+            for domain, item in self.store.data.items():
+                if _day(item["day"]) < end:
+                    result[max(_day(item["day"]), today).isoformat()].append(domain)
+        return {day: sorted(result[day]) for day in sorted(result)}
+
+
+renewal_planner = RenewalPlanner()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="输出证书续期计划，按日期和账号汇总预计请求次数")
+    parser.add_argument("--days", type=int, default=30, help="输出今天起 N 天内的计划")
+    parser.add_argument("--replan", action="store_true", help="按 run_state 中最近一次检查结果重新计算计划")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出")
+    args = parser.parse_args(argv)
+
+    if args.replan:
+        renewal_planner.plan()
+    schedule = renewal_planner.schedule(days=args.days)
+    if args.json:
+        print(json.dumps(schedule, ensure_ascii=False, indent=2))
+        return
+    if not schedule:
+        print("没有续期计划，请先运行一次证书检查或使用 --replan")
+        return
+    with renewal_planner.store.lock:
+        plan = dict(renewal_planner.store.data)
+    per_account = defaultdict(int)
+    for item in plan.values():
+        per_account[item["account"]] += 1
+    for day, names in schedule.items():
+        print(f"\n{day}  续期 {len(names)} 个")
+        by_account = defaultdict(list)
+        for name in names:
+            by_account[plan[name]["account"]].append(name)
+        for account, items in sorted(by_account.items()):
+            limit = user_limiter.get_user_stats(accounts.clients[account].user_name)['daily_limit'] if account in accounts.clients else 0
+            requests = per_account[account] + 1 + len(items) * renewal_planner.renewal_cost
+            share = f"{requests / limit * 100:.0f}%" if limit and limit != float('inf') else "不限"
+            print(f"  {account:<20} 预计请求 {requests:>4} 次  占每日次数 {share:>5}  {', '.join(items)}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -10,108 +10,104 @@ import hmac
 import json
 import hashlib
 import requests
+import threading
 import traceback
 from utils.log import lg
 from datetime import datetime
 from utils.config import Config
+from utils.metrics import API_REQUESTS, API_LATENCY
+from utils.tracing import traced, span
+from app.dns_provider import DnsProvider, last_values
 
 config = Config()
 
 
-class Qcloud:
+class SignedRequest:
+    """签名完成、可以直接发送的请求，body 即参与签名的字节串"""
+
+    __slots__ = ("action", "headers", "body")
+
+    def __init__(self, action: str, headers: dict, body: bytes):
+        self.action = action
+        self.headers = headers
+        self.body = body
+
+
+class TC3Signer:
+    """
+    腾讯云 TC3-HMAC-SHA256 签名
+    派生签名密钥按 UTC 日期缓存，同一天内只计算一次三层 HMAC；
+    请求参数只序列化一次，同一份字节串既用于计算签名也作为请求体发送，保证签名内容与实际发送内容一致
+    """
 
-    service = "dnspod"
-    host = "dnspod.tencentcloudapi.com"
-    endpoint = "https://" + host
-    region = "ap-guangzhou"
-    version = "2017-03-12"
     algorithm = "TC3-HMAC-SHA256"
+    content_type = "application/json"
     signed_headers = "content-type;host;x-tc-action"
 
-    def __init__(self, debug=False):
-        """
-        :param debug: 是否开启Debug日志
-        """
+    def __init__(self, secret_id: str, secret_key: str, service: str, host: str, region: str = "", debug: bool = False):
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.service = service
+        self.host = host
+        self.region = region
         self.debug = debug
-        self.secret_id = config.get_jsonpath('$.qcloud.secret_id', '')
-        self.secret_key = config.get_jsonpath('$.qcloud.secret_key', '')
+        self.canonical_headers_prefix = f"content-type:{self.content_type}\nhost:{host}\nx-tc-action:"
+        self.key_date = ""
+        self.key = b""
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def serialize(params: dict) -> bytes:
+        return json.dumps(params, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
 
-    def splice_the_specification_request_string(self, action, method, params):
+    def signing_key(self, date: str) -> bytes:
+        """派生签名密钥，只缓存当天的一个"""
+        with self.lock:
+            if self.key_date != date:
+                secret_date = hmac.new(("TC3" + self.secret_key).encode("utf-8"), date.encode("utf-8"), hashlib.sha256).digest()
+                secret_service = hmac.new(secret_date, self.service.encode("utf-8"), hashlib.sha256).digest()
+                self.key = hmac.new(secret_service, b"tc3_request", hashlib.sha256).digest()
+                self.key_date = date
+            return self.key
+
+    def canonical_request(self, action: str, method: str, body: bytes) -> str:
         """
         拼接规范请求串
         :param action:  方法名
         :param method:  请求方法
-        :param params:  参数
-        :return:
+        :param body:    请求体
         """
-        http_request_method = method
-        canonical_uri = '/'
-        canonical_querystring = ""
-        payload = json.dumps(params)
-
-        ct = "application/json"
-        canonical_headers = f"content-type:{ct}\nhost:{self.host}\nx-tc-action:{action.lower()}\n"
-
-        hashed_request_payload = hashlib.sha256(payload.encode("utf-8")).hexdigest()
-        canonical_request = (http_request_method + "\n" +
-                             canonical_uri + "\n" +
-                             canonical_querystring + "\n" +
-                             canonical_headers + "\n" +
-                             self.signed_headers + "\n" +
-                             hashed_request_payload)
+        canonical_request = "\n".join([
+            method, "/", "", f"{self.canonical_headers_prefix}{action.lower()}\n", self.signed_headers,
+            hashlib.sha256(body).hexdigest(),
+        ])
         if self.debug:
             lg.debug(f"拼接规范请求串: \n{canonical_request}")
         return canonical_request
 
-    def spell_the_reception_signature_string(self, action, method, params, timestamp, date):
+    def sign(self, action: str, params: dict, version: str, method: str = "POST", timestamp: int = None) -> SignedRequest:
         """
-        拼接待签名字符串
-        :param action:      方法名
-        :param method:      请求方法
-        :param params:      参数
-        :param timestamp:   10位时间戳
-        :param date:        时间日期
-        :return:
+        :param action:    方法名
+        :param params:    参数
+        :param version:   接口版本
+        :param method:    请求方法
+        :param timestamp: 10位时间戳，默认当前时间
         """
-        credential_scope = date + "/" + self.service + "/" + "tc3_request"
-        shign = self.splice_the_specification_request_string(action, method, params)
-        hashed_canonical_request = hashlib.sha256(shign.encode("utf-8")).hexdigest()
-        string_to_sign = (self.algorithm + "\n" +
-                          str(timestamp) + "\n" +
-                          credential_scope + "\n" +
-                          hashed_canonical_request)
+        timestamp = int(timestamp or time.time())
+        date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
+        credential_scope = f"{date}/{self.service}/tc3_request"
+        body = self.serialize(params)
+        string_to_sign = "\n".join([
+            self.algorithm, str(timestamp), credential_scope,
+            hashlib.sha256(self.canonical_request(action, method, body).encode("utf-8")).hexdigest(),
+        ])
         if self.debug:
             lg.debug(f"拼接待签名字符串: \n{string_to_sign}")
-        return string_to_sign
-
-    def sign(self, key, msg):
-        return hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
-
-    def authorization(self, date, signature):
-        credential_scope = date + "/" + self.service + "/" + "tc3_request"
-        authorizations = (
-                self.algorithm + " " +
-                "Credential=" + self.secret_id + "/" + credential_scope + ", " +
-                "SignedHeaders=" + self.signed_headers + ", " +
-                "Signature=" + signature)
-        return authorizations
-
-    def requst(self, action, params, version, method="POST", **kwargs):
-        timestamp = int(time.time())
-        if self.debug:
-            lg.debug(f"签名时间戳: {timestamp}")
-        date = datetime.utcfromtimestamp(timestamp).strftime("%Y-%m-%d")
-
-        secret_date = self.sign(("TC3" + self.secret_key).encode("utf-8"), date)
-        secret_service = self.sign(secret_date, self.service)
-        secret_signing = self.sign(secret_service, "tc3_request")
-        sign = self.spell_the_reception_signature_string(action, method, params, timestamp, date)
-        signature = hmac.new(secret_signing, sign.encode("utf-8"), hashlib.sha256).hexdigest()
-        authorizations = self.authorization(date, signature)
-
+        signature = hmac.new(self.signing_key(date), string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
         headers = {
-            "Authorization": authorizations,
-            "Content-Type": "application/json",
+            "Authorization": f"{self.algorithm} Credential={self.secret_id}/{credential_scope}, "
+                             f"SignedHeaders={self.signed_headers}, Signature={signature}",
+            "Content-Type": self.content_type,
             "Host": self.host,
             "X-TC-Action": action,
             "X-TC-Timestamp": str(timestamp),
@@ -119,12 +115,56 @@ class Qcloud:
             "X-TC-Region": self.region,
             "X-TC-Language": "zh-CN",
         }
+        return SignedRequest(action, headers, body)
+
+    def presign_batch(self, calls: list, method: str = "POST") -> list:
+        """
+        批量签名，整批使用同一个时间戳和签名密钥（签名 5 分钟内有效，需在有效期内发送）
+        :param calls: [(方法名, 参数, 接口版本)]
+        :return: [SignedRequest]
+        """
+        timestamp = int(time.time())
+        return [self.sign(action, params, version, method, timestamp) for action, params, version in calls]
+
+
+class Qcloud(DnsProvider):
 
+    name = "Qcloud"
+    service = "dnspod"
+    host = "dnspod.tencentcloudapi.com"
+    endpoint = "https://" + host
+    region = "ap-guangzhou"
+    version = "2017-03-12"
+
+    def __init__(self, debug=False):
+        """
+        :param debug: 是否开启Debug日志
+        """
+        super().__init__()
+        self.debug = debug
+        self.session = requests.Session()
+        self.secret_id = config.get_jsonpath('$.qcloud.secret_id', '')
+        self.secret_key = config.get_jsonpath('$.qcloud.secret_key', '')
+        self.signer = TC3Signer(self.secret_id, self.secret_key, self.service, self.host, self.region, debug)
+
+    def send(self, signed: SignedRequest, method="POST", **kwargs) -> dict:
+        """发送已签名的请求"""
+        action = signed.action
         try:
             if self.debug:
-                lg.debug(f"请求头: {headers}")
-                lg.debug(f"请求参数: {params}")
-            resp = requests.request(method, self.endpoint, json=params, headers=headers, timeout=7, **kwargs).json()
+                lg.debug(f"请求头: {signed.headers}")
+                lg.debug(f"请求参数: {signed.body.decode('utf-8')}")
+            start = time.perf_counter()
+            try:
+                with span("network", endpoint=action):
+                    r = self.session.request(method, self.endpoint, data=signed.body, headers=signed.headers, timeout=7, **kwargs)
+                API_REQUESTS.inc(api="qcloud", endpoint=action, status=r.status_code)
+            except requests.exceptions.RequestException:
+                API_REQUESTS.inc(api="qcloud", endpoint=action, status="error")
+                raise
+            finally:
+                API_LATENCY.observe(time.perf_counter() - start, api="qcloud", endpoint=action)
+            resp = r.json()
             if self.debug:
                 lg.debug(f"返回数据: {resp}")
             return resp
@@ -132,6 +172,22 @@ class Qcloud:
             lg.error(f"Qcloud请求异常: {traceback.format_exc()}")
             return {}
 
+    @traced("qcloud.request", lambda args, kwargs: {"endpoint": args[1] if len(args) > 1 else kwargs.get("action")})
+    def requst(self, action, params, version, method="POST", **kwargs):
+        with span("qcloud.sign"):
+            signed = self.signer.sign(action, params, version, method)
+        return self.send(signed, method, **kwargs)
+
+    def requst_batch(self, calls: list, method="POST", **kwargs) -> list:
+        """
+        批量请求，先整批签名再依次发送
+        :param calls: [(方法名, 参数, 接口版本)]
+        :return: 与 calls 顺序一致的返回数据
+        """
+        with span("qcloud.sign", batch=len(calls)):
+            signed = self.signer.presign_batch(calls, method)
+        return [self.send(i, method, **kwargs) for i in signed]
+
     def update_acme_challenge_analysis(self, domain,  value, params):
         """
         更新DNS解析
@@ -195,3 +251,78 @@ class Qcloud:
             return True
         lg.warning(f"将 {domain} 域名的{name}记录值从 {params[0].get('Value')} 修改为 {value} 失败")
         return False
+
+    @staticmethod
+    def _error(resp: dict) -> dict:
+        return resp.get('Response', {}).get('Error', {}) if resp else {"Code": "RequestError", "Message": "请求失败"}
+
+    @staticmethod
+    def _record(record: dict) -> dict:
+        return {
+            "id": record.get('RecordId'),
+            "name": record.get('Name'),
+            "type": record.get('Type'),
+            "value": record.get('Value'),
+            "ttl": record.get('TTL', 600),
+            "line": record.get('Line', '默认'),
+        }
+
+    def lookup(self, domain: str, name: str, record_type: str = "TXT") -> list:
+        params = {"Domain": domain, "Subdomain": name, "RecordType": record_type}
+        resp = self.requst('DescribeRecordList', params, version="2021-03-23")
+        return [self._record(i) for i in resp.get('Response', {}).get('RecordList', [])
+                if i.get('Name') == name and i.get('Type') == record_type]
+
+    def _upsert_call(self, domain: str, name: str, value: str, record: dict) -> tuple:
+        if record:
+            return 'ModifyRecord', {"Domain": domain, "RecordType": "TXT", "RecordLine": record["line"], "Value": value,
+                                    "RecordId": record["id"], "TTL": record["ttl"], "SubDomain": name}, "2021-03-23"
+        return 'CreateRecord', {"Domain": domain, "RecordType": "TXT", "RecordLine": "默认", "Value": value,
+                                "SubDomain": name, "TTL": 600}, "2021-03-23"
+
+    def _upsert_result(self, domain: str, name: str, value: str, record: dict, resp: dict) -> bool:
+        error = self._error(resp)
+        if error:
+            self.forget_record(domain, name)
+            lg.error(f"设置腾讯云 {domain} 域名的 {name} 记录失败，异常原因：{error}")
+            return False
+        record_id = resp.get('Response', {}).get('RecordId', record.get("id") if record else None)
+        self.cache_record(domain, {"id": record_id, "name": name, "type": "TXT", "value": value,
+                                   "ttl": record.get("ttl", 600) if record else 600,
+                                   "line": record.get("line", "默认") if record else "默认"})
+        old_value = f" 从 {record.get('value')}" if record else ""
+        lg.info(f"将 {domain} 域名的 {name} 记录值{old_value} 设置为 {value} 成功")
+        return True
+
+    def upsert_txt(self, domain: str, name: str, value: str) -> bool:
+        record = self.find_record(domain, name)
+        if record and record["value"] == value:
+            return True
+        resp = self.requst(*self._upsert_call(domain, name, value, record))
+        if record and self._error(resp).get('Code', '').startswith(('InvalidParameter.RecordId', 'ResourceNotFound')):
+            # 缓存的记录已被删除，重新查询后再试一次
+            self.forget_record(domain, name)
+            record = self.find_record(domain, name)
+            resp = self.requst(*self._upsert_call(domain, name, value, record))
+        return self._upsert_result(domain, name, value, record, resp)
+
+    def upsert_txt_batch(self, items: list) -> dict:
+        """先查询全部记录，再整批签名依次发送，同一主机记录只写入最后一个值"""
+        items = last_values(items)
+        records = [self.find_record(domain, name) for domain, name, _ in items]
+        calls = [self._upsert_call(domain, name, value, record) for (domain, name, value), record in zip(items, records)]
+        responses = self.requst_batch(calls)
+        return {(domain, name): self._upsert_result(domain, name, value, record, resp)
+                for (domain, name, value), record, resp in zip(items, records, responses)}
+
+    def delete_txt(self, domain: str, name: str) -> bool:
+        record = self.find_record(domain, name)
+        if not record:
+            return True
+        resp = self.requst('DeleteRecord', {"Domain": domain, "RecordId": record["id"]}, version="2021-03-23")
+        self.forget_record(domain, name)
+        error = self._error(resp)
+        if error:
+            lg.error(f"删除腾讯云 {domain} 域名的 {name} 记录失败，异常原因：{error}")
+            return False
+        return True
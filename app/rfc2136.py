@@ -0,0 +1,412 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 21:10
+# Email: leiyong711@163.com
+
+import time
+import hmac
+import base64
+import socket
+import struct
+import random
+import hashlib
+import traceback
+from collections import OrderedDict
+from utils.log import lg
+from utils.config import Config
+from utils.metrics import API_REQUESTS, API_LATENCY
+from utils.tracing import traced, span
+from app.dns_provider import DnsProvider
+
+config = Config()
+
+TYPE_CNAME = 5
+TYPE_SOA = 6
+TYPE_TXT = 16
+TYPE_TSIG = 250
+CLASS_IN = 1
+CLASS_NONE = 254
+CLASS_ANY = 255
+OPCODE_QUERY = 0
+OPCODE_UPDATE = 5
+RECORD_TYPES = {"TXT": TYPE_TXT, "SOA": TYPE_SOA, "CNAME": TYPE_CNAME}
+
+RCODES = {
+    0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED", 6: "YXDOMAIN",
+    7: "YXRRSET", 8: "NXRRSET", 9: "NOTAUTH", 10: "NOTZONE", 16: "BADSIG", 17: "BADKEY", 18: "BADTIME",
+}
+
+# 配置中的算法名 -> (TSIG 算法域名, 摘要算法)
+TSIG_ALGORITHMS = {
+    "hmac-md5": ("hmac-md5.sig-alg.reg.int", hashlib.md5),
+    "hmac-sha1": ("hmac-sha1", hashlib.sha1),
+    "hmac-sha256": ("hmac-sha256", hashlib.sha256),
+    "hmac-sha512": ("hmac-sha512", hashlib.sha512),
+}
+
+
+class DnsError(Exception):
+    pass
+
+
+def encode_name(name: str) -> bytes:
+    """域名编码为 DNS 报文格式（不压缩）"""
+    data = b""
+    for label in name.rstrip(".").split("."):
+        if not label:
+            continue
+        label = label.encode("idna") if not label.isascii() else label.encode("ascii")
+        if len(label) > 63:
+            raise DnsError(f"域名标签过长: {label!r}")
+        data += bytes([len(label)]) + label
+    return data + b"\x00"
+
+
+def decode_name(data: bytes, offset: int) -> tuple:
+    """:return: (域名, 名称之后的偏移)"""
+    labels = []
+    end = None
+    jumps = 0
+    while True:
+        if offset >= len(data):
+            raise DnsError("报文被截断")
+        length = data[offset]
+        if length & 0xC0 == 0xC0:
+            if end is None:
+                end = offset + 2
+            offset = struct.unpack_from(">H", data, offset)[0] & 0x3FFF
+            jumps += 1
+            if jumps > 64:
+                raise DnsError("域名压缩指针循环")
+            continue
+        offset += 1
+        if length == 0:
+            break
+        labels.append(data[offset:offset + length].decode("ascii", errors="replace"))
+        offset += length
+    return ".".join(labels), end if end is not None else offset
+
+
+def txt_rdata(value: str) -> bytes:
+    """TXT 记录值按 255 字节分段"""
+    raw = value.encode("utf-8")
+    chunks = [raw[i:i + 255] for i in range(0, len(raw), 255)] or [b""]
+    return b"".join(bytes([len(i)]) + i for i in chunks)
+
+
+def parse_txt_rdata(rdata: bytes) -> str:
+    parts, offset = [], 0
+    while offset < len(rdata):
+        length = rdata[offset]
+        parts.append(rdata[offset + 1:offset + 1 + length])
+        offset += 1 + length
+    return b"".join(parts).decode("utf-8", errors="replace")
+
+
+class Message:
+    """
+    DNS 报文
+    question 在 UPDATE 报文中为 zone 段，answer/authority 分别为 prerequisite/update 段
+    资源记录统一为 (名称, 类型, 类, TTL, rdata)
+    """
+
+    def __init__(self, msg_id: int = None, opcode: int = OPCODE_QUERY, flags: int = 0):
+        self.id = random.getrandbits(16) if msg_id is None else msg_id
+        self.flags = flags | (opcode << 11)
+        self.question = []
+        self.answer = []
+        self.authority = []
+        self.additional = []
+        self.tsig_offset = None
+
+    @property
+    def opcode(self) -> int:
+        return (self.flags >> 11) & 0xF
+
+    @property
+    def rcode(self) -> int:
+        return self.flags & 0xF
+
+    @property
+    def is_response(self) -> bool:
+        return bool(self.flags & 0x8000)
+
+    def to_wire(self) -> bytes:
+        data = struct.pack(">HHHHHH", self.id, self.flags, len(self.question), len(self.answer),
+                           len(self.authority), len(self.additional))
+        for name, rtype, rclass in self.question:
+            data += encode_name(name) + struct.pack(">HH", rtype, rclass)
+        for section in (self.answer, self.authority, self.additional):
+            for name, rtype, rclass, ttl, rdata in section:
+                data += encode_name(name) + struct.pack(">HHIH", rtype, rclass, ttl, len(rdata)) + rdata
+        return data
+
+    @classmethod
+    def from_wire(cls, data: bytes) -> "Message":
+        if len(data) < 12:
+            raise DnsError("报文长度不足")
+        msg_id, flags, qd, an, ns, ar = struct.unpack_from(">HHHHHH", data, 0)
+        message = cls(msg_id)
+        message.flags = flags
+        offset = 12
+        for _ in range(qd):
+            name, offset = decode_name(data, offset)
+            rtype, rclass = struct.unpack_from(">HH", data, offset)
+            offset += 4
+            message.question.append((name, rtype, rclass))
+        for section, count in ((message.answer, an), (message.authority, ns), (message.additional, ar)):
+            for _ in range(count):
+                start = offset
+                name, offset = decode_name(data, offset)
+                rtype, rclass, ttl, length = struct.unpack_from(">HHIH", data, offset)
+                offset += 10
+                rdata = data[offset:offset + length]
+                if len(rdata) != length:
+                    raise DnsError("报文被截断")
+                if rtype == TYPE_CNAME:
+                    # CNAME 目标可能使用压缩指针，解压后再保存
+                    rdata = encode_name(decode_name(data, offset)[0])
+                offset += length
+                section.append((name, rtype, rclass, ttl, rdata))
+                if section is message.additional and rtype == TYPE_TSIG:
+                    message.tsig_offset = start
+        return message
+
+
+class TsigKey:
+    """TSIG 事务签名 (RFC 8945)"""
+
+    def __init__(self, name: str, secret: str, algorithm: str = "hmac-sha256", fudge: int = 300):
+        """
+        :param name:      密钥名
+        :param secret:    base64 编码的密钥
+        :param algorithm: hmac-md5 / hmac-sha1 / hmac-sha256 / hmac-sha512
+        """
+        if algorithm not in TSIG_ALGORITHMS:
+            raise DnsError(f"不支持的 TSIG 算法 {algorithm}，可选: {'/'.join(TSIG_ALGORITHMS)}")
+        self.name = name.rstrip(".").lower()
+        self.secret = base64.b64decode(secret)
+        self.algorithm_name, self.digest = TSIG_ALGORITHMS[algorithm]
+        self.fudge = fudge
+
+    def _variables(self, time_signed: int, fudge: int, error: int = 0, other: bytes = b"") -> bytes:
+        return (encode_name(self.name) + struct.pack(">HI", CLASS_ANY, 0) + encode_name(self.algorithm_name)
+                + struct.pack(">HIH", time_signed >> 32, time_signed & 0xFFFFFFFF, fudge)
+                + struct.pack(">HH", error, len(other)) + other)
+
+    def _mac(self, wire: bytes, request_mac: bytes, time_signed: int, fudge: int, error: int, other: bytes) -> bytes:
+        prefix = struct.pack(">H", len(request_mac)) + request_mac if request_mac else b""
+        return hmac.new(self.secret, prefix + wire + self._variables(time_signed, fudge, error, other), self.digest).digest()
+
+    def sign(self, message: Message, request_mac: bytes = b"", error: int = 0) -> tuple:
+        """
+        :param request_mac: 签名响应时传入请求的 MAC
+        :return: (带 TSIG 的报文, MAC)
+        """
+        time_signed = int(time.time())
+        other = struct.pack(">HI", time_signed >> 32, time_signed & 0xFFFFFFFF) if error == 18 else b""
+        mac = self._mac(message.to_wire(), request_mac, time_signed, self.fudge, error, other)
+        rdata = (encode_name(self.algorithm_name)
+                 + struct.pack(">HIHH", time_signed >> 32, time_signed & 0xFFFFFFFF, self.fudge, len(mac)) + mac
+                 + struct.pack(">HHH", message.id, error, len(other)) + other)
+        message.additional.append((self.name, TYPE_TSIG, CLASS_ANY, 0, rdata))
+        try:
+            return message.to_wire(), mac
+        finally:
+            message.additional.pop()
+
+    def verify(self, data: bytes, request_mac: bytes = b"") -> tuple:
+        """
+        校验报文末尾的 TSIG
+        :param data:        原始报文
+        :param request_mac: 校验响应时传入请求的 MAC
+        :return: (是否通过, 错误码, MAC)
+        """
+        message = Message.from_wire(data)
+        if message.tsig_offset is None:
+            return False, 16, b""
+        name, _, _, _, rdata = message.additional[-1]
+        algorithm, offset = decode_name(rdata, 0)
+        high, low, fudge, mac_size = struct.unpack_from(">HIHH", rdata, offset)
+        offset += 10
+        mac = rdata[offset:offset + mac_size]
+        original_id, error, other_len = struct.unpack_from(">HHH", rdata, offset + mac_size)
+        other = rdata[offset + mac_size + 6:offset + mac_size + 6 + other_len]
+        if name.lower() != self.name or algorithm.lower().rstrip(".") != self.algorithm_name:
+            return False, 17, b""
+        # 去掉 TSIG 记录，还原 ARCOUNT 和原始 ID 后计算 MAC
+        wire = bytearray(data[:message.tsig_offset])
+        struct.pack_into(">H", wire, 0, original_id)
+        struct.pack_into(">H", wire, 10, len(message.additional) - 1)
+        time_signed = (high << 32) | low
+        expected = self._mac(bytes(wire), request_mac, time_signed, fudge, error, other)
+        if not hmac.compare_digest(expected, mac):
+            return False, 16, mac
+        if abs(time.time() - time_signed) > fudge:
+            return False, 18, mac
+        return True, error, mac
+
+
+def exchange(wire: bytes, server: str, port: int = 53, timeout: float = 5, tcp: bool = False) -> bytes:
+    """发送报文并返回响应，超过 512 字节或指定 tcp 时使用 TCP，UDP 响应被截断（TC=1）时改用 TCP 重发"""
+    if tcp or len(wire) > 512:
+        with socket.create_connection((server, port), timeout=timeout) as sock:
+            sock.sendall(struct.pack(">H", len(wire)) + wire)
+            length = struct.unpack(">H", _recv_exact(sock, 2))[0]
+            return _recv_exact(sock, length)
+    family = socket.getaddrinfo(server, port, type=socket.SOCK_DGRAM)[0][0]
+    with socket.socket(family, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(wire, (server, port))
+        while True:
+            data, _ = sock.recvfrom(65535)
+            if data[:2] != wire[:2]:
+                continue
+            if len(data) > 2 and data[2] & 0x02:
+                break
+            return data
+    lg.debug(f"{server}:{port} 的 UDP 响应被截断，改用 TCP 重发")
+    return exchange(wire, server, port, timeout, tcp=True)
+
+
+def _recv_exact(sock, length: int) -> bytes:
+    data = b""
+    while len(data) < length:
+        chunk = sock.recv(length - len(data))
+        if not chunk:
+            raise DnsError("连接被关闭")
+        data += chunk
+    return data
+
+
+def build_update(zone: str, changes: dict, ttl: int) -> Message:
+    """
+    构造 UPDATE 报文
+    :param zone:    区域
+    :param changes: {完整记录名: [TXT 记录值]}，值为空列表时只删除
+    :param ttl:     新记录 TTL
+    """
+    message = Message(opcode=OPCODE_UPDATE)
+    message.question.append((zone, TYPE_SOA, CLASS_IN))
+    for name, values in changes.items():
+        message.authority.append((name, TYPE_TXT, CLASS_ANY, 0, b""))  # 删除整个 TXT 记录集
+        for value in values:
+            message.authority.append((name, TYPE_TXT, CLASS_IN, ttl, txt_rdata(value)))
+    return message
+
+
+class Rfc2136(DnsProvider):
+    """
+    RFC 2136 动态更新，适用于自建的 BIND / PowerDNS 等权威服务器
+    同一区域的多条记录合并到一个 TSIG 签名的 UPDATE 报文中，一次往返完成
+    """
+
+    name = "RFC2136"
+    multi_value_txt = True
+
+    def __init__(self):
+        super().__init__()
+        self.server = config.get_jsonpath('$.rfc2136.server', '127.0.0.1')
+        self.port = int(config.get_jsonpath('$.rfc2136.port', 53))
+        self.zones = config.get_jsonpath('$.rfc2136.zones', {}) or {}
+        self.ttl = int(config.get_jsonpath('$.rfc2136.ttl', 60))
+        self.timeout = float(config.get_jsonpath('$.rfc2136.timeout', 5))
+        self.tcp = bool(config.get_jsonpath('$.rfc2136.tcp', False))
+        key_name = config.get_jsonpath('$.rfc2136.key_name', '')
+        key_secret = config.get_jsonpath('$.rfc2136.key_secret', '')
+        self.key = TsigKey(key_name, key_secret, config.get_jsonpath('$.rfc2136.key_algorithm', 'hmac-sha256')) \
+            if key_name and key_secret else None
+
+    def zone_for(self, domain: str) -> str:
+        """域名所在区域，未配置时使用域名本身"""
+        return self.zones.get(domain, domain)
+
+    @traced("rfc2136.request", lambda args, kwargs: {"endpoint": "UPDATE" if args[1].opcode == OPCODE_UPDATE else "QUERY"})
+    def send(self, message: Message) -> Message:
+        """发送报文，配置了 TSIG 密钥时签名并校验响应签名"""
+        action = "UPDATE" if message.opcode == OPCODE_UPDATE else "QUERY"
+        request_mac = b""
+        if self.key:
+            wire, request_mac = self.key.sign(message)
+        else:
+            wire = message.to_wire()
+        start = time.perf_counter()
+        try:
+            with span("network", endpoint=action):
+                data = exchange(wire, self.server, self.port, self.timeout, self.tcp)
+        except (OSError, DnsError):
+            API_REQUESTS.inc(api="rfc2136", endpoint=action, status="error")
+            raise
+        finally:
+            API_LATENCY.observe(time.perf_counter() - start, api="rfc2136", endpoint=action)
+        response = Message.from_wire(data)
+        API_REQUESTS.inc(api="rfc2136", endpoint=action, status=RCODES.get(response.rcode, response.rcode))
+        if response.id != message.id or not response.is_response:
+            raise DnsError("响应与请求不匹配")
+        if self.key and response.tsig_offset is not None:
+            ok, error, _ = self.key.verify(data, request_mac)
+            if not ok:
+                raise DnsError(f"响应 TSIG 校验失败: {RCODES.get(error, error)}")
+        elif self.key and response.rcode == 0:
+            raise DnsError("响应缺少 TSIG 签名")
+        return response
+
+    def lookup(self, domain: str, name: str, record_type: str = "TXT") -> list:
+        fqdn = f"{name}.{domain}"
+        message = Message(flags=0x0100)
+        message.question.append((fqdn, RECORD_TYPES.get(record_type, TYPE_TXT), CLASS_IN))
+        try:
+            response = self.send(message)
+        except (OSError, DnsError) as e:
+            lg.error(f"查询 {fqdn} {record_type} 记录失败: {e}")
+            return []
+        return [{"id": None, "name": name, "type": record_type, "ttl": ttl, "line": "",
+                 "value": parse_txt_rdata(rdata) if rtype == TYPE_TXT else rdata.hex()}
+                for rname, rtype, _, ttl, rdata in response.answer
+                if rname.lower() == fqdn.lower() and rtype == RECORD_TYPES.get(record_type, TYPE_TXT)]
+
+    def update(self, zone: str, changes: dict) -> tuple:
+        """
+        向一个区域发送一次 UPDATE
+        :param changes: {完整记录名: [TXT 记录值]}
+        :return: (是否成功, 结果说明)
+        """
+        try:
+            response = self.send(build_update(zone, changes, self.ttl))
+        except (OSError, DnsError) as e:
+            return False, str(e)
+        except Exception:
+            lg.error(f"RFC2136 更新异常: {traceback.format_exc()}")
+            return False, "更新异常"
+        return response.rcode == 0, RCODES.get(response.rcode, str(response.rcode))
+
+    def upsert_txt(self, domain: str, name: str, value: str) -> bool:
+        return self.upsert_txt_batch([(domain, name, value)])[(domain, name)]
+
+    def upsert_txt_batch(self, items: list) -> dict:
+        """
+        按区域合并为 UPDATE 报文，同一个记录名的多个值（如泛域名和主域名同时验证）写入同一个记录集
+        """
+        zones = OrderedDict()
+        for domain, name, value in items:
+            zones.setdefault(self.zone_for(domain), OrderedDict()).setdefault(f"{name}.{domain}", []).append(value)
+
+        results = {}
+        for zone, changes in zones.items():
+            ok, text = self.update(zone, changes)
+            if ok:
+                lg.info(f"RFC2136 区域 {zone} 更新 {len(changes)} 条 TXT 记录成功")
+            else:
+                lg.error(f"RFC2136 区域 {zone} 更新 {len(changes)} 条 TXT 记录失败，原因：{text}")
+            for domain, name, _ in items:
+                if self.zone_for(domain) == zone:
+                    results[(domain, name)] = ok
+        return results
+
+    def delete_txt(self, domain: str, name: str) -> bool:
+        ok, text = self.update(self.zone_for(domain), {f"{name}.{domain}": []})
+        if not ok:
+            lg.error(f"RFC2136 删除 {name}.{domain} TXT 记录失败，原因：{text}")
+        return ok
@@ -0,0 +1,213 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 20:05
+# Email: leiyong711@163.com
+
+"""
+verify_the_certificate 离线基准测试
+在本机启动证书平台和 DNSPod 桩服务，生成指定数量的域名，统计耗时、接口调用次数和内存峰值
+
+    python -m benchmarks.bench_verify --sizes 10 100 1000 --latency 0.02
+    python -m benchmarks.bench_verify --baseline reports/benchmarks/bench_xxx.json  # 与基线比较，超出容差时退出码为 1
+"""
+
+import os
+import gc
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+
+SECRET_ID = "AKIDbenchmark"
+SECRET_KEY = "benchmark-secret-key"
+USER_NAME = "benchmark"
+ZONE = "example.com"
+CHALLENGE_ZONE = "acme.example.net"  # --delegation 使用的验证区域
+TSIG_KEY_NAME = "benchmark-key"
+TSIG_SECRET = "YmVuY2htYXJrLXRzaWctc2VjcmV0LWtleS0wMTIzNDU="
+NON_REQUEST_COUNTERS = ("records", "tsig_failures")  # 桩服务中不代表请求次数的计数
+
+
+def prepare_environment() -> str:
+    """
+    配置目录和运行时数据（状态、证书包缓存、临时文件、日志）都指向临时目录，避免读写本机的 config.yml 和程序目录
+    必须在导入项目模块之前调用，结果报告仍写到 程序目录/reports/benchmarks
+    """
+    tmp = tempfile.mkdtemp(prefix="ssl-bench-")
+    os.environ["PLUGIN_CONFIG"] = tmp
+    from utils import constants
+    constants.set_data_root(tmp)
+    return tmp
+
+
+def domain_config(domains: list, tmp: str, provider: str) -> dict:
+    return {
+        domain.replace(".", "@"): {
+            "domain": domain,
+            "apply_for_days_in_advance": 3,
+            "second_verification_method": "DNS",
+            "dns_service_providers": provider,
+            "ssl_deployment_path": os.path.join(tmp, "ssl", domain),
+        }
+        for domain in domains
+    }
+
+
+def run_once(app, stubs: dict, memory: bool) -> dict:
+    for stub in stubs.values():
+        stub.reset()
+    app.scheduler.remove_all_jobs()
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    start, cpu_start = time.perf_counter(), time.process_time()
+    app.verify_the_certificate(job_name="SSL证书验证")
+    result = {"wall_s": time.perf_counter() - start, "cpu_s": time.process_time() - cpu_start}
+    if memory:
+        result["peak_mb"] = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+        tracemalloc.stop()
+    result["calls"] = {name: dict(stub.calls) for name, stub in stubs.items()}
+    result["total_calls"] = sum(v for stub in stubs.values() for k, v in stub.calls.items() if k not in NON_REQUEST_COUNTERS)
+    return result
+
+
+def run(args, tmp: str) -> list:
+    from benchmarks.stub_servers import Behaviour, PlatformStub, DnspodStub, Rfc2136Stub
+    import main as app
+    from app.qcloud_v3 import Qcloud, TC3Signer
+    from app.rfc2136 import TsigKey
+    from app.dns_provider import get_provider
+    from app.dns_delegation import delegation
+    from utils.log import lg
+    from utils.user_limiter import user_limiter
+    from utils.run_state import run_state
+    from utils.wx_noti import dispatcher
+
+    lg.remove(0)
+    lg.add(sys.stderr, level=args.log_level)
+
+    behaviour = lambda: Behaviour(args.latency, args.jitter, args.error_rate, args.rate_limit)
+    tsig_key = TsigKey(TSIG_KEY_NAME, TSIG_SECRET)
+    stubs = {
+        "platform": PlatformStub(behaviour()).start(),
+        "dnspod": DnspodStub(SECRET_ID, SECRET_KEY, behaviour()).start(),
+        "rfc2136": Rfc2136Stub([ZONE, CHALLENGE_ZONE], tsig_key, behaviour()).start(),
+    }
+    platform, dnspod = stubs["platform"], stubs["dnspod"]
+
+    # 全部接口指向桩服务，Host 头和签名仍使用 dnspod.tencentcloudapi.com
+    app.config.config["we_chat_noti"]["wx_noti_host"] = platform.url
+    app.let_api.api_host = platform.url
+    app.let_api.token, app.let_api.user_name = "benchmark", USER_NAME
+    qcloud = get_provider("Qcloud")
+    qcloud.endpoint = dnspod.url
+    qcloud.secret_id, qcloud.secret_key = SECRET_ID, SECRET_KEY
+    qcloud.signer = TC3Signer(SECRET_ID, SECRET_KEY, Qcloud.service, Qcloud.host, Qcloud.region)
+    rfc2136 = get_provider("RFC2136")
+    rfc2136.server, rfc2136.port, rfc2136.key = "127.0.0.1", stubs["rfc2136"].port, tsig_key
+    if args.delegation:
+        # 验证记录全部写入 RFC2136 桩上的验证区域，不再调用各域名的 DNS 服务商
+        delegation.enabled, delegation.zone, delegation.provider_name = True, CHALLENGE_ZONE, "RFC2136"
+    user_limiter.set_user_type(USER_NAME, "svip")
+    if not args.real_limits:
+        # 平台真实的 1 次/秒 限制会让 1000 个域名跑十几分钟，默认关闭，只测本程序自身的开销
+        user_limiter.rate_limit_interval = 0
+
+    results = []
+    try:
+        for size in args.sizes:
+            domains = [f"bench{i:05d}.{ZONE}" for i in range(size)]
+            # 即将过期的域名放在最后，verify_the_certificate 处理到第一个需要续期的域名就会返回
+            expiring = set(domains[size - int(size * args.expiring):]) if args.expiring else set()
+            platform.add_domains(domains, expiring=expiring)
+            dnspod.add_domains(domains)
+            qcloud.records.clear()
+            rfc2136.zones = {domain: ZONE for domain in domains}
+            delegation.published.clear()
+            app.config.config["domain_list"] = domain_config(domains, tmp, args.provider)
+            run_state.store.data = {"domains": {}, "events": [], "quota": {}}
+
+            timing = run_once(app, stubs, memory=False)
+            platform.add_domains(domains, expiring=expiring)
+            memory = run_once(app, stubs, memory=True)
+            timing.update({
+                "domains": size,
+                "per_domain_ms": timing["wall_s"] / size * 1000,
+                "peak_mb": memory["peak_mb"],
+                "signature_failures": dnspod.signature_failures + stubs["rfc2136"].calls["tsig_failures"],
+            })
+            results.append(timing)
+            print(f"{size:>6} 个域名  耗时 {timing['wall_s']:>8.3f}s  CPU {timing['cpu_s']:>8.3f}s  "
+                  f"单域名 {timing['per_domain_ms']:>7.2f}ms  接口调用 {timing['total_calls']:>6}  "
+                  f"内存峰值 {timing['peak_mb']:>7.2f}MB", flush=True)
+    finally:
+        app.scheduler.remove_all_jobs()
+        dispatcher.flush()
+        for stub in stubs.values():
+            stub.stop()
+    return results
+
+
+def compare(results: list, baseline_path: str, tolerance: float) -> list:
+    """与基线比较，耗时和内存峰值超出容差、接口调用次数增加都视为退化"""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = {i["domains"]: i for i in json.load(f)["results"]}
+    regressions = []
+    for item in results:
+        old = baseline.get(item["domains"])
+        if not old:
+            continue
+        for key in ("wall_s", "peak_mb"):
+            if item[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{item['domains']} 个域名 {key}: {old[key]:.3f} -> {item[key]:.3f}")
+        if item["total_calls"] > old["total_calls"]:
+            regressions.append(f"{item['domains']} 个域名 接口调用次数: {old['total_calls']} -> {item['total_calls']}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="verify_the_certificate 离线基准测试")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000], help="域名数量")
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务每个请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩服务随机延迟上限（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务返回 500 的概率")
+    parser.add_argument("--rate-limit", type=float, default=0, help="桩服务每秒允许的请求数，0 为不限制")
+    parser.add_argument("--expiring", type=float, default=0.0, help="即将过期、需要 DNS 验证的域名比例")
+    parser.add_argument("--delegation", action="store_true", help="开启 CNAME 委派验证，验证记录批量写入验证区域")
+    parser.add_argument("--provider", default="Qcloud", choices=["Qcloud", "RFC2136"], help="域名使用的 DNS 服务商")
+    parser.add_argument("--real-limits", action="store_true", help="保留证书平台 1 次/秒 的客户端限流")
+    parser.add_argument("--log-level", default="WARNING", help="控制台日志级别")
+    parser.add_argument("--output", default="", help="结果 JSON 路径，默认 程序目录/reports/benchmarks/")
+    parser.add_argument("--baseline", default="", help="基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="耗时和内存允许的退化比例")
+    args = parser.parse_args(argv)
+
+    tmp = prepare_environment()
+    try:
+        results = run(args, tmp)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    from utils.constants import REPORT_PATH
+    output = args.output or os.path.join(REPORT_PATH, "benchmarks", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({"args": vars(args), "python": sys.version.split()[0], "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for i in regressions:
+            print(f"性能退化: {i}")
+        if regressions:
+            sys.exit(1)
+        print("与基线相比没有性能退化")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,431 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 19:40
+# Email: leiyong711@163.com
+
+import io
+import json
+import time
+import hmac
+import random
+import struct
+import hashlib
+import zipfile
+import threading
+from datetime import datetime, timedelta
+from collections import Counter
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingUDPServer, ThreadingTCPServer, BaseRequestHandler
+
+
+class Behaviour:
+    """
+    桩服务的网络表现
+    :param latency:    每个请求的固定延迟（秒）
+    :param jitter:     在固定延迟上增加的随机延迟上限（秒）
+    :param error_rate: 返回 HTTP 500 的概率 0-1
+    :param rate_limit: 每秒允许的请求数，超过后返回限流错误，0 为不限制
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0, rate_limit: float = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.tokens = rate_limit
+        self.updated = time.monotonic()
+        self.random = random.Random(0)
+
+    def delay(self) -> None:
+        if self.latency or self.jitter:
+            with self.lock:
+                extra = self.random.uniform(0, self.jitter) if self.jitter else 0
+            time.sleep(self.latency + extra)
+
+    def should_fail(self) -> bool:
+        if not self.error_rate:
+            return False
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def limited(self) -> bool:
+        """令牌桶限流，返回 True 表示本次请求被限流"""
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate_limit, self.tokens + (now - self.updated) * self.rate_limit)
+            self.updated = now
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+
+class StubServer:
+    """桩服务基类，在后台线程监听 127.0.0.1 的随机端口，并按接口统计调用次数"""
+
+    def __init__(self, behaviour: Behaviour = None):
+        self.behaviour = behaviour or Behaviour()
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.calls[name] += 1
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name=type(self).__name__, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, method: str, path: str, query: dict, headers, body: bytes) -> tuple:
+        """:return: (状态码, Content-Type, 响应内容)"""
+        raise NotImplementedError
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _serve(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                stub.behaviour.delay()
+                if stub.behaviour.should_fail():
+                    status, content_type, data = 500, "text/plain", b"stub error"
+                else:
+                    status, content_type, data = stub.handle(self.command, parsed.path, query, self.headers, body)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = _serve
+            do_POST = _serve
+
+            def log_message(self, format, *args):
+                ...
+
+        return Handler
+
+
+def _json(data) -> tuple:
+    return 200, "application/json", json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class PlatformStub(StubServer):
+    """
+    证书签发平台 /api/user/Order/* 与 /api/user/OrderDetail/* 接口桩
+    证书按 域名 生成，状态和到期时间可按域名设置；其它 POST 请求（微信通知）直接返回成功
+    """
+
+    PAGE_SIZE = 10
+
+    def __init__(self, behaviour: Behaviour = None, bundle: dict = None):
+        """
+        :param bundle: 下载接口返回的证书文件 {文件名: bytes}，为空时下载接口返回错误
+        """
+        super().__init__(behaviour)
+        self.orders = {}
+        self.bundle = bundle or {}
+
+    def add_domains(self, domains: list, expiring: set = (), days: int = 60) -> None:
+        """
+        :param domains:  域名列表
+        :param expiring: 即将过期、处于 待验证 状态的域名
+        :param days:     其它域名证书剩余天数
+        """
+        self.orders.clear()
+        for index, domain in enumerate(domains):
+            cert_id = f"c{index:06d}"
+            soon = domain in expiring
+            self.orders[cert_id] = {
+                "id": cert_id,
+                "domains": [domain],
+                "mark": "",
+                "acme": "lets",
+                "time_add": (datetime.now() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S"),
+                "time_end": (datetime.now() + timedelta(days=1 if soon else days)).strftime("%Y-%m-%d %H:%M:%S"),
+                "status": 4 if soon else 1,
+                "status_name": "待验证" if soon else "完成",
+                "auto_status": 0,
+                "quicker": "no",
+            }
+
+    def _detail(self, cert_id: str) -> dict:
+        order = dict(self.orders[cert_id])
+        domain = order["domains"][0]
+        if order["status_name"] == "待验证":
+            order["verify_data"] = [{
+                "domain": domain,
+                "id": f"v{cert_id}",
+                "check": {"dns-01": {"type": "dns-01", "dns": f"_acme-challenge.{domain}",
+                                     "txt": hashlib.sha256(cert_id.encode()).hexdigest()[:43]}},
+            }]
+        return order
+
+    def _download(self) -> bytes:
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+            for name, data in self.bundle.items():
+                zf.writestr(name, data)
+        return buffer.getvalue()
+
+    def handle(self, method, path, query, headers, body):
+        if not path.startswith("/api/user/"):
+            self.count("noti")
+            return _json({"code": 200, "message": "ok"})
+        self.count(path)
+        if self.behaviour.limited():
+            return _json({"isError": True, "isOk": False, "error": "请求过于频繁，请稍后再试"})
+
+        ok = lambda data, msg="": _json({"isError": False, "isOk": True, "msg": msg, "data": data})
+        cert_id = query.get("id", "")
+        if path == "/api/user/Account/info":
+            return ok({"user_type": "svip", "email": "bench@example.com"})
+        if path == "/api/user/Order/list":
+            page = int(query.get("page", 1))
+            items = list(self.orders.values())[(page - 1) * self.PAGE_SIZE: page * self.PAGE_SIZE]
+            return ok({"all": len(self.orders), "pnum": self.PAGE_SIZE, "list": items})
+        if path == "/api/user/Order/apply":
+            return ok(f"c{len(self.orders):06d}")
+        if cert_id not in self.orders:
+            return _json({"isError": True, "isOk": False, "error": f"证书 {cert_id} 不存在"})
+        if path == "/api/user/OrderDetail/info":
+            return ok(self._detail(cert_id))
+        if path == "/api/user/OrderDetail/renew":
+            return ok(cert_id)
+        if path == "/api/user/OrderDetail/verify":
+            self.orders[cert_id]["status_name"] = "验证中"
+            return ok("", msg="提交成功,验证中")
+        if path == "/api/user/OrderDetail/down":
+            if not self.bundle:
+                return _json({"isError": True, "isOk": False, "error": "证书不可下载"})
+            return 200, "application/zip", self._download()
+        return 404, "text/plain", b"not found"
+
+
+class DnspodStub(StubServer):
+    """
+    DNSPod DescribeRecordList / ModifyRecord 接口桩
+    按 TC3-HMAC-SHA256 规则重新计算签名并与请求中的签名比对，签名错误返回 AuthFailure.SignatureFailure
+    """
+
+    host = "dnspod.tencentcloudapi.com"
+    service = "dnspod"
+
+    def __init__(self, secret_id: str, secret_key: str, behaviour: Behaviour = None):
+        super().__init__(behaviour)
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.records = {}
+        self.signature_failures = 0
+
+    def add_domains(self, domains: list) -> None:
+        self.records = {domain: [{"RecordId": index + 1, "Name": "_acme-challenge", "Type": "TXT", "Line": "默认",
+                                  "Value": "placeholder", "TTL": 600}]
+                        for index, domain in enumerate(domains)}
+
+    def verify_signature(self, headers, body: bytes) -> bool:
+        try:
+            authorization = headers.get("Authorization", "")
+            algorithm, rest = authorization.split(" ", 1)
+            fields = dict(i.strip().split("=", 1) for i in rest.split(","))
+            secret_id, date, service, _ = fields["Credential"].split("/")
+            action = headers.get("X-TC-Action", "")
+            canonical_headers = f"content-type:{headers.get('Content-Type', '')}\nhost:{self.host}\nx-tc-action:{action.lower()}\n"
+            canonical_request = "\n".join(["POST", "/", "", canonical_headers, fields["SignedHeaders"],
+                                           hashlib.sha256(body).hexdigest()])
+            string_to_sign = "\n".join([algorithm, headers.get("X-TC-Timestamp", ""), f"{date}/{service}/tc3_request",
+                                        hashlib.sha256(canonical_request.encode("utf-8")).hexdigest()])
+            sign = lambda key, msg: hmac.new(key, msg.encode("utf-8"), hashlib.sha256).digest()
+            key = sign(sign(sign(("TC3" + self.secret_key).encode("utf-8"), date), service), "tc3_request")
+            expected = hmac.new(key, string_to_sign.encode("utf-8"), hashlib.sha256).hexdigest()
+            return secret_id == self.secret_id and hmac.compare_digest(expected, fields["Signature"])
+        except (ValueError, KeyError):
+            return False
+
+    def handle(self, method, path, query, headers, body):
+        action = headers.get("X-TC-Action", "")
+        self.count(action)
+        error = lambda code, message: _json({"Response": {"Error": {"Code": code, "Message": message}, "RequestId": "stub"}})
+        if self.behaviour.limited():
+            return error("RequestLimitExceeded", "请求的次数超过了频率限制")
+        if not self.verify_signature(headers, body):
+            with self.lock:
+                self.signature_failures += 1
+            return error("AuthFailure.SignatureFailure", "请求签名验证失败")
+
+        params = json.loads(body or b"{}")
+        records = self.records.get(params.get("Domain"))
+        if records is None:
+            return error("ResourceNotFound.NoDataOfRecord", "记录列表为空")
+        if action == "DescribeRecordList":
+            return _json({"Response": {"RecordCountInfo": {"TotalCount": len(records)}, "RecordList": records,
+                                       "RequestId": "stub"}})
+        if action == "ModifyRecord":
+            for record in records:
+                if record["RecordId"] == params.get("RecordId"):
+                    record["Value"] = params.get("Value")
+                    return _json({"Response": {"RecordId": record["RecordId"], "RequestId": "stub"}})
+            return error("InvalidParameter.RecordIdInvalid", "记录ID错误")
+        return error("InvalidAction", f"接口 {action} 不存在")
+
+
+class Rfc2136Stub:
+    """
+    自建权威 DNS 桩，支持 TSIG 签名的 RFC 2136 UPDATE 和 TXT 查询，UDP/TCP 监听同一端口
+    统计 UPDATE 报文数量和更新的记录数，用于验证批量合并效果
+    """
+
+    def __init__(self, zones: list, key=None, behaviour: Behaviour = None):
+        """
+        :param zones: 权威区域列表
+        :param key:   app.rfc2136.TsigKey，为空时不校验签名
+        """
+        from app import rfc2136
+        self.dns = rfc2136
+        self.zones = {z.rstrip(".").lower() for z in zones}
+        self.key = key
+        self.behaviour = behaviour or Behaviour()
+        self.records = {}
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        stub = self
+
+        class UdpHandler(BaseRequestHandler):
+            def handle(self):
+                data, sock = self.request
+                response = stub.respond(data)
+                if response:
+                    sock.sendto(response, self.client_address)
+
+        class TcpHandler(BaseRequestHandler):
+            def handle(self):
+                header = self.request.recv(2)
+                if len(header) < 2:
+                    return
+                length = struct.unpack(">H", header)[0]
+                data = b""
+                while len(data) < length:
+                    chunk = self.request.recv(length - len(data))
+                    if not chunk:
+                        return
+                    data += chunk
+                response = stub.respond(data)
+                if response:
+                    self.request.sendall(struct.pack(">H", len(response)) + response)
+
+        self.udp = ThreadingUDPServer(("127.0.0.1", 0), UdpHandler)
+        self.port = self.udp.server_address[1]
+        ThreadingTCPServer.allow_reuse_address = True
+        self.tcp = ThreadingTCPServer(("127.0.0.1", self.port), TcpHandler)
+        self.udp.daemon_threads = self.tcp.daemon_threads = True
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self.lock:
+            self.calls[name] += amount
+
+    def reset(self) -> None:
+        with self.lock:
+            self.calls.clear()
+
+    def start(self):
+        for server in (self.udp, self.tcp):
+            threading.Thread(target=server.serve_forever, name=type(self).__name__, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        for server in (self.udp, self.tcp):
+            server.shutdown()
+            server.server_close()
+
+    def _zone_of(self, name: str) -> str:
+        name = name.rstrip(".").lower()
+        for zone in self.zones:
+            if name == zone or name.endswith("." + zone):
+                return zone
+        return ""
+
+    def _reply(self, request, rcode: int, answer: list = (), request_mac: bytes = b"", tsig_error: int = 0) -> bytes:
+        response = self.dns.Message(request.id, request.opcode, flags=0x8000 | 0x0400 | rcode)
+        response.question = list(request.question)
+        response.answer = list(answer)
+        if self.key and request.tsig_offset is not None and tsig_error not in (16, 17):
+            return self.key.sign(response, request_mac, tsig_error)[0]
+        return response.to_wire()
+
+    def respond(self, data: bytes) -> bytes:
+        dns = self.dns
+        try:
+            request = dns.Message.from_wire(data)
+        except dns.DnsError:
+            return b""
+        self.behaviour.delay()
+        request_mac = b""
+        if self.key:
+            ok, error, request_mac = self.key.verify(data) if request.tsig_offset is not None else (False, 16, b"")
+            if not ok and request.opcode == dns.OPCODE_UPDATE:
+                self.count("tsig_failures")
+                return self._reply(request, 9, request_mac=request_mac, tsig_error=error)
+
+        if request.opcode == dns.OPCODE_QUERY:
+            self.count("QUERY")
+            name, rtype, _ = request.question[0]
+            with self.lock:
+                values = list(self.records.get(name.rstrip(".").lower(), []))
+            answer = [(name, dns.TYPE_TXT, dns.CLASS_IN, 60, dns.txt_rdata(v)) for v in values] if rtype == dns.TYPE_TXT else []
+            return self._reply(request, 0 if values or self._zone_of(name) else 5, answer, request_mac)
+
+        if request.opcode != dns.OPCODE_UPDATE:
+            return self._reply(request, 4, request_mac=request_mac)
+        self.count("UPDATE")
+        if self.behaviour.limited():
+            return self._reply(request, 5, request_mac=request_mac)
+        if self.behaviour.should_fail():
+            return self._reply(request, 2, request_mac=request_mac)
+        zone = request.question[0][0].rstrip(".").lower() if request.question else ""
+        if zone not in self.zones:
+            return self._reply(request, 9, request_mac=request_mac)
+        for name, rtype, rclass, _, rdata in request.authority:
+            if self._zone_of(name) != zone:
+                return self._reply(request, 10, request_mac=request_mac)
+
+        with self.lock:
+            for name, rtype, rclass, _, rdata in request.authority:
+                if rtype != dns.TYPE_TXT:
+                    continue
+                key = name.rstrip(".").lower()
+                if rclass == dns.CLASS_ANY:
+                    self.records.pop(key, None)
+                elif rclass == dns.CLASS_NONE:
+                    value = dns.parse_txt_rdata(rdata)
+                    self.records[key] = [v for v in self.records.get(key, []) if v != value]
+                else:
+                    self.records.setdefault(key, []).append(dns.parse_txt_rdata(rdata))
+            self.calls["records"] += sum(1 for i in request.authority if i[2] == dns.CLASS_IN)
+        return self._reply(request, 0, request_mac=request_mac)
@@ -9,24 +9,42 @@ import os
 import re
 import time
 import traceback
-from utils.log import lg
+from utils.log import lg, setup_logging
 from utils.config import Config
 config = Config(True)
+setup_logging(config)
 
-from app.qcloud_v3 import Qcloud
+from app.dns_provider import set_txt_record
+from app.dns_delegation import delegation
 from utils.wx_noti import send_wx_noti
+from utils.digest import send_daily_digest
+from utils.metrics import track_job, start_metrics_server, SCHEDULER_JOBS
+from utils.tracing import traced, set_baggage
+from utils.profiling import profiled
+from utils.run_state import run_state, RENEW_STARTED, VALIDATION_STARTED, DEPLOYED, FAILED
 from datetime import datetime, timedelta
-from app.letsencrypt.api import LetsencryptAPI
+from app.letsencrypt.accounts import accounts
+from app.letsencrypt.channel import channel_policy, STALLED
+from app.letsencrypt.hedging import hedger
+from app.letsencrypt.dual import linked_orders, key_types, is_dual, combine
+from app.letsencrypt.bundle_store import bundle_store
+from app.letsencrypt.chain import chain_optimizer
+from app.letsencrypt.planner import renewal_planner
+from app.deploy.verify import verify_until_stable
+from app.deploy.ocsp import ocsp_stapler
+from app.deploy.ticket_keys import ticket_keys
+from utils.coordination import coordinator, leader_only
 from apscheduler.schedulers.blocking import BlockingScheduler
 from apscheduler.events import EVENT_JOB_MISSED, EVENT_JOB_ERROR, EVENT_JOB_EXECUTED
+from apscheduler.jobstores.base import JobLookupError
 
 
 
-let_api = LetsencryptAPI()
-qcloud = Qcloud()
+let_api = accounts.primary
 scheduler = BlockingScheduler(timezone='Asia/Shanghai', job_defaults={'coalesce': False, 'max_instances': 3})
 
 
+@traced("http_validation")
 def http_validation(acme_challenge: str, txt: str):
     """Nginx 配置修改"""
     old_acme_challenge = ""
@@ -71,42 +89,287 @@ def http_validation(acme_challenge: str, txt: str):
         return False
 
 
+def notify_failure(domain: str, msg: str):
+    """发送失败通知并记录到运行结果，日报据此统计失败"""
+    run_state.record_event(domain, FAILED, msg)
+    send_wx_noti(msg, types="error")
+
+
+@traced("nginx.restart")
+def restart_nginx():
+    """重启 Nginx 使新证书生效，等待中的合并重启一并完成"""
+    try:
+        scheduler.remove_job('重启Nginx')
+    except JobLookupError:
+        pass
+    lg.info(f"新证书配置成功，重启Nginx生效，即将停止 Nginx 服务")
+    os.system('net stop nginx')
+    time.sleep(6)
+    os.system('net start nginx')
+    lg.info(f"新证书配置成功，重启Nginx生效，开始启动 Nginx 服务")
+
+
+def request_reload(reason: str, delay: int = 300) -> None:
+    """
+    延迟重启 Nginx，延迟期间的多次请求和证书部署触发的重启合并为一次
+    :param reason: 重启原因
+    :param delay:  延迟秒数，已有等待中的重启时不再推迟
+    """
+    if scheduler.get_job('重启Nginx'):
+        return
+    lg.info(f"{reason}，{delay} 秒后重启 Nginx")
+    scheduler.add_job(restart_nginx, 'date', id='重启Nginx', run_date=datetime.now() + timedelta(seconds=delay))
+
+
+def refresh_ocsp():
+    """刷新所有域名的 OCSP 装订文件，有变化时合并重启 Nginx"""
+    domain_lists = {k: v for k, v in config.get_jsonpath("$.domain_list", {}).items() if coordinator.owns(v['domain'])}
+    if ocsp_stapler.refresh_all(domain_lists):
+        request_reload("OCSP 装订文件已更新", int(config.get_jsonpath('$.ocsp.reload_delay', 300)))
+
+
+@leader_only
+def rotate_ticket_keys():
+    """轮换会话票据密钥，密钥文件有变化时合并重启 Nginx"""
+    if ticket_keys.check():
+        request_reload("会话票据密钥已更新", int(config.get_jsonpath('$.session_tickets.reload_delay', 60)))
+
+
+def rollback_ssl(domain: str) -> bool:
+    """将域名证书回滚到本地缓存中的上一版本并重启 Nginx"""
+    key, bundle = bundle_store.rollback(domain)
+    if not bundle:
+        return False
+    deploy_status, changed, targets = let_api.deploy_ssl(bundle, domain)
+    if not deploy_status:
+        failed = "\n".join(str(i) for i in targets if not i.ok)
+        notify_failure(domain, f"域名 {domain} SSL证书回滚部署失败，失败的部署目标:\n{failed}")
+        return False
+    bundle_store.commit_rollback(domain, key)
+    if changed:
+        restart_nginx()
+        verify_after_reload({domain: bundle.fingerprint}, rollback=False)
+    send_wx_noti(f"域名 {domain} SSL证书已回滚到上一版本", types="warning")
+    return True
+
+
+def verify_after_reload(deployed: dict, rollback: bool = True) -> bool:
+    """
+    重启后并发与所有域名进行 TLS 握手，确认实际提供的证书与部署的证书一致
+    :param deployed: 本次部署的域名 {域名: 叶子证书指纹}，这些域名证书不一致时自动回滚
+    :param rollback: 是否自动回滚
+    :return: 是否全部一致
+    """
+    if not config.get_jsonpath('$.tls_verify.enabled', False):
+        return True
+
+    expectations = {}
+    for conf in config.get_jsonpath("$.domain_list", {}).values():
+        fingerprint = deployed.get(conf['domain']) or bundle_store.current_fingerprint(conf['domain'])
+        if fingerprint:
+            expectations[conf['domain']] = (conf, fingerprint)
+    results = verify_until_stable(expectations)
+
+    all_ok = True
+    for domain, items in results.items():
+        failed = [i for i in items if not i.ok]
+        if not failed:
+            continue
+        all_ok = False
+        detail = "\n".join(str(i) for i in failed)
+        mismatch = any(i.fingerprint and not i.error for i in failed)
+        if rollback and mismatch and domain in deployed:
+            notify_failure(domain, f"域名 {domain} 新证书握手校验不一致，开始回滚到上一版本:\n{detail}")
+            rollback_ssl(domain)
+        else:
+            send_wx_noti(f"域名 {domain} TLS 握手校验失败:\n{detail}", types="warning")
+    return all_ok
+
+
+def set_challenge_record(domain_conf: dict, txt: str) -> bool:
+    """写入 DNS 验证记录，委派域名写入验证区域，其余写入域名自身的 DNS 服务商"""
+    if delegation.is_delegated(domain_conf):
+        return delegation.set_txt_record(domain_conf, txt)
+    return set_txt_record(domain_conf.get("dns_service_providers", ''), domain_conf['domain'], txt)
+
+
+def dns_challenge_txt(k: str, order_info: dict) -> list:
+    """订单中需要通过 DNS 验证的记录值"""
+    values = []
+    for verify in order_info.get('verify_data', []):
+        if len(verify['check']) == 1 or config.get_jsonpath(f'$.domain_list.{k}.second_verification_method') == 'DNS':
+            if 'dns-01' in verify['check']:
+                values.append(verify['check']['dns-01']['txt'])
+    return values
+
+
+def secondary_orders() -> set:
+    """同一域名的其它订单（关联订单、进行中的独立通道和对冲订单），不作为域名的主订单"""
+    return linked_orders.cert_ids() | channel_policy.cert_ids() | hedger.cert_ids()
+
+
+def publish_delegated_challenges(let_order_lists: dict, domain_lists: dict) -> dict:
+    """
+    委派域名中处于 待验证 状态的订单，先把全部验证记录一次性写入验证区域，后续逐个域名验证时不再单独修改 DNS
+    :return: {证书ID: 证书详情}，供后续循环复用，避免重复查询
+    """
+    order_infos = {}
+    items = []
+    for k, v in domain_lists.items():
+        order = let_order_lists.get(v['domain'], {})
+        if not order.get('id') or order.get('status_name') != "待验证" or not delegation.is_delegated(v):
+            continue
+        order_info = accounts.account_for(v['domain'], v).certificate_details(order['id'])
+        if not order_info:
+            continue
+        order_infos[order['id']] = order_info
+        items.extend((v, txt) for txt in dns_challenge_txt(k, order_info))
+    if items:
+        delegation.publish(items)
+    return order_infos
+
+
+def fetch_bundle(api, cert_id: str, time_end: str, domain: str = ""):
+    """优先使用本地缓存的证书包，缓存中没有当前证书时才下载，下载后优化证书链并存入缓存"""
+    bundle = bundle_store.lookup(cert_id, time_end)
+    if bundle:
+        return bundle
+    bundle = api.certificate_download(cert_id=cert_id)    # 下载证书
+    if bundle:
+        if chain_optimizer.enabled:
+            bundle = chain_optimizer.optimize(domain or cert_id, bundle)
+        bundle_store.put(bundle, time_end=time_end)
+    return bundle
+
+
+def advance_linked_orders(api, k: str, v: dict, order: dict, apply_for_days_in_advance: int):
+    """
+    双证书域名推进关联订单（其它算法的订单），主订单已签发完成后再验证，DNS 验证记录不会互相覆盖
+    关联订单超过 linked_timeout_minutes 仍未签发时不再等待，通知后先部署已签发的证书，关联订单在之后的每日检查中补齐
+    :param api:   域名绑定的账号
+    :param order: 证书列表中的主订单
+    :return: {算法: CertBundle}（不含超时未签发的算法），仍有未超时的订单未签发完成时返回 None
+    """
+    linked = linked_orders.ensure(api, v, order)
+    statuses = linked_orders.statuses(api, v, apply_for_days_in_advance)
+    waiting = [key_type for key_type in key_types(v)[1:] if key_type not in linked]
+    for key_type, linked_id, info, done in statuses:
+        if done:
+            continue
+        waiting.append(key_type)
+        if info.get('status_name') == "验证中":
+            continue
+        if info.get('status_name') != "待验证":
+            # 即将过期或申请失败的关联订单（如主证书改走独立通道续期，关联订单没有一起重新申请）单独重新申请
+            linked_orders.renew(api, v, [key_type])
+            continue
+        for verify in info.get('verify_data', []):
+            check = verify['check'].get('dns-01')
+            if not check:
+                lg.error(f"域名 {v['domain']} {key_type} 关联证书没有 DNS 验证方式，请手动验证")
+                continue
+            if set_challenge_record(v, check['txt']) and accounts.client_of(linked_id, api).certificate_validation(linked_id, f"{verify['id']}:{check['type']}"):
+                lg.info(f"域名 {v['domain']} {key_type} 关联证书开始进行 DNS 所有权验证")
+            break  # 同一时间只保留一个验证记录值，一次提交一个
+    if any(not linked_orders.overdue(v['domain'], key_type) for key_type in waiting):
+        lg.info(f"域名 {v['domain']} 等待 {'/'.join(waiting)} 关联证书签发完成后一起部署")
+        scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
+        return None
+    if waiting and linked_orders.mark_notified(v['domain'], waiting):
+        notify_failure(v['domain'], f"域名 {v['domain']} {'/'.join(waiting)} 关联证书超过 {linked_orders.timeout / 60:g} 分钟未签发，"
+                                    f"先部署已签发的证书，关联证书签发后在每日检查中补齐部署")
+
+    bundles = {}
+    for key_type, linked_id, info, done in statuses:
+        if not done:
+            continue
+        bundle = fetch_bundle(accounts.client_of(linked_id, api), linked_id, info['time_end'], v['domain'])
+        if not bundle:
+            notify_failure(v['domain'], f"域名 {v['domain']} {key_type} 关联证书下载或完整性校验失败，请检查日志")
+            return None
+        bundles[key_type] = bundle
+    return bundles
+
+
+def renew_via_channel(api, k: str, v: dict, order: dict, days_difference: int, stalled_only: bool = False) -> bool:
+    """
+    临近过期或共享通道卡住时，改用独立通道申请证书
+    :param api:          域名绑定的账号
+    :param order:        证书列表中的原订单
+    :param stalled_only: 只在共享通道卡住时使用（验证中的订单）
+    :return: 是否已通过独立通道申请
+    """
+    renew_started_at = run_state.domains().get(v['domain'], {}).get('renew_started_at')
+    reason = channel_policy.reason(v['domain'], days_difference, renew_started_at)
+    if not reason or (stalled_only and reason != STALLED):
+        return False
+    status, text = channel_policy.apply(api, v['domain'], order, reason, v.get('algorithm', 'RSA'))
+    if not status:
+        return False
+    if not renew_started_at:
+        run_state.record_event(v['domain'], RENEW_STARTED, f"独立通道 {reason}")
+    reason_text = "共享通道长时间未完成" if reason == STALLED else f"证书剩余 {days_difference} 天"
+    send_wx_noti(f"域名 {v['domain']} {reason_text}，已改用独立通道申请证书", types="warning")
+    scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
+    return True
+
+
+@profiled
+@track_job
+@traced("verify_the_certificate", lambda args, kwargs: {"job_name": kwargs.get("job_name", "")})
 def verify_the_certificate(**kwargs):
     """验证SSL证书"""
     lg.info(f"{kwargs.get('job_name')}")
+    if not coordinator.active():
+        lg.info(f"实例 {coordinator.node} 不是 leader，跳过本次证书检查")
+        return
     try:
-        # 获取SSL证书列表
-        order_list = let_api.order_list()
-        # lg.debug(order_list)
+        # 获取所有账号的SSL证书列表
+        let_order_lists = accounts.order_lists(secondary_orders())
         
-        # 检查order_list是否为空或无效
-        if not order_list:
+        # 检查证书列表是否为空或无效
+        if not let_order_lists:
             lg.error("获取SSL证书列表失败，API返回空数据")
             return
             
-        let_order_lists = {i['domains'][0].replace("*.", ""): i for i in order_list}
         # lg.debug(let_order_lists)
 
         # 获取域名配置文件列表
         domain_lists = config.get_jsonpath("$.domain_list", {})
+        order_infos = {}
+        if delegation.enabled and not kwargs.get('v'):
+            # 多实例时只为归本实例的域名写入验证记录，与后面逐个域名处理的范围一致
+            owned = {k: v for k, v in domain_lists.items() if coordinator.owns(v['domain'])}
+            order_infos = publish_delegated_challenges(let_order_lists, owned)
         for k, v in domain_lists.items():
 
             k = kwargs.get('k') if kwargs.get('k', '') else k
             v = kwargs.get('v') if kwargs.get('v', {}) else v
 
+            # 多实例时只处理归本实例的域名
+            if not coordinator.claim(v['domain']):
+                continue
+
             # 排除SSL证书平台与配置文件中的不一致域名
             cert_id = let_order_lists.get(v['domain'], {}).get('id', '')
             if not cert_id:
                 lg.warning(f"域名 {v['domain']} 在SSL证书平台中未找到对应的证书ID")
                 continue
+            cert_id = hedger.order_for(v['domain'], cert_id)  # 多 CA 对冲中的订单
+            cert_id = channel_policy.order_for(v['domain'], cert_id)  # 进行中的独立通道订单优先
+            set_baggage(domain=v['domain'], cert_id=cert_id)
+            account = accounts.account_for(v['domain'], v)  # 域名绑定的证书平台账号
+            api = accounts.client_of(cert_id, account)  # 订单所在的账号，新订单可能由其它账号申请
 
             # 获取SSL证书详情
-            order_info = let_api.certificate_details(cert_id)
+            order_info = order_infos.pop(cert_id, None) or api.certificate_details(cert_id)
             
             # 检查order_info是否为空或无效
             if not order_info:
                 lg.error(f"获取域名 {v['domain']} 的SSL证书详情失败，API返回空数据")
                 continue
+            cert_id, order_info = hedger.pick(account, v['domain'], cert_id, order_info)  # 对冲订单中最先签发的
+            api = accounts.client_of(cert_id, account)
                 
             # 检查time_end字段是否存在
             if 'time_end' not in order_info:
@@ -127,26 +390,79 @@ def verify_the_certificate(**kwargs):
 
             # SSL证书提前续申请天数
             apply_for_days_in_advance = v.get("apply_for_days_in_advance", 3)
+            run_state.record_check(v['domain'], days_difference, order_info['time_end'], order_info.get('status_name', ''), apply_for_days_in_advance)
 
             # SSL证书验证通过
             if order_info.get('status_name') == "完成" and days_difference > apply_for_days_in_advance and kwargs.get('job_name') == 'SSL证书验签中，重新获取 所有权 验证结果':
+                # 双证书域名等待关联订单全部签发完成，一起部署
+                linked_bundles = {}
+                if is_dual(v):
+                    linked_bundles = advance_linked_orders(account, k, v, let_order_lists[v['domain']], apply_for_days_in_advance)
+                    if linked_bundles is None:
+                        return
                 send_wx_noti(f"域名 {v['domain']} SSL证书验证通过，开始准备下载部署")
                 lg.info(f"域名 {v['domain']} SSL证书验证通过，开始准备下载部署")
-                zip_file_path = let_api.certificate_download(cert_id=cert_id)    # 下载证书
-                let_api.deploy_ssl(zip_file_path, v['domain'])  # 部署证书
-                lg.info(f"域名 {v['domain']} SSL证书部署完成，请检查域名是否正常访问")
-                send_wx_noti(f"域名 {v['domain']} SSL证书部署完成，请检查域名是否正常访问", types="success")
-
-                lg.info(f"新证书配置成功，重启Nginx生效，即将停止 Nginx 服务")
-                os.system('net stop nginx')
-                time.sleep(6)
-                os.system('net start nginx')
-                lg.info(f"新证书配置成功，重启Nginx生效，开始启动 Nginx 服务")
+                bundle = fetch_bundle(api, cert_id, order_info['time_end'], v['domain'])
+                if not bundle:
+                    notify_failure(v['domain'], f"域名 {v['domain']} SSL证书下载或完整性校验失败，请检查日志")
+                    return
+                if is_dual(v):
+                    bundle = combine({key_types(v)[0]: bundle, **linked_bundles})
+                bundle_key = bundle_store.put(bundle, time_end=order_info['time_end'])
+                bundle = bundle_store.get(bundle_key)
+                deploy_status, changed, targets = api.deploy_ssl(bundle, v['domain'])  # 部署证书
+                if deploy_status:
+                    bundle_store.mark_deployed(v['domain'], bundle_key)
+                    linked_orders.deployed(v['domain'], list(linked_bundles))
+                    accounts.pin_order(v['domain'], cert_id)  # 部署的订单（独立通道、对冲订单）成为域名的主订单
+                    channel_policy.finish(v['domain'])
+                    hedger.finish(account, v['domain'], cert_id)
+                if not deploy_status:
+                    failed = "\n".join(str(i) for i in targets if not i.ok)
+                    notify_failure(v['domain'], f"域名 {v['domain']} SSL证书部署失败，失败的部署目标:\n{failed}")
+                    if changed:
+                        # 部分目标已替换为新证书，重启使其生效，但不记为部署完成，也不发送成功通知
+                        lg.warning(f"域名 {v['domain']} SSL证书部分部署目标已更新，重启 Nginx 使其生效")
+                        restart_nginx()
+                    return
+                if not changed:
+                    lg.info(f"域名 {v['domain']} SSL证书与已部署证书一致，无需重启 Nginx")
+                    return
+                run_state.record_event(v['domain'], DEPLOYED)
+                send_wx_noti(f"域名 {v['domain']} SSL证书部署完成", types="success")
+                if ocsp_stapler.enabled:
+                    ocsp_stapler.refresh_domain(v, bundle, force=True)  # 新证书的装订文件随本次重启一起生效
+                restart_nginx()
+                if not config.get_jsonpath('$.tls_verify.enabled', False):
+                    lg.info(f"域名 {v['domain']} SSL证书部署完成，请检查域名是否正常访问")
+                elif verify_after_reload({v['domain']: bundle.fingerprint}):
+                    lg.info(f"域名 {v['domain']} SSL证书部署完成，TLS 握手校验通过")
                 return
-            # SSL证书即将过期
-            if days_difference <= apply_for_days_in_advance:
+            # 双证书域名新配置的算法、超时后仍未签发的关联订单，每日检查时补齐订单，安排验证和部署
+            if is_dual(v) and not kwargs.get('v') and order_info.get('status_name') == "完成" and days_difference > apply_for_days_in_advance:
+                pending = linked_orders.pending(v)
+                if pending:
+                    linked_orders.ensure(account, v, let_order_lists[v['domain']])
+                    lg.info(f"域名 {v['domain']} {'/'.join(pending)} 关联证书尚未部署，开始推进关联订单")
+                    scheduler.add_job(verify_the_certificate, 'date', id=f"关联证书_{v['domain']}", kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
+
+            # SSL证书即将过期，或已到续期计划安排的日期
+            planned = renewal_planner.due(v['domain'], order_info['time_end'])
+            if days_difference <= apply_for_days_in_advance or planned:
+                if planned and days_difference > apply_for_days_in_advance and order_info.get('status_name') == "完成":
+                    lg.info(f"域名 {v['domain']} 按续期计划提前续期，剩余 {days_difference} 天")
+
+                # 当前 CA 超过耗时预算仍未签发，在下一个 CA 发起对冲申请
+                if order_info.get('status_name') in ("验证中", "待验证"):
+                    hedge_id = hedger.maybe_hedge(account, v, let_order_lists[v['domain']], cert_id, order_info.get('status_name'))
+                    if hedge_id:
+                        send_wx_noti(f"域名 {v['domain']} 证书签发超时，已在其它 CA 发起对冲申请", types="warning")
+                        scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
+                        return
 
                 if order_info.get('status_name') == "验证中":
+                    if renew_via_channel(account, k, v, let_order_lists[v['domain']], days_difference, stalled_only=True):
+                        return
                     lg.info(f"域名 {v['domain']} SSL证书正处于验证中状态，三分钟后重新检测验签结果")
                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                     return
@@ -162,26 +478,22 @@ def verify_the_certificate(**kwargs):
 
                             # 修改DNS
                             dns_service_providers = v.get("dns_service_providers", '')  # 获取DNS服务商
-                            if not dns_service_providers:
+                            if not dns_service_providers and not delegation.is_delegated(v):
                                 lg.error(f"域名 {v['domain']} 未配置 DNS服务商，请先配置 DNS服务商")
                                 return
 
-                            dns_updata_status = False   # DNS修改状态
-                            # 腾讯云DNS解析
-                            if dns_service_providers == "Qcloud":
-                                dns_updata_status = qcloud.modify_the_specified_dns_record(v['domain'], '_acme-challenge', verify['check']['dns-01']['txt'])
-                            else:
-                                lg.error(f"域名 {v['domain']} 暂不支持 {dns_service_providers} DNS服务商，请选择其他DNS服务商")
+                            dns_updata_status = set_challenge_record(v, verify['check']['dns-01']['txt'])   # DNS修改状态
 
                             # 修改DNS失败
                             if not dns_updata_status:
-                                send_wx_noti(f"域名 {v['domain']} DNS 所有权验证，修改 {dns_service_providers} DNS 解析失败，请检查域名解析是否正确", types="error")
+                                notify_failure(v['domain'], f"域名 {v['domain']} DNS 所有权验证，修改 {dns_service_providers} DNS 解析失败，请检查域名解析是否正确")
                                 scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                 return
 
                             lg.info(f"域名 {v['domain']} 即将开始进行 DNS 所有权验证")
-                            status = let_api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['dns-01']['type']}")
+                            status = api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['dns-01']['type']}")
                             if status:
+                                run_state.record_event(v['domain'], VALIDATION_STARTED)
                                 send_wx_noti(f"域名 {v['domain']} 开始进行 DNS 所有权验证")
                                 scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                 return
@@ -195,26 +507,22 @@ def verify_the_certificate(**kwargs):
 
                                 # 修改DNS
                                 dns_service_providers = v.get("dns_service_providers", '')  # 获取DNS服务商
-                                if not dns_service_providers:
+                                if not dns_service_providers and not delegation.is_delegated(v):
                                     lg.error(f"域名 {v['domain']} 未配置DNS服务商，请先配置DNS服务商")
                                     return
 
-                                dns_updata_status = False   # DNS修改状态
-                                # 腾讯云DNS解析
-                                if dns_service_providers == "Qcloud":
-                                    dns_updata_status = qcloud.modify_the_specified_dns_record(v['domain'], '_acme-challenge', verify['check']['dns-01']['txt'])
-                                else:
-                                    lg.error(f"域名 {v['domain']} 暂不支持 {dns_service_providers} DNS服务商，请选择其他DNS服务商")
+                                dns_updata_status = set_challenge_record(v, verify['check']['dns-01']['txt'])   # DNS修改状态
 
                                 # 修改DNS失败
                                 if not dns_updata_status:
-                                    send_wx_noti(f"域名 {v['domain']} 二次 DNS 所有权验证，修改 {dns_service_providers} DNS 解析失败，请检查域名解析是否正确", types="error")
+                                    notify_failure(v['domain'], f"域名 {v['domain']} 二次 DNS 所有权验证，修改 {dns_service_providers} DNS 解析失败，请检查域名解析是否正确")
                                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                     return
 
                                 lg.info(f"域名 {v['domain']} 即将开始进行二次 DNS 所有权验证")
-                                status = let_api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['dns-01']['type']}")
+                                status = api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['dns-01']['type']}")
                                 if status:
+                                    run_state.record_event(v['domain'], VALIDATION_STARTED)
                                     send_wx_noti(f"域名 {v['domain']} 开始进行二次 DNS 所有权验证")
                                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                     return
@@ -227,7 +535,7 @@ def verify_the_certificate(**kwargs):
 
                                 # 修改 Nginx 配置
                                 if not http_validation(verify['check']['http-01']['filename'], verify['check']['http-01']['content']):
-                                    send_wx_noti(f"域名 {v['domain']} HTTP 所有权验证，修改 Nginx 配置文件失败", types="error")
+                                    notify_failure(v['domain'], f"域名 {v['domain']} HTTP 所有权验证，修改 Nginx 配置文件失败")
                                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                     return
 
@@ -235,8 +543,9 @@ def verify_the_certificate(**kwargs):
                                 lg.info(f"域名 {v['domain']} 进行 HTTP 所有权验证，开始启动 Nginx 服务")
 
                                 # 开始进行验签名
-                                status = let_api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['http-01']['type']}")
+                                status = api.certificate_validation(cert_id, f"{verify['id']}:{verify['check']['http-01']['type']}")
                                 if status:
+                                    run_state.record_event(v['domain'], VALIDATION_STARTED)
                                     send_wx_noti(f"域名 {v['domain']} 开始进行 HTTP 所有权验证")
                                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                                     return
@@ -244,22 +553,39 @@ def verify_the_certificate(**kwargs):
                                 lg.error(f"域名 {v['domain']} 二次所有权验证方式配置错误")
                                 return
 
-                    send_wx_noti(f"域名 {v['domain']} 证书申请失败，请手动申请", types="error")
+                    notify_failure(v['domain'], f"域名 {v['domain']} 证书申请失败，请手动申请")
                     lg.warning(f"域名 {v['domain']} 证书申请失败，请手动申请")
 
+                # 临近过期时优先使用独立通道
+                if renew_via_channel(account, k, v, let_order_lists[v['domain']], days_difference):
+                    return
+
                 # 重新申请证书
-                status, text = let_api.certificate_reapplication(cert_id)
+                status, text = api.certificate_reapplication(cert_id)
                 if status:
+                    run_state.record_event(v['domain'], RENEW_STARTED)
+                    if is_dual(v):
+                        linked_orders.renew(account, v)
+                    hedger.track(v['domain'], cert_id, let_order_lists[v['domain']].get('acme', 'lets'))
                     send_wx_noti(f"域名 {v['domain']} SSL证书即将过期，剩余天数为 {days_difference} 天，开始尝试自动申请新的证书", types="warning")
                     lg.info(f"域名 {v['domain']} 证书即将过期，开始申请新的证书")
                     scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"k": k, "v": v, "job_name": "SSL证书验签中，重新获取 所有权 验证结果"}, replace_existing=True, run_date=datetime.now() + timedelta(minutes=3))
                     return
                 else:
-                    send_wx_noti(f"域名 {v['domain']} 证书申请失败，请手动申请，错误信息为：{text}", types="error")
+                    notify_failure(v['domain'], f"域名 {v['domain']} 证书申请失败，请手动申请，错误信息为：{text}")
                     lg.warning(f"域名 {v['domain']} 证书申请失败，请手动申请，错误信息为：{text}")
     except Exception as e:
         lg.error(f"验证SSL证书时发生异常: {traceback.format_exc()}")
     finally:
+        for user_name, stats in accounts.quota().items():
+            run_state.record_quota(user_name, stats)
+        run_state.save()
+        # 完整检查后按最新的过期时间重新安排续期计划
+        if renewal_planner.enabled and not kwargs.get('v'):
+            try:
+                renewal_planner.plan()
+            except Exception:
+                lg.error(f"计算续期计划失败: {traceback.format_exc()}")
         lg.info("任务执行完毕")
 
 
@@ -277,12 +603,41 @@ def apscheduler_logger(event):
 def main():
     try:
         scheduler.add_listener(apscheduler_logger, EVENT_JOB_MISSED | EVENT_JOB_ERROR | EVENT_JOB_EXECUTED)
+
+        # 指标接口
+        SCHEDULER_JOBS.set_function(lambda: len(scheduler.get_jobs()))
+        if config.get_jsonpath('$.metrics.enabled', False):
+            start_metrics_server(config.get_jsonpath('$.metrics.host', '127.0.0.1'), int(config.get_jsonpath('$.metrics.port', 9108)))
         
-        # 添加初始任务，10秒后执行
-        scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"job_name": "SSL证书验证"}, replace_existing=True, run_date=datetime.now() + timedelta(seconds=10))
+        # 检查 CNAME 委派是否正确
+        if delegation.enabled and config.get_jsonpath('$.dns_delegation.check_on_startup', True):
+            results = delegation.check(config.get_jsonpath("$.domain_list", {}))
+            failed = [f"{domain}: {actual}" for domain, (ok, actual) in results.items() if not ok]
+            if failed:
+                send_wx_noti("以下域名 CNAME 委派错误，DNS 验证可能失败:\n" + "\n".join(failed), types="warning")
+
+        # 多实例心跳，先登记再执行其他任务
+        if coordinator.enabled:
+            coordinator.heartbeat()
+            scheduler.add_job(coordinator.heartbeat, 'interval', id='实例心跳', seconds=coordinator.heartbeat_seconds, misfire_grace_time=60)
+
+        # 添加初始任务，10秒后执行（多实例时加随机抖动）
+        scheduler.add_job(verify_the_certificate, 'date', id='验证证书', kwargs={"job_name": "SSL证书验证"}, replace_existing=True, run_date=datetime.now() + timedelta(seconds=coordinator.jittered(10)))
         
         # 添加每日定时任务，每天12:30执行
-        scheduler.add_job(verify_the_certificate, 'cron', id='定时验证证书', kwargs={"job_name": "每日定时验证证书是否过期"}, hour=12, minute=30, misfire_grace_time=180)
+        scheduler.add_job(verify_the_certificate, 'cron', id='定时验证证书', kwargs={"job_name": "每日定时验证证书是否过期"}, hour=12, minute=30, jitter=coordinator.jitter or None, misfire_grace_time=180 + coordinator.jitter)
+
+        # OCSP 装订文件刷新
+        if ocsp_stapler.enabled:
+            scheduler.add_job(track_job(refresh_ocsp), 'interval', id='OCSP装订刷新', minutes=int(config.get_jsonpath('$.ocsp.check_interval_minutes', 60)), next_run_time=datetime.now() + timedelta(seconds=30), misfire_grace_time=600)
+
+        # 会话票据密钥轮换，启动时补齐密钥文件
+        if ticket_keys.enabled:
+            scheduler.add_job(track_job(rotate_ticket_keys), 'interval', id='会话票据密钥轮换', minutes=int(config.get_jsonpath('$.session_tickets.check_interval_minutes', 10)), next_run_time=datetime.now() + timedelta(seconds=10), misfire_grace_time=600)
+
+        # 每日证书日报
+        if config.get_jsonpath('$.digest.enabled', False):
+            scheduler.add_job(track_job(leader_only(send_daily_digest)), 'cron', id='证书日报', hour=config.get_jsonpath('$.digest.hour', 9), minute=config.get_jsonpath('$.digest.minute', 0), jitter=coordinator.jitter or None, misfire_grace_time=600)
         
         lg.info("开始执行任务")
         lg.info("定时任务已配置：每天12:30执行证书验证")
@@ -293,6 +648,7 @@ def main():
     except (KeyboardInterrupt, SystemExit):
         lg.info("收到退出信号，正在关闭调度器...")
         scheduler.shutdown()
+        coordinator.shutdown()
         lg.info("调度器已关闭")
     except Exception as e:
         lg.error(f"调度器启动失败: {e}")
@@ -0,0 +1,21 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 16:40
+# Email: leiyong711@163.com
+
+"""测试用的配置目录和运行时数据都放到临时目录，在导入任何测试模块之前执行"""
+
+import os
+import atexit
+import shutil
+import tempfile
+
+_root = tempfile.mkdtemp(prefix="ssl-tests-")
+atexit.register(shutil.rmtree, _root, ignore_errors=True)
+os.environ["PLUGIN_CONFIG"] = _root
+
+from utils import constants  # noqa: E402
+
+constants.set_data_root(_root)
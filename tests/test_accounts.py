@@ -0,0 +1,108 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 17:10
+# Email: leiyong711@163.com
+
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest import mock
+from utils.state_store import JsonStore
+from app.letsencrypt import dual
+from app.letsencrypt.accounts import AccountPool
+from app.letsencrypt.dual import LinkedOrders
+
+DOMAIN_CONF = {"domain": "example.com", "key_types": ["RSA", "ECC"]}
+ORDER = {"id": "100", "domains": ["example.com"], "acme": "lets", "time_add": "2026-10-01 00:00:00"}
+
+
+class FakeClient:
+    """只记录调用的证书平台账号，left 为当日剩余次数"""
+
+    def __init__(self, user_name: str, left: int, first_id: int):
+        self.user_name, self.left, self.next_id = user_name, left, first_id
+        self.calls, self.orders = [], []
+
+    def order_list(self):
+        return list(self.orders)
+
+    def certificate_application(self, domains, **kwargs):
+        self.calls.append(("application", domains))
+        cert_id, self.next_id = str(self.next_id), self.next_id + 1
+        self.orders.append({"id": cert_id, "domains": domains.split(","), "time_add": "2026-10-20 00:00:00"})
+        return {"id": cert_id}
+
+    def certificate_details(self, cert_id):
+        self.calls.append(("details", cert_id))
+        return {"status_name": "待验证"}
+
+    def certificate_reapplication(self, cert_id):
+        self.calls.append(("reapplication", cert_id))
+        return True, ""
+
+
+class NewOrderAccountTest(unittest.TestCase):
+
+    def setUp(self):
+        root = tempfile.mkdtemp(prefix="ssl-accounts-")
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        self.pool = AccountPool()
+        self.a, self.b = FakeClient("a", 0, 200), FakeClient("b", 50, 300)
+        self.a.orders.append(dict(ORDER))
+        self.pool.clients = OrderedDict(a=self.a, b=self.b)
+        self.pool.store = JsonStore("accounts", {"pins": {}, "orders": {}, "owners": {}}, root=root)
+        self.linked = LinkedOrders()
+        self.linked.store = JsonStore("linked_orders", {}, root=root)
+        patches = [mock.patch.object(AccountPool, "remaining", lambda pool, client: client.left),
+                   mock.patch.object(dual, "accounts", self.pool)]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_second_account_receives_new_order(self):
+        orders = self.pool.order_lists()
+        self.assertEqual(orders["example.com"]["id"], "100")
+        api = self.pool.account_for("example.com", DOMAIN_CONF)
+        self.assertIs(api, self.a)
+
+        linked = self.linked.ensure(api, DOMAIN_CONF, orders["example.com"])
+        self.assertEqual(linked, {"ECC": "300"})
+        self.assertEqual(self.a.calls, [])
+        self.assertEqual(self.b.calls, [("application", "example.com")])
+        self.assertIs(self.pool.client_of("300", api), self.b)
+
+        # 之后对新订单的查询和重新申请都发到所在的账号
+        self.linked.statuses(api, DOMAIN_CONF, 3)
+        self.linked.renew(api, DOMAIN_CONF)
+        self.assertEqual(self.b.calls[1:], [("details", "300"), ("reapplication", "300")])
+        self.assertEqual(self.a.calls, [])
+
+        # 关联订单不抢主订单，域名仍绑定原账号
+        self.assertEqual(self.pool.order_lists(self.linked.cert_ids())["example.com"]["id"], "100")
+        self.assertIs(self.pool.account_for("example.com", DOMAIN_CONF), self.a)
+
+    def test_pinned_account_with_quota_keeps_new_order(self):
+        self.a.left = 10
+        self.linked.ensure(self.a, DOMAIN_CONF, ORDER)
+        self.assertEqual(self.a.calls, [("application", "example.com")])
+        self.assertEqual(self.b.calls, [])
+        self.assertIs(self.pool.client_of("200", self.b), self.a)
+
+    def test_deleted_order_owner_forgotten(self):
+        self.linked.ensure(self.a, DOMAIN_CONF, ORDER)
+        self.b.orders[:] = [{"id": "301", "domains": ["other.com"], "time_add": "2026-10-20 00:00:00"}]
+        self.pool.order_lists()
+        self.assertNotIn("300", self.pool.store.data["owners"])
+
+    def test_owner_kept_when_order_list_unavailable(self):
+        self.linked.ensure(self.a, DOMAIN_CONF, ORDER)
+        self.b.orders.clear()  # 接口失败时证书列表为空，不能据此认为订单已删除
+        self.pool.order_lists()
+        self.assertIn("300", self.pool.store.data["owners"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 17:50
+# Email: leiyong711@163.com
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from utils.state_store import JsonStore
+from app.letsencrypt import dual
+from app.letsencrypt.dual import LinkedOrders
+
+DOMAIN_CONF = {"domain": "example.com", "key_types": ["RSA", "ECC"]}
+ORDER = {"id": "100", "domains": ["example.com"], "acme": "lets"}
+
+
+class FakeClient:
+
+    def __init__(self):
+        self.reapplied = []
+
+    def certificate_application(self, domains, **kwargs):
+        return {"id": "300"}
+
+    def certificate_reapplication(self, cert_id):
+        self.reapplied.append(cert_id)
+        return True, ""
+
+
+class LinkedDeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix="ssl-dual-")
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        patch = mock.patch.object(dual, "accounts", mock.Mock(for_new_order=lambda api: api,
+                                                             client_of=lambda cert_id, api: api))
+        patch.start()
+        self.addCleanup(patch.stop)
+        self.linked = self._linked_orders()
+        self.api = FakeClient()
+
+    def _linked_orders(self) -> LinkedOrders:
+        with mock.patch.object(dual, "JsonStore", lambda name, default: JsonStore(name, default, root=self.root)):
+            return LinkedOrders()
+
+    def test_new_order_waits_until_timeout(self):
+        self.assertEqual(self.linked.pending(DOMAIN_CONF), ["ECC"])
+        self.linked.ensure(self.api, DOMAIN_CONF, ORDER)
+        self.assertFalse(self.linked.overdue("example.com", "ECC"))
+        with mock.patch.object(dual.time, "time", return_value=dual.time.time() + self.linked.timeout + 1):
+            self.assertTrue(self.linked.overdue("example.com", "ECC"))
+
+    def test_missing_order_does_not_block(self):
+        self.assertTrue(self.linked.overdue("example.com", "ECC"))
+
+    def test_notified_once_until_deployed(self):
+        self.linked.ensure(self.api, DOMAIN_CONF, ORDER)
+        self.assertTrue(self.linked.mark_notified("example.com", ["ECC"]))
+        self.assertFalse(self.linked.mark_notified("example.com", ["ECC"]))
+        self.linked.deployed("example.com", ["ECC"])
+        self.assertEqual(self.linked.pending(DOMAIN_CONF), [])
+
+    def test_renew_restarts_deadline(self):
+        self.linked.ensure(self.api, DOMAIN_CONF, ORDER)
+        self.linked.deployed("example.com", ["ECC"])
+        later = dual.time.time() + self.linked.timeout + 1
+        with mock.patch.object(dual.time, "time", return_value=later):
+            self.linked.renew(self.api, DOMAIN_CONF)
+            self.assertFalse(self.linked.overdue("example.com", "ECC"))
+        self.assertEqual(self.api.reapplied, ["300"])
+        self.assertEqual(self.linked.pending(DOMAIN_CONF), ["ECC"])
+
+    def test_legacy_state_loaded_as_deployed(self):
+        with open(os.path.join(self.root, "linked_orders.json"), 'w', encoding='utf-8') as f:
+            json.dump({"example.com": {"ECC": "300"}}, f)
+        linked = self._linked_orders()
+        self.assertEqual(linked.linked("example.com"), {"ECC": "300"})
+        self.assertEqual(linked.cert_ids(), {"300"})
+        self.assertEqual(linked.pending(DOMAIN_CONF), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 13:20
+# Email: leiyong711@163.com
+
+import os
+import tempfile
+import unittest
+from app.deploy.fanout import deploy_to_targets
+from app.deploy.transport import FakeTransport, LocalTransport
+
+OLD = {"cert.pem": b"old cert", "key.pem": b"old key"}
+NEW = {"cert.pem": b"new cert", "key.pem": b"new key", "chain.pem": b"new chain"}
+
+
+def fake(path: str, **kwargs) -> dict:
+    return {"type": "fake", "path": path, **kwargs}
+
+
+class AllOrNothingTest(unittest.TestCase):
+
+    def setUp(self):
+        FakeTransport.stores.clear()
+        for path in ("a", "b", "c"):
+            FakeTransport.stores[path] = dict(OLD)
+
+    def test_all_committed(self):
+        ok, changed, statuses = deploy_to_targets(NEW, [fake("a"), fake("b")], all_or_nothing=True, retries=0)
+        self.assertEqual((ok, changed), (True, True))
+        self.assertEqual(FakeTransport.stores["b"], NEW)
+
+    def test_stage_failure_commits_nothing(self):
+        ok, changed, _ = deploy_to_targets(NEW, [fake("a"), fake("b", fail_stage=1)], all_or_nothing=True, retries=0)
+        self.assertEqual((ok, changed), (False, False))
+        self.assertEqual(FakeTransport.stores["a"], OLD)
+
+    def test_commit_failure_rolls_back_committed_targets(self):
+        targets = [fake("a"), fake("b", fail_commit=1), fake("c")]
+        ok, changed, statuses = deploy_to_targets(NEW, targets, all_or_nothing=True, retries=0)
+        self.assertEqual((ok, changed), (False, False))
+        for path in ("a", "b", "c"):
+            self.assertEqual(FakeTransport.stores[path], OLD, path)
+        self.assertTrue(all(not s.ok for s in statuses))
+        self.assertIn("已回滚", statuses[0].error)
+
+    def test_failed_rollback_is_reported(self):
+        targets = [fake("a", fail_rollback=1), fake("b", fail_commit=1)]
+        ok, changed, statuses = deploy_to_targets(NEW, targets, all_or_nothing=True, retries=0)
+        self.assertEqual((ok, changed), (False, True))  # a 仍为新文件，需要重启才能与磁盘一致
+        self.assertEqual(FakeTransport.stores["a"], NEW)
+        self.assertIn("回滚失败", statuses[0].error)
+
+
+class LocalRollbackTest(unittest.TestCase):
+
+    def test_restore_and_remove_new_files(self):
+        with tempfile.TemporaryDirectory() as root:
+            for name, data in OLD.items():
+                with open(os.path.join(root, name), 'wb') as f:
+                    f.write(data)
+            transport = LocalTransport(root)
+            self.assertTrue(transport.stage(NEW))
+            self.assertTrue(transport.commit())
+            transport.rollback()
+            self.assertEqual(sorted(os.listdir(root)), sorted(OLD))
+            for name, data in OLD.items():
+                with open(os.path.join(root, name), 'rb') as f:
+                    self.assertEqual(f.read(), data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,181 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 12:10
+# Email: leiyong711@163.com
+
+import time
+import base64
+import socket
+import struct
+import unittest
+import threading
+from unittest import mock
+from app.rfc2136 import (Message, TsigKey, DnsError, encode_name, decode_name, txt_rdata, parse_txt_rdata, build_update,
+                         exchange, TYPE_CNAME, CLASS_IN, OPCODE_UPDATE)
+
+try:
+    import dns.message
+    import dns.tsigkeyring
+except ImportError:
+    dns = None
+
+SECRET = base64.b64encode(b"0123456789abcdef0123456789abcdef").decode()
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_name_round_trip(self):
+        wire = encode_name("_acme-challenge.www.example.com.")
+        self.assertEqual(wire, b"\x0f_acme-challenge\x03www\x07example\x03com\x00")
+        self.assertEqual(decode_name(wire, 0), ("_acme-challenge.www.example.com", len(wire)))
+
+    def test_name_label_too_long(self):
+        with self.assertRaises(DnsError):
+            encode_name("a" * 64 + ".example.com")
+
+    def test_compression_pointer(self):
+        data = b"\x00" * 12 + encode_name("example.com") + b"\x03www\xc0\x0c"
+        name, offset = decode_name(data, 12 + len(encode_name("example.com")))
+        self.assertEqual((name, offset), ("www.example.com", len(data)))
+
+    def test_compression_loop(self):
+        with self.assertRaises(DnsError):
+            decode_name(b"\xc0\x00", 0)
+
+    def test_txt_long_value(self):
+        value = "x" * 300
+        rdata = txt_rdata(value)
+        self.assertEqual((rdata[0], rdata[256]), (255, 45))
+        self.assertEqual(parse_txt_rdata(rdata), value)
+        self.assertEqual(parse_txt_rdata(txt_rdata("")), "")
+
+    def test_message_round_trip(self):
+        message = build_update("example.com", {"_acme-challenge.example.com": ["token"]}, 60)
+        parsed = Message.from_wire(message.to_wire())
+        self.assertEqual(parsed.id, message.id)
+        self.assertEqual(parsed.opcode, OPCODE_UPDATE)
+        self.assertEqual(parsed.question, message.question)
+        self.assertEqual(parsed.authority, message.authority)
+        self.assertEqual(parsed.to_wire(), message.to_wire())
+
+    def test_cname_target_decompressed(self):
+        header = struct.pack(">HHHHHH", 1, 0x8180, 1, 1, 0, 0)
+        question = encode_name("_acme-challenge.example.com") + struct.pack(">HH", TYPE_CNAME, CLASS_IN)
+        target = b"\x03dns\xc0\x1c"  # 指向问题中的 example.com
+        answer = b"\xc0\x0c" + struct.pack(">HHIH", TYPE_CNAME, CLASS_IN, 300, len(target)) + target
+        message = Message.from_wire(header + question + answer)
+        self.assertEqual(message.answer[0][0], "_acme-challenge.example.com")
+        self.assertEqual(message.answer[0][4], encode_name("dns.example.com"))
+
+    def test_truncated_message(self):
+        wire = build_update("example.com", {"a.example.com": ["token"]}, 60).to_wire()
+        with self.assertRaises(DnsError):
+            Message.from_wire(wire[:-3])
+
+    @unittest.skipUnless(dns, "dnspython 未安装")
+    def test_parsed_by_dnspython(self):
+        message = build_update("example.com", {"_acme-challenge.example.com": ["token"]}, 60)
+        parsed = dns.message.from_wire(message.to_wire())
+        self.assertEqual(parsed.id, message.id)
+        self.assertIn('"token"', parsed.to_text())
+
+
+class TsigTest(unittest.TestCase):
+
+    def setUp(self):
+        self.key = TsigKey("acme-key.", SECRET)
+
+    def test_sign_verify(self):
+        wire, mac = self.key.sign(build_update("example.com", {"a.example.com": ["v"]}, 60))
+        ok, error, verified = self.key.verify(wire)
+        self.assertEqual((ok, error, verified), (True, 0, mac))
+
+    def test_response_bound_to_request_mac(self):
+        _, request_mac = self.key.sign(Message(7))
+        wire, _ = self.key.sign(Message(7, flags=0x8000), request_mac)
+        self.assertTrue(self.key.verify(wire, request_mac)[0])
+        self.assertEqual(self.key.verify(wire, b"\x00" * len(request_mac))[:2], (False, 16))
+
+    def test_tampered(self):
+        wire, _ = self.key.sign(build_update("example.com", {"a.example.com": ["v"]}, 60))
+        tampered = bytearray(wire)
+        tampered[wire.index(b"\x01v") + 1] = ord("w")
+        self.assertEqual(self.key.verify(bytes(tampered))[:2], (False, 16))
+
+    def test_wrong_key(self):
+        wire, _ = self.key.sign(Message(1))
+        self.assertEqual(TsigKey("other-key", SECRET).verify(wire)[:2], (False, 17))
+        self.assertEqual(TsigKey("acme-key", base64.b64encode(b"x" * 32).decode()).verify(wire)[:2], (False, 16))
+
+    def test_time_window(self):
+        wire, _ = self.key.sign(Message(1))
+        with mock.patch("app.rfc2136.time.time", return_value=time.time() + 3600):
+            self.assertEqual(self.key.verify(wire)[:2], (False, 18))
+
+    def test_unsigned(self):
+        self.assertEqual(self.key.verify(Message(1).to_wire())[:2], (False, 16))
+
+    @unittest.skipUnless(dns, "dnspython 未安装")
+    def test_interop_with_dnspython(self):
+        keyring = dns.tsigkeyring.from_text({"acme-key.": ("hmac-sha256", SECRET)})
+        wire, _ = self.key.sign(build_update("example.com", {"a.example.com": ["v"]}, 60))
+        dns.message.from_wire(wire, keyring=keyring)  # 签名错误时抛出异常
+
+        query = dns.message.make_query("example.com", "SOA")
+        query.use_tsig(keyring, keyname="acme-key.", algorithm="hmac-sha256")
+        self.assertTrue(self.key.verify(query.to_wire())[0])
+
+
+class ExchangeTest(unittest.TestCase):
+
+    def _servers(self, udp_flags: int):
+        """本地 UDP/TCP 应答服务，UDP 响应带 udp_flags，TCP 响应不带 TC"""
+        udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        udp.bind(("127.0.0.1", 0))
+        port = udp.getsockname()[1]
+        tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        tcp.bind(("127.0.0.1", port))
+        tcp.listen(1)
+        self.addCleanup(udp.close)
+        self.addCleanup(tcp.close)
+        calls = []
+
+        def serve_udp():
+            data, addr = udp.recvfrom(65535)
+            calls.append("udp")
+            udp.sendto(data[:2] + struct.pack(">H", 0x8000 | udp_flags) + data[4:12], addr)
+
+        def serve_tcp():
+            try:
+                conn, _ = tcp.accept()
+            except OSError:
+                return
+            with conn:
+                length = struct.unpack(">H", conn.recv(2))[0]
+                data = conn.recv(length)
+                calls.append("tcp")
+                response = data[:2] + struct.pack(">H", 0x8000) + data[4:]
+                conn.sendall(struct.pack(">H", len(response)) + response)
+
+        for target in (serve_udp, serve_tcp):
+            threading.Thread(target=target, daemon=True).start()
+        return port, calls
+
+    def test_udp(self):
+        port, calls = self._servers(0)
+        data = exchange(Message(1).to_wire(), "127.0.0.1", port, timeout=2)
+        self.assertEqual(calls, ["udp"])
+        self.assertTrue(Message.from_wire(data).is_response)
+
+    def test_truncated_retried_over_tcp(self):
+        port, calls = self._servers(0x0200)
+        wire = build_update("example.com", {"a.example.com": ["v"]}, 60).to_wire()
+        data = exchange(wire, "127.0.0.1", port, timeout=2)
+        self.assertEqual(calls, ["udp", "tcp"])
+        self.assertEqual(Message.from_wire(data).authority, Message.from_wire(wire).authority)
+
+
+if __name__ == '__main__':
+    unittest.main()
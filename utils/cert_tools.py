@@ -0,0 +1,196 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 10:12
+# Email: leiyong711@163.com
+
+import os
+import ssl
+import shutil
+import hashlib
+import tempfile
+from utils.log import lg
+
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sha256_file(path: str) -> str:
+    """计算文件 sha256，文件不存在返回空字符串"""
+    if not os.path.isfile(path):
+        return ""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def classify_pem(data: bytes) -> str:
+    """
+    判断 PEM 文件类型
+    :param data: 文件内容
+    :return: key(私钥) / cert(证书) / 空字符串(其他)
+    """
+    if b"PRIVATE KEY-----" in data:
+        return "key"
+    if b"-----BEGIN CERTIFICATE-----" in data:
+        return "cert"
+    return ""
+
+
+def key_matches_cert(cert_path: str, key_path: str) -> bool:
+    """校验私钥与证书是否匹配（借助 ssl 模块加载证书链，不匹配时会抛出异常）"""
+    ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    try:
+        ctx.load_cert_chain(certfile=cert_path, keyfile=key_path)
+        return True
+    except (ssl.SSLError, OSError):
+        return False
+
+
+def validate_key_pairs(files: dict) -> (bool, str):
+    """
+    校验证书目录中每个私钥都能找到与之匹配的证书
+    :param files: {相对路径: 绝对路径}
+    :return: (是否通过, 原因)
+    """
+    keys, certs = [], []
+    for name, path in files.items():
+        with open(path, 'rb') as f:
+            kind = classify_pem(f.read())
+        if kind == "key":
+            keys.append(path)
+        elif kind == "cert":
+            certs.append(path)
+
+    if not keys or not certs:
+        return False, f"证书包中缺少私钥或证书文件，私钥 {len(keys)} 个，证书 {len(certs)} 个"
+
+    for key in keys:
+        if not any(key_matches_cert(cert, key) for cert in certs):
+            return False, f"私钥 {os.path.basename(key)} 与证书包中的证书均不匹配"
+    return True, "私钥与证书匹配"
+
+
+def fsync_file(path: str) -> None:
+    with open(path, 'rb+') as f:
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def fsync_dir(path: str) -> None:
+    """同步目录项，Windows 不支持打开目录，直接忽略"""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        ...
+    finally:
+        os.close(fd)
+
+
+def list_files(root: str) -> dict:
+    """列出目录下所有文件 {相对路径: 绝对路径}"""
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = path
+    return files
+
+
+def write_files(files: dict, root: str) -> None:
+    """
+    将 {相对路径: 内容} 写入目录，忽略试图跳出目录的路径
+    :param files: 文件内容
+    :param root:  目标目录
+    """
+    root = os.path.normpath(root)
+    for name, data in files.items():
+        dst = os.path.normpath(os.path.join(root, name))
+        if not dst.startswith(root + os.sep):
+            lg.warning(f"证书包中存在非法路径，已忽略: {name}")
+            continue
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(dst, 'wb') as f:
+            f.write(data)
+
+
+def make_staging_dir(target_dir: str) -> str:
+    """在目标目录旁创建暂存目录，保证与目标处于同一文件系统，os.replace 才是原子操作"""
+    target_dir = os.path.normpath(target_dir)
+    parent = os.path.dirname(target_dir) or "."
+    os.makedirs(parent, exist_ok=True)
+    return tempfile.mkdtemp(prefix=f".{os.path.basename(target_dir)}.staging-", dir=parent)
+
+
+def atomic_install(staging_dir: str, target_dir: str) -> bool:
+    """
+    将暂存目录中的文件逐个原子替换到目标目录
+    内容与目标目录完全一致时不做任何写入
+    每个文件单独 os.replace，证书和私钥之间存在很短的不一致窗口，因此：
+      1. 所有文件先写入并 fsync，替换阶段只有 rename；
+      2. 私钥最后替换，窗口内 nginx 读到的是新证书 + 旧私钥，nginx 加载时会校验证书与私钥是否匹配，
+         此时 reload 失败并继续使用已加载的旧配置，不会提供不匹配的证书；
+      3. 任一替换失败时把已替换的文件恢复为原内容，目标目录不会停留在不一致的状态
+    :param staging_dir: 暂存目录
+    :param target_dir:  目标目录
+    :return: 是否有文件发生变化
+    """
+    staged = list_files(staging_dir)
+    changed = [name for name, path in staged.items()
+               if sha256_file(path) != sha256_file(os.path.join(target_dir, name))]
+    if not changed:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return False
+
+    for name in changed:
+        fsync_file(staged[name])
+
+    def is_key(name: str) -> bool:
+        with open(staged[name], 'rb') as f:
+            return classify_pem(f.read()) == "key"
+
+    changed.sort(key=is_key)  # 私钥最后替换
+
+    # 备份将被覆盖的原文件，替换失败时恢复
+    backup_dir = tempfile.mkdtemp(prefix=".backup-", dir=staging_dir)
+    backups = {}
+    for name in changed:
+        dst = os.path.join(target_dir, name)
+        if os.path.isfile(dst):
+            backups[name] = os.path.join(backup_dir, str(len(backups)))
+            shutil.copy2(dst, backups[name])
+
+    touched_dirs, replaced = set(), []
+    try:
+        for name in changed:
+            dst = os.path.join(target_dir, name)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            os.replace(staged[name], dst)
+            replaced.append(name)
+            touched_dirs.add(os.path.dirname(dst))
+            lg.debug(f"证书文件已替换: {dst}")
+    except OSError:
+        for name in reversed(replaced):
+            dst = os.path.join(target_dir, name)
+            try:
+                if name in backups:
+                    os.replace(backups[name], dst)
+                else:
+                    os.remove(dst)
+            except OSError as e:
+                lg.error(f"恢复证书文件 {dst} 失败: {e}")
+        lg.error(f"替换证书文件失败，已恢复 {len(replaced)} 个已替换的文件")
+        raise
+    finally:
+        for d in touched_dirs:
+            fsync_dir(d)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return True
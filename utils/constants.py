@@ -16,6 +16,10 @@ APP_PATH = os.path.normpath(
 LIB_PATH = os.path.join(APP_PATH, "SSLCertAutoIssue")
 DATA_PATH = os.path.join(APP_PATH, "static")
 TEMP_PATH = os.path.join(APP_PATH, "temp")
+CACHE_PATH = os.path.join(APP_PATH, "cache")
+STATE_PATH = os.path.join(APP_PATH, "state")
+REPORT_PATH = os.path.join(APP_PATH, "reports")
+LOG_PATH = os.path.join(APP_PATH, "logs")
 TEMPLATE_PATH = os.path.join(APP_PATH, "server", "templates")
 PLUGIN_PATH = os.path.join(APP_PATH, "plugins")
 DEFAULT_CONFIG_NAME = "default.yml"
@@ -34,6 +38,20 @@ CONFIG_PATH = os.path.expanduser(os.getenv("PLUGIN_CONFIG", "~/.SSLCertAutoIssue
 # lg.debug(f"CUSTOM_CONFIG_NAME: {CUSTOM_CONFIG_NAME}")
 
 
+def set_data_root(root):
+    """
+    运行时数据（临时文件、缓存、状态、日志）改写到 root 目录下，用于基准测试和单元测试，不污染程序目录
+    其他模块导入时读取这些路径，必须在导入项目其他模块之前调用
+
+    :param root: 数据根目录
+    """
+    global TEMP_PATH, CACHE_PATH, STATE_PATH, LOG_PATH
+    TEMP_PATH = os.path.join(root, "temp")
+    CACHE_PATH = os.path.join(root, "cache")
+    STATE_PATH = os.path.join(root, "state")
+    LOG_PATH = os.path.join(root, "logs")
+
+
 def getConfigPath():
     """
     获取配置文件的路径
@@ -0,0 +1,203 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-20 01:50
+# Email: leiyong711@163.com
+
+import os
+import time
+import bisect
+import socket
+import random
+import sqlite3
+import hashlib
+import functools
+import contextlib
+from utils.log import lg
+from utils.config import Config
+from utils.constants import STATE_PATH
+
+config = Config()
+
+LEADER = "leader"  # 只有一个实例执行任务
+SHARD = "shard"    # 域名按一致性哈希分配到各实例
+
+
+class LeaseStore:
+    """
+    SQLite 租约表，放在共享存储上供多个实例使用，默认放在本机 state 目录（单机多进程或测试）
+    每次操作使用独立连接并以 BEGIN IMMEDIATE 加写锁，租约的检查和写入在同一个事务内完成
+    """
+
+    def __init__(self, path: str, timeout: float = 10):
+        self.path = path
+        self.timeout = timeout
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS members (node TEXT PRIMARY KEY, heartbeat REAL NOT NULL)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()  # 未提交的事务随连接关闭回滚
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        """
+        获取或续期租约，租约不存在、已过期或本来就属于 owner 时成功
+        :return: 是否持有租约
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT owner, expires FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases (name, owner, expires) VALUES (?, ?, ?)", (name, owner, now + ttl))
+            conn.execute("COMMIT")
+            return True
+
+    def release(self, name: str, owner: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, owner))
+
+    def release_all(self, owner: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+            conn.execute("DELETE FROM members WHERE node = ?", (owner,))
+
+    def owner(self, name: str) -> str:
+        """租约当前的持有者，没有或已过期返回空字符串"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT owner FROM leases WHERE name = ? AND expires > ?", (name, time.time())).fetchone()
+        return row[0] if row else ""
+
+    def heartbeat(self, node: str) -> None:
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO members (node, heartbeat) VALUES (?, ?)", (node, time.time()))
+
+    def members(self, ttl: float) -> list:
+        """最近 ttl 秒内有心跳的实例"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT node FROM members WHERE heartbeat > ? ORDER BY node", (time.time() - ttl,)).fetchall()
+        return [row[0] for row in rows]
+
+
+class HashRing:
+    """一致性哈希环，实例增减时只有相邻区间的域名改变归属"""
+
+    def __init__(self, nodes: list, replicas: int = 64):
+        self.ring = sorted((self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas))
+        self.keys = [i[0] for i in self.ring]
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+    def node_for(self, key: str) -> str:
+        if not self.ring:
+            return ""
+        index = bisect.bisect(self.keys, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+class Coordinator:
+    """
+    多实例协调
+    leader 模式：持有 leader 租约的实例执行全部任务，其余实例待命，leader 停止续约 lease_seconds 后由其他实例接替；
+    shard 模式：按存活实例构建一致性哈希环分配域名，实例失去心跳后其域名转移到其他实例。
+    两种模式下处理域名前都要获取该域名的租约，归属切换期间同一域名不会被两个实例同时续期和部署；
+    日报、会话票据密钥等全局任务只由 leader 执行
+    """
+
+    def __init__(self):
+        self.enabled = bool(config.get_jsonpath('$.cluster.enabled', False))
+        self.mode = config.get_jsonpath('$.cluster.mode', LEADER)
+        if self.mode not in (LEADER, SHARD):
+            lg.warning(f"cluster.mode 只支持 {LEADER}/{SHARD}，已改为 {LEADER}")
+            self.mode = LEADER
+        self.node = config.get_jsonpath('$.cluster.node_id', '') or socket.gethostname()
+        self.lease_seconds = float(config.get_jsonpath('$.cluster.lease_seconds', 90))
+        self.heartbeat_seconds = float(config.get_jsonpath('$.cluster.heartbeat_seconds', 30))
+        self.domain_lease_seconds = float(config.get_jsonpath('$.cluster.domain_lease_seconds', 900))
+        self.jitter = int(config.get_jsonpath('$.cluster.jitter_seconds', 120)) if self.enabled else 0
+        self.replicas = int(config.get_jsonpath('$.cluster.virtual_nodes', 64))
+        self.store = None
+        self._ring, self._ring_at = None, 0.0
+        if self.enabled:
+            path = config.get_jsonpath('$.cluster.lease_db', '') or os.path.join(STATE_PATH, "cluster.db")
+            self.store = LeaseStore(path)
+            lg.info(f"多实例协调已开启，模式 {self.mode}，实例 {self.node}，租约库 {path}")
+
+    def heartbeat(self) -> None:
+        """定时心跳：登记存活并续期 leader 租约"""
+        if not self.enabled:
+            return
+        self.store.heartbeat(self.node)
+        leader = self.is_leader()
+        lg.debug(f"实例 {self.node} 心跳，leader: {leader}，存活实例: {', '.join(self.members())}")
+
+    def is_leader(self) -> bool:
+        """未开启协调时始终为 True"""
+        if not self.enabled:
+            return True
+        return self.store.acquire(LEADER, self.node, self.lease_seconds)
+
+    def members(self) -> list:
+        members = self.store.members(self.lease_seconds)
+        return members if self.node in members else sorted(members + [self.node])
+
+    def active(self) -> bool:
+        """本实例是否需要执行证书检查，leader 模式下只有 leader 执行"""
+        return not self.enabled or self.mode == SHARD or self.is_leader()
+
+    def owns(self, domain: str) -> bool:
+        """域名是否归本实例处理（不获取租约）"""
+        if not self.enabled:
+            return True
+        if self.mode == LEADER:
+            return self.is_leader()
+        return self.ring().node_for(domain) == self.node
+
+    def ring(self) -> HashRing:
+        """存活实例的哈希环，每个心跳间隔重建一次"""
+        if self._ring is None or time.time() - self._ring_at >= self.heartbeat_seconds:
+            self._ring, self._ring_at = HashRing(self.members(), self.replicas), time.time()
+        return self._ring
+
+    def claim(self, domain: str) -> bool:
+        """域名归本实例处理且获取（续期）到域名租约"""
+        if not self.owns(domain):
+            return False
+        if self.enabled and not self.store.acquire(f"domain:{domain}", self.node, self.domain_lease_seconds):
+            lg.info(f"域名 {domain} 的租约仍由实例 {self.store.owner(f'domain:{domain}')} 持有，等待租约过期后接管")
+            return False
+        return True
+
+    def jittered(self, seconds: float = 0) -> float:
+        """在 seconds 上加随机抖动，多个实例的启动任务错开执行"""
+        return seconds + (random.uniform(0, self.jitter) if self.jitter else 0)
+
+    def shutdown(self) -> None:
+        """释放本实例持有的全部租约，其他实例立即接管"""
+        if self.enabled:
+            self.store.release_all(self.node)
+
+
+def leader_only(func):
+    """全局任务只由 leader 执行"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not coordinator.is_leader():
+            lg.debug(f"实例 {coordinator.node} 不是 leader，跳过 {func.__name__}")
+            return None
+        return func(*args, **kwargs)
+    return wrapper
+
+
+coordinator = Coordinator()
@@ -0,0 +1,157 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 16:45
+# Email: leiyong711@163.com
+
+import os
+import sys
+import json
+import time
+import argparse
+from utils.log import lg
+from utils.config import Config
+from utils.constants import REPORT_PATH
+from utils.run_state import run_state, DEPLOYED, FAILED, RENEW_STARTED
+from utils.wx_noti import dispatcher
+
+config = Config()
+
+# 剩余天数分布区间 (下限, 上限, 名称)
+DAYS_BUCKETS = [
+    (None, 0, "已过期"),
+    (0, 7, "0-7天"),
+    (7, 14, "7-14天"),
+    (14, 30, "14-30天"),
+    (30, 60, "30-60天"),
+    (60, None, "60天以上"),
+]
+
+
+def days_histogram(domains: dict) -> dict:
+    histogram = {name: 0 for _, _, name in DAYS_BUCKETS}
+    for item in domains.values():
+        days = item.get("days_remaining")
+        if days is None:
+            continue
+        for low, high, name in DAYS_BUCKETS:
+            if (low is None or days >= low) and (high is None or days < high):
+                histogram[name] += 1
+                break
+    return histogram
+
+
+def build_digest(period: float = 86400) -> dict:
+    """
+    根据本地记录的运行结果生成日报，不调用任何接口
+    :param period: 统计周期（秒），默认最近 24 小时
+    """
+    now = time.time()
+    domains = run_state.domains()
+    events = run_state.events(since=now - period)
+
+    deployed = [i for i in events if i["event"] == DEPLOYED]
+    durations = [i["time_to_deploy"] for i in deployed if i.get("time_to_deploy")]
+    quota = {}
+    for user_name, item in run_state.quota().items():
+        limit = item.get("daily_limit")
+        quota[user_name] = {
+            "user_type": item.get("user_type"),
+            "used": item.get("current_count"),
+            "daily_limit": "不限" if limit in (None, float("inf")) else limit,
+            "date": item.get("reset_date"),
+        }
+
+    return {
+        "generated_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now)),
+        "domains_total": len(domains),
+        "days_histogram": days_histogram(domains),
+        "expiring": sorted(
+            [{"domain": k, "days_remaining": v.get("days_remaining")} for k, v in domains.items()
+             if v.get("days_remaining") is not None and v["days_remaining"] <= v.get("apply_for_days_in_advance", 3)],
+            key=lambda i: i["days_remaining"]),
+        "renew_started": sorted({i["domain"] for i in events if i["event"] == RENEW_STARTED}),
+        "renewed": sorted({i["domain"] for i in deployed}),
+        "failures": [{"domain": i["domain"], "detail": i["detail"],
+                      "time": time.strftime("%H:%M:%S", time.localtime(i["time"]))}
+                     for i in events if i["event"] == FAILED],
+        "quota": quota,
+        "avg_time_to_deploy_minutes": round(sum(durations) / len(durations) / 60, 1) if durations else None,
+    }
+
+
+def render_markdown(digest: dict) -> str:
+    lines = [
+        f"# SSL证书日报 {digest['generated_at']}",
+        "",
+        f"域名总数：{digest['domains_total']}",
+        "",
+        "## 剩余天数分布",
+    ]
+    lines += [f"- {name}：{count}" for name, count in digest["days_histogram"].items()]
+    lines += ["", f"## 已续期 ({len(digest['renewed'])})"]
+    lines += [f"- {i}" for i in digest["renewed"]] or ["- 无"]
+    if digest["expiring"]:
+        lines += ["", f"## 即将过期 ({len(digest['expiring'])})"]
+        lines += [f"- {i['domain']}：剩余 {i['days_remaining']} 天" for i in digest["expiring"]]
+    lines += ["", f"## 失败 ({len(digest['failures'])})"]
+    lines += [f"- [{i['time']}] {i['domain']}：{i['detail']}" for i in digest["failures"]] or ["- 无"]
+    lines += ["", "## 配额"]
+    lines += [f"- {user}({i['user_type']})：已用 {i['used']} / {i['daily_limit']}" for user, i in digest["quota"].items()] or ["- 无记录"]
+    avg = digest["avg_time_to_deploy_minutes"]
+    lines += ["", f"平均申请到部署耗时：{f'{avg} 分钟' if avg is not None else '无'}"]
+    return "\n".join(lines)
+
+
+def render_text(digest: dict) -> str:
+    """微信通知用的紧凑格式"""
+    histogram = "，".join(f"{k} {v}" for k, v in digest["days_histogram"].items() if v)
+    quota = "；".join(f"{user} {i['used']}/{i['daily_limit']}" for user, i in digest["quota"].items())
+    avg = digest["avg_time_to_deploy_minutes"]
+    lines = [
+        f"SSL证书日报，共 {digest['domains_total']} 个域名",
+        f"剩余天数：{histogram or '无'}",
+        f"已续期 {len(digest['renewed'])} 个：{'、'.join(digest['renewed']) or '无'}",
+        f"失败 {len(digest['failures'])} 次：{'、'.join(sorted({i['domain'] for i in digest['failures']})) or '无'}",
+        f"配额：{quota or '无记录'}",
+        f"平均申请到部署耗时：{f'{avg} 分钟' if avg is not None else '无'}",
+    ]
+    return "\n".join(lines)
+
+
+def send_daily_digest(**kwargs) -> dict:
+    """生成日报，写入 JSON/Markdown 文件并通过微信通知发送"""
+    digest = build_digest()
+    os.makedirs(REPORT_PATH, exist_ok=True)
+    name = f"digest_{time.strftime('%Y_%m_%d')}"
+    with open(os.path.join(REPORT_PATH, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(digest, f, ensure_ascii=False, indent=2)
+    with open(os.path.join(REPORT_PATH, f"{name}.md"), 'w', encoding='utf-8') as f:
+        f.write(render_markdown(digest))
+    lg.info(f"SSL证书日报已生成: {REPORT_PATH}/{name}.md")
+
+    types = "error" if digest["failures"] else "warning" if digest["expiring"] else "success"
+    dispatcher.submit(render_text(digest), types)
+    return digest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="根据 run_state 生成证书日报")
+    parser.add_argument("--format", choices=("markdown", "text", "json"), default="markdown", help="输出格式")
+    parser.add_argument("--send", action="store_true", help="写入 reports 目录并通过微信通知发送")
+    args = parser.parse_args(argv)
+
+    if args.send:
+        send_daily_digest()
+        dispatcher.flush()
+        return
+    digest = build_digest()
+    if args.format == "json":
+        print(json.dumps(digest, ensure_ascii=False, indent=2))
+    else:
+        print(render_text(digest) if args.format == "text" else render_markdown(digest))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -6,59 +6,193 @@
 # Email: leiyong711@163.com
 
 
+import os
+import sys
+import json
+import glob
+import gzip
 import time
+import shutil
+import threading
 from utils import constants
 from loguru import logger as lg
 
-# logger.remove(handler_id=None)  # 清除之前的设置
-# logger.level('ERROR')
-
-
-# INFO级日志模板初始化配置
-lg.add(f"{constants.APP_PATH}/logs/info_log_{time.strftime('%Y_%m_%d')}.log",
-       # filter=handler_request,
-       level="INFO",
-       format='{time:YYYY-MM-DD HH:mm:ss.SSS} - {level} - {file} - {function} - {line} - {message}',
-       rotation="00:00",  # 文件过大就会重新生成一个新文件  "12:00"# 每天12点创建新文件
-       encoding="utf-8",
-       enqueue=True,  # 异步写入
-       serialize=False,  # 序列化为json
-       retention="10 days",  # 一段时间后会清空
-       # compression="zip"  # 保存为zip格式
-       )
-
-# ERROR级日志模板初始化配置
-lg.add(f"{constants.APP_PATH}/logs/error_log_{time.strftime('%Y_%m_%d')}.log",
-       level="ERROR",
-       format='{time:YYYY-MM-DD HH:mm:ss.SSS} - {level} - {file} - {function} - {line} - {message}',
-       rotation="00:00",  # 文件过大就会重新生成一个新文件  "12:00"# 每天12点创建新文件
-       encoding="utf-8",
-       enqueue=True,  # 异步写入
-       serialize=False,  # 序列化为json
-       retention="10 days",  # 一段时间后会清空
-       # compression="zip"  # 保存为zip格式
-       )
-
-# WARNING级日志模板初始化配置
-lg.add(f"{constants.APP_PATH}/logs/warning_log_{time.strftime('%Y_%m_%d')}.log",
-       level="WARNING",
-       format='{time:YYYY-MM-DD HH:mm:ss.SSS} - {level} - {file} - {function} - {line} - {message}',
-       rotation="00:00",  # 文件过大就会重新生成一个新文件  "12:00"# 每天12点创建新文件
-       encoding="utf-8",
-       enqueue=True,  # 异步写入
-       serialize=False,  # 序列化为json
-       retention="10 days",  # 一段时间后会清空
-       # compression="zip"  # 保存为zip格式
-       )
-
-# DEBUG级日志模板初始化配置
-lg.add(f"{constants.APP_PATH}/logs/debug_log_{time.strftime('%Y_%m_%d')}.log",
-       level="DEBUG",
-       format='{time:YYYY-MM-DD HH:mm:ss.SSS} - {level} - {file} - {function} - {line} - {message}',
-       rotation="00:00",  # 文件过大就会重新生成一个新文件  "12:00"# 每天12点创建新文件
-       encoding="utf-8",
-       enqueue=True,  # 异步写入
-       serialize=False,  # 序列化为json
-       retention="10 days",  # 一段时间后会清空
-       # compression="zip"  # 保存为zip格式
-       )
+LOG_FORMAT = '{time:YYYY-MM-DD HH:mm:ss.SSS} - {level} - {file} - {function} - {line} - {message}'
+
+# 日志级别 -> 文件名前缀，每条日志只写入自身级别对应的文件
+LEVEL_ROUTES = {
+    "TRACE": "debug",
+    "DEBUG": "debug",
+    "INFO": "info",
+    "SUCCESS": "info",
+    "WARNING": "warning",
+    "ERROR": "error",
+    "CRITICAL": "error",
+}
+
+
+class RoutingFileSink:
+    """
+    按级别分文件的日志输出
+    只注册一个 enqueue 的 sink，每条日志格式化一次，在后台线程中按级别写入 {级别}_log_{日期}.log，
+    单个文件超过大小上限或跨天时滚动，滚动后的文件可选 gzip 压缩，超过保留天数的文件自动删除
+    """
+
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024, backup_count: int = 10,
+                 compression: bool = True, retention_days: float = 10, serialize: bool = False):
+        """
+        :param path:           日志目录
+        :param max_bytes:      单个文件大小上限，0 为不限制
+        :param backup_count:   每个文件最多保留的滚动文件数量
+        :param compression:    滚动后的文件是否 gzip 压缩
+        :param retention_days: 日志保留天数
+        :param serialize:      是否按 JSON 行输出
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compression = compression
+        self.retention_days = retention_days
+        self.serialize = serialize
+        self.files = {}
+        self.lock = threading.Lock()
+        self._cleanup()
+
+    def _filename(self, route: str) -> str:
+        return os.path.join(self.path, f"{route}_log_{time.strftime('%Y_%m_%d')}.log")
+
+    def _open(self, route: str):
+        filename = self._filename(route)
+        current = self.files.get(route)
+        if current and current.name != filename:
+            current.close()
+            current = None
+            self._cleanup()
+        if current is None:
+            os.makedirs(self.path, exist_ok=True)
+            current = self.files[route] = open(filename, 'a', encoding='utf-8')
+        return current
+
+    def _rotate(self, route: str) -> None:
+        current = self.files.pop(route)
+        current.close()
+        suffix = ".gz" if self.compression else ""
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{current.name}.{i}{suffix}"
+            if os.path.exists(src):
+                os.replace(src, f"{current.name}.{i + 1}{suffix}")
+        if self.compression:
+            with open(current.name, 'rb') as src, gzip.open(f"{current.name}.1.gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(current.name)
+        else:
+            os.replace(current.name, f"{current.name}.1")
+
+    def _cleanup(self) -> None:
+        expire = time.time() - self.retention_days * 86400
+        for file in glob.glob(os.path.join(self.path, "*_log_*.log*")):
+            try:
+                if os.path.getmtime(file) < expire:
+                    os.remove(file)
+            except OSError:
+                ...
+
+    @staticmethod
+    def _json(record) -> str:
+        data = {
+            "time": record["time"].isoformat(),
+            "level": record["level"].name,
+            "file": record["file"].name,
+            "function": record["function"],
+            "line": record["line"],
+            "message": record["message"],
+        }
+        if record["extra"]:
+            data["extra"] = record["extra"]
+        if record["exception"]:
+            data["exception"] = str(record["exception"].value)
+        return json.dumps(data, ensure_ascii=False, default=str) + "\n"
+
+    def write(self, message) -> None:
+        record = message.record
+        route = LEVEL_ROUTES.get(record["level"].name, "info")
+        text = self._json(record) if self.serialize else message
+        with self.lock:
+            try:
+                f = self._open(route)
+                f.write(text)
+                f.flush()
+                if self.max_bytes and f.tell() > self.max_bytes:
+                    self._rotate(route)
+            except OSError as e:
+                sys.stderr.write(f"日志写入失败: {e}\n")
+
+    def stop(self) -> None:
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files.clear()
+
+
+class LogSampler:
+    """热点日志限流：同一个 key 在时间窗口内只输出一次，下一次输出时附带期间省略的条数"""
+
+    def __init__(self, interval: float = 60):
+        self.interval = interval
+        self.last = {}
+        self.suppressed = {}
+        self.lock = threading.Lock()
+
+    def allow(self, key: str, interval: float = None) -> tuple:
+        """:return: (是否输出, 上次输出后省略的条数)"""
+        interval = self.interval if interval is None else interval
+        now = time.monotonic()
+        with self.lock:
+            if now - self.last.get(key, float("-inf")) < interval:
+                self.suppressed[key] = self.suppressed.get(key, 0) + 1
+                return False, 0
+            self.last[key] = now
+            return True, self.suppressed.pop(key, 0)
+
+
+sampler = LogSampler()
+
+
+def log_throttled(key: str, message: str, level: str = "INFO", interval: float = None) -> None:
+    """
+    限流输出日志，用于每次接口调用都会打印的热点日志
+    :param key:      限流 key，相同 key 共享时间窗口
+    :param interval: 窗口大小（秒），默认使用 log.throttle_interval 配置
+    """
+    allowed, suppressed = sampler.allow(key, interval)
+    if not allowed:
+        return
+    if suppressed:
+        message = f"{message}（前 {sampler.interval if interval is None else interval:g} 秒内省略 {suppressed} 条同类日志）"
+    lg.opt(depth=1).log(level, message)
+
+
+file_sink = RoutingFileSink(constants.LOG_PATH)
+file_sink_id = lg.add(file_sink, level="DEBUG", format=LOG_FORMAT, enqueue=True)
+
+
+def setup_logging(config) -> None:
+    """
+    按配置文件重新注册日志输出，配置加载后调用（config 模块依赖本模块，导入时还不能读取配置）
+    :param config: utils.config.Config 实例
+    """
+    global file_sink, file_sink_id
+    serialize = bool(config.get_jsonpath("$.log.serialize", False))
+    new_sink = RoutingFileSink(
+        config.get_jsonpath("$.log.path", "") or constants.LOG_PATH,
+        max_bytes=int(config.get_jsonpath("$.log.max_size_mb", 50) * 1024 * 1024),
+        backup_count=int(config.get_jsonpath("$.log.backup_count", 10)),
+        compression=bool(config.get_jsonpath("$.log.compression", True)),
+        retention_days=float(config.get_jsonpath("$.log.retention_days", 10)),
+        serialize=serialize,
+    )
+    lg.remove(file_sink_id)
+    file_sink = new_sink
+    file_sink_id = lg.add(file_sink, level=config.get_jsonpath("$.log.level", "DEBUG"),
+                          format="{message}" if serialize else LOG_FORMAT, enqueue=True)
+    sampler.interval = float(config.get_jsonpath("$.log.throttle_interval", 60))
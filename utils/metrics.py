@@ -0,0 +1,234 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 17:30
+# Email: leiyong711@163.com
+
+import time
+import bisect
+import functools
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from utils.log import lg
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 1800)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if value == float("-inf"):
+        return "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """
+    指标基类
+    热路径上只有一次字典查找和一次加锁累加，格式化全部在抓取时进行
+    """
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.register(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(i, "")) for i in self.labelnames)
+
+    def samples(self) -> list:
+        """[(指标名后缀, 标签值, 额外标签, 值)]"""
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self) -> list:
+        with self.lock:
+            return [("_total", k, "", v) for k, v in self.values.items()]
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), function=None):
+        """
+        :param function: 抓取时调用的回调，返回 {标签值元组: 值} 或单个数值，适合队列深度等可以随时计算的值
+        """
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+
+    def set_function(self, function) -> None:
+        self.function = function
+
+    def samples(self) -> list:
+        values = {}
+        with self.lock:
+            values.update(self.values)
+        if self.function:
+            try:
+                result = self.function()
+                values.update(result if isinstance(result, dict) else {(): result})
+            except Exception as e:
+                lg.warning(f"指标 {self.name} 回调失败: {e}")
+        return [("", k, "", v) for k, v in values.items()]
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                item = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            item[0][index] += 1
+            item[1] += value
+            item[2] += 1
+
+    def time(self, **labels):
+        """计时上下文管理器"""
+        return _Timer(self, labels)
+
+    def samples(self) -> list:
+        samples = []
+        with self.lock:
+            items = [(k, list(v[0]), v[1], v[2]) for k, v in self.values.items()]
+        for key, counts, total, count in items:
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                samples.append(("_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+            samples.append(("_sum", key, "", total))
+            samples.append(("_count", key, "", count))
+        return samples
+
+
+class _Timer:
+
+    def __init__(self, histogram: Histogram, labels: dict):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, **self.labels)
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = []
+        self.lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        with self.lock:
+            self.metrics.append(metric)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics)
+        return "\n".join(m.render() for m in metrics) + "\n"
+
+
+registry = Registry()
+
+# 外部接口请求
+API_REQUESTS = Counter("ssl_api_requests", "外部接口请求次数", ("api", "endpoint", "status"))
+API_LATENCY = Histogram("ssl_api_request_duration_seconds", "外部接口请求耗时", ("api", "endpoint"))
+# 用户限制器
+LIMITER_WAIT = Histogram("ssl_limiter_wait_seconds", "证书平台并发限制等待时间", ("user",),
+                         buckets=(0.001, 0.01, 0.1, 0.25, 0.5, 0.75, 1, 2))
+QUOTA_REMAINING = Gauge("ssl_quota_remaining", "证书平台账号今日剩余请求次数", ("user",))
+QUOTA_USED = Gauge("ssl_quota_used", "证书平台账号今日已用请求次数", ("user",))
+CHANNEL_BALANCE = Gauge("ssl_channel_balance", "证书平台账号剩余独立通道数量", ("user",))
+CHANNEL_USED = Counter("ssl_channel_used", "使用独立通道申请证书次数", ("user", "reason"))
+# 证书
+DAYS_TO_EXPIRY = Gauge("ssl_cert_days_to_expiry", "证书距离过期剩余天数", ("domain",))
+CA_ISSUANCE_LATENCY = Histogram("ssl_ca_issuance_seconds", "从申请到证书签发完成的耗时", ("ca",),
+                                buckets=(60, 180, 300, 600, 1200, 1800, 3600, 7200, 14400, 43200, 86400))
+CA_HEDGES = Counter("ssl_ca_hedges", "因超出耗时预算在下一个 CA 发起的对冲申请次数", ("ca",))
+CHAIN_BYTES_SAVED = Gauge("ssl_chain_bytes_saved", "证书链优化后每次握手节省的证书字节数", ("domain",))
+OCSP_FETCHES = Counter("ssl_ocsp_fetches", "OCSP 响应获取次数", ("result",))
+TICKET_KEY_ROTATIONS = Counter("ssl_ticket_key_rotations", "会话票据密钥轮换推送次数", ("result",))
+# 调度器
+SCHEDULER_JOBS = Gauge("ssl_scheduler_jobs", "调度器中等待执行的作业数量")
+JOB_DURATION = Histogram("ssl_job_duration_seconds", "调度作业执行耗时", ("job",))
+
+
+def track_job(func):
+    """统计调度作业耗时，作业名取 kwargs 中的 job_name，没有时使用函数名"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with JOB_DURATION.time(job=kwargs.get("job_name") or func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        ...
+
+
+def start_metrics_server(host: str = "127.0.0.1", port: int = 9108) -> ThreadingHTTPServer:
+    """后台线程启动 /metrics 接口"""
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    lg.info(f"指标接口已启动: http://{host}:{port}/metrics")
+    return server
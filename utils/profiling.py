@@ -0,0 +1,164 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 19:10
+# Email: leiyong711@163.com
+
+import os
+import sys
+import time
+import cProfile
+import functools
+import threading
+from collections import Counter
+from utils.log import lg
+from utils.config import Config
+from utils.constants import LOG_PATH
+
+config = Config()
+
+PROFILE_ENV = "SSL_PROFILE"  # 环境变量开关，取值 cprofile / sampling / both，设置后优先于配置文件
+MODES = ("cprofile", "sampling", "both")
+
+
+def get_mode() -> str:
+    """返回当前分析模式，未开启时返回空字符串"""
+    mode = os.getenv(PROFILE_ENV, "").strip().lower()
+    if mode in ("1", "true", "on"):
+        mode = "both"
+    if not mode and config.get_jsonpath("$.profiling.enabled", False):
+        mode = str(config.get_jsonpath("$.profiling.mode", "both")).lower()
+    if mode and mode not in MODES:
+        lg.warning(f"未知的性能分析模式 {mode}，可选: {'/'.join(MODES)}")
+        return ""
+    return mode
+
+
+class StackSampler:
+    """
+    采样分析器
+    后台线程按固定间隔读取目标线程的调用栈，输出 flamegraph.pl / speedscope 可直接使用的 collapsed 格式，
+    能看到 cProfile 看不到的阻塞等待（网络、sleep、锁）
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+
+    @staticmethod
+    def _frame_name(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    def dump(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class JobProfiler:
+    """
+    调度作业性能分析
+    每次运行输出一组文件到 程序目录/logs/profiles：cProfile 的 .pstats 和采样得到的 .collapsed，
+    按数量和天数清理旧文件
+    """
+
+    def __init__(self):
+        self.path = config.get_jsonpath("$.profiling.path", "") or os.path.join(LOG_PATH, "profiles")
+        self.interval = float(config.get_jsonpath("$.profiling.interval", 0.005))
+        self.keep_runs = int(config.get_jsonpath("$.profiling.keep_runs", 50))
+        self.max_age_days = float(config.get_jsonpath("$.profiling.max_age_days", 7))
+
+    def run(self, mode: str, name: str, func, *args, **kwargs):
+        """
+        :param mode: cprofile / sampling / both
+        :param name: 作业名，用于文件名
+        """
+        os.makedirs(self.path, exist_ok=True)
+        prefix = os.path.join(self.path, f"{time.strftime('%Y%m%d_%H%M%S')}_{name}_{os.getpid()}")
+        profiler = cProfile.Profile() if mode in ("cprofile", "both") else None
+        sampler = StackSampler(threading.get_ident(), self.interval) if mode in ("sampling", "both") else None
+
+        try:
+            if sampler:
+                sampler.start()
+            if profiler:
+                profiler.enable()
+        except Exception as e:
+            # Python 3.12 起已有其他性能分析器在运行时（如作业重叠）enable 会抛出 ValueError
+            lg.error(f"作业 {name} 开启性能分析失败，本次不做分析: {e}")
+            if sampler and sampler.thread.is_alive():
+                sampler.stop()
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            if profiler:
+                profiler.disable()
+            if sampler:
+                sampler.stop()
+            try:
+                if profiler:
+                    profiler.dump_stats(f"{prefix}.pstats")
+                if sampler:
+                    sampler.dump(f"{prefix}.collapsed")
+                lg.info(f"作业 {name} 性能分析结果已保存: {prefix}.*")
+                self.cleanup()
+            except OSError as e:
+                lg.warning(f"作业 {name} 性能分析结果保存失败: {e}")
+
+    def cleanup(self) -> None:
+        """按运行次数和天数清理旧的分析文件"""
+        runs = {}
+        for file in os.listdir(self.path):
+            if file.endswith((".pstats", ".collapsed")):
+                runs.setdefault(os.path.splitext(file)[0], []).append(os.path.join(self.path, file))
+        expire = time.time() - self.max_age_days * 86400
+        for index, run in enumerate(sorted(runs, reverse=True)):
+            files = runs[run]
+            if index < self.keep_runs and min(os.path.getmtime(i) for i in files) >= expire:
+                continue
+            for file in files:
+                try:
+                    os.remove(file)
+                except OSError:
+                    ...
+
+
+mode = get_mode()
+job_profiler = JobProfiler()
+
+
+def profiled(func):
+    """
+    调度作业性能分析装饰器
+    开关在导入时读取一次，未开启时直接返回原函数，没有任何额外开销
+    """
+    if not mode:
+        return func
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return job_profiler.run(mode, func.__name__, func, *args, **kwargs)
+    return wrapper
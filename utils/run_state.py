@@ -0,0 +1,92 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 16:20
+# Email: leiyong711@163.com
+
+import time
+from utils.metrics import DAYS_TO_EXPIRY
+from utils.state_store import JsonStore
+
+EVENT_RETENTION = 30 * 86400  # 事件保留 30 天
+
+# 事件类型
+RENEW_STARTED = "renew_started"        # 开始重新申请证书
+VALIDATION_STARTED = "validation_started"  # 提交所有权验证
+DEPLOYED = "deployed"                  # 新证书部署完成
+FAILED = "failed"                      # 失败
+
+
+class RunState:
+    """
+    verify_the_certificate 的运行结果记录
+    每个域名保存最近一次检查结果，事件流水保留 30 天，日报直接从这里生成，不再调用接口
+    """
+
+    def __init__(self):
+        self.store = JsonStore("run_state", {"domains": {}, "events": [], "quota": {}})
+
+    def record_check(self, domain: str, days_remaining: int, time_end: str, status_name: str,
+                     apply_for_days_in_advance: int = 3) -> None:
+        """记录一次证书检查结果"""
+        with self.store.lock:
+            item = self.store.data["domains"].setdefault(domain, {})
+            item.update({
+                "days_remaining": days_remaining,
+                "time_end": time_end,
+                "status": status_name,
+                "apply_for_days_in_advance": apply_for_days_in_advance,
+                "checked_at": time.time(),
+            })
+
+    def record_event(self, domain: str, event: str, detail: str = "") -> None:
+        """记录事件并立即落盘"""
+        now = time.time()
+        with self.store.lock:
+            item = self.store.data["domains"].setdefault(domain, {})
+            if event == RENEW_STARTED:
+                item["renew_started_at"] = now
+            elif event == DEPLOYED:
+                item["deployed_at"] = now
+                if item.get("renew_started_at"):
+                    item["time_to_deploy"] = now - item.pop("renew_started_at")
+                else:
+                    item.pop("time_to_deploy", None)  # 没有本程序发起的续期（如在平台手动续期），不计入耗时统计
+            elif event == FAILED:
+                item["last_error"] = detail
+            self.store.data["events"].append({"time": now, "domain": domain, "event": event, "detail": detail,
+                                              "time_to_deploy": item.get("time_to_deploy") if event == DEPLOYED else None})
+            self.store.data["events"] = [i for i in self.store.data["events"] if now - i["time"] < EVENT_RETENTION]
+            self.store.save()
+
+    def record_quota(self, user_name: str, stats: dict) -> None:
+        """记录账号当日配额使用情况（来自 UserLimiter.get_user_stats）"""
+        with self.store.lock:
+            self.store.data["quota"][user_name] = {
+                "user_type": stats.get("user_type"),
+                "daily_limit": stats.get("daily_limit"),
+                "current_count": stats.get("current_count"),
+                "reset_date": str(stats.get("reset_date")),
+                "recorded_at": time.time(),
+            }
+
+    def domains(self) -> dict:
+        with self.store.lock:
+            return {k: dict(v) for k, v in self.store.data["domains"].items()}
+
+    def events(self, since: float = 0) -> list:
+        with self.store.lock:
+            return [dict(i) for i in self.store.data["events"] if i["time"] >= since]
+
+    def quota(self) -> dict:
+        with self.store.lock:
+            return {k: dict(v) for k, v in self.store.data["quota"].items()}
+
+    def save(self) -> None:
+        self.store.save()
+
+
+run_state = RunState()
+DAYS_TO_EXPIRY.set_function(lambda: {(k,): v["days_remaining"] for k, v in run_state.domains().items()
+                                     if v.get("days_remaining") is not None})
@@ -0,0 +1,55 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 16:10
+# Email: leiyong711@163.com
+
+import os
+import json
+import tempfile
+import threading
+from utils.log import lg
+from utils.constants import STATE_PATH
+
+
+class JsonStore:
+    """
+    本地 JSON 状态文件
+    读写都在锁内进行，写入先写临时文件再原子替换，进程中途退出也不会留下半个文件
+    """
+
+    def __init__(self, name: str, default=None, root: str = ""):
+        """
+        :param name:    文件名（不含扩展名）
+        :param default: 文件不存在时的初始数据
+        :param root:    保存目录，默认 程序目录/state
+        """
+        self.path = os.path.join(root or STATE_PATH, f"{name}.json")
+        self.lock = threading.RLock()
+        self.data = self._load(default if default is not None else {})
+
+    def _load(self, default):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return default
+        except (OSError, ValueError) as e:
+            lg.warning(f"状态文件 {self.path} 读取失败，使用初始数据: {e}")
+            return default
+
+    def save(self) -> None:
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+                os.replace(tmp, self.path)
+            except Exception:
+                try:
+                    os.remove(tmp)
+                except OSError:
+                    ...
+                raise
@@ -0,0 +1,223 @@
+# !/usr/bin/env python
+# -*- coding:utf-8 -*-
+# project name: SSLCertAutoIssue
+# author: "Lei Yong" 
+# creation time: 2026-10-19 18:40
+# Email: leiyong711@163.com
+
+import os
+import sys
+import json
+import time
+import secrets
+import argparse
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+from utils.config import Config
+from utils.constants import LOG_PATH
+
+config = Config()
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_baggage = contextvars.ContextVar("trace_baggage", default={})
+
+
+class SpanExporter:
+    """
+    span 以 OpenTelemetry 兼容的结构逐行写入 logs/traces/spans.jsonl，按大小滚动
+    命令行 python -m utils.tracing [文件] 按域名输出关键路径耗时分布
+    """
+
+    def __init__(self):
+        self.path = config.get_jsonpath("$.tracing.path", "") or os.path.join(LOG_PATH, "traces", "spans.jsonl")
+        self.max_bytes = int(config.get_jsonpath("$.tracing.max_bytes", 20 * 1024 * 1024))
+        self.backup_count = int(config.get_jsonpath("$.tracing.backup_count", 5))
+        self.lock = threading.Lock()
+
+    def _rotate(self):
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def export(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) + len(line) > self.max_bytes:
+                self._rotate()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+class Span:
+
+    def __init__(self, name: str, attributes: dict = None):
+        parent = _current_span.get()
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else ""
+        self.attributes = {**_baggage.get(), **(attributes or {})}
+        self.status = "OK"
+        self.message = ""
+        self.start = 0
+        self.token = None
+
+    def set_attribute(self, key: str, value) -> None:
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self.start = time.time_ns()
+        self.token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.time_ns()
+        _current_span.reset(self.token)
+        if exc_type is not None:
+            self.status, self.message = "ERROR", f"{exc_type.__name__}: {exc}"
+        exporter.export({
+            "resource": {"service.name": "SSLCertAutoIssue"},
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "kind": "SPAN_KIND_INTERNAL",
+            "startTimeUnixNano": self.start,
+            "endTimeUnixNano": end,
+            "attributes": self.attributes,
+            "status": {"code": f"STATUS_CODE_{self.status}", "message": self.message},
+        })
+        return False
+
+
+class _NoopSpan:
+
+    def set_attribute(self, key: str, value) -> None:
+        ...
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+enabled = bool(config.get_jsonpath("$.tracing.enabled", False))
+exporter = SpanExporter()
+
+
+def span(name: str, **attributes):
+    """创建 span，未开启追踪时返回空操作对象"""
+    if not enabled:
+        return NOOP_SPAN
+    return Span(name, attributes)
+
+
+def set_baggage(**attributes) -> None:
+    """设置当前上下文中之后创建的 span 都会带上的属性（如 domain、cert_id）"""
+    if enabled:
+        _baggage.set({**_baggage.get(), **attributes})
+
+
+def traced(name: str, attributes=None):
+    """
+    span 装饰器
+    :param name:       span 名称
+    :param attributes: 可选回调 (args, kwargs) -> dict，从调用参数中提取属性
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            token = _baggage.set(dict(_baggage.get())) if _current_span.get() is None else None
+            try:
+                with Span(name, attributes(args, kwargs) if attributes else None):
+                    return func(*args, **kwargs)
+            finally:
+                if token is not None:
+                    _baggage.reset(token)
+        return wrapper
+    return decorator
+
+
+def load_spans(path: str) -> list:
+    spans = []
+    files = [f"{path}.{i}" for i in range(20, 0, -1) if os.path.exists(f"{path}.{i}")] + [path]
+    for file in files:
+        if not os.path.exists(file):
+            continue
+        with open(file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    spans.append(json.loads(line))
+                except ValueError:
+                    continue
+    return spans
+
+
+def critical_path(spans: list) -> dict:
+    """
+    按域名统计关键路径
+    每个 span 的自身耗时 = 总耗时 - 子 span 耗时，按名称（网络请求再按接口）汇总；
+    域名第一个 span 开始到最后一个 span 结束之间没有被任何 span 覆盖的时间记为调度等待（如验证结果的三分钟轮询）
+    :return: {域名: {"wall": 秒, "items": {分类: 秒}, "idle": 秒}}
+    """
+    children = defaultdict(float)
+    for s in spans:
+        if s.get("parentSpanId"):
+            children[s["parentSpanId"]] += (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e9
+
+    result = {}
+    for s in spans:
+        domain = s.get("attributes", {}).get("domain")
+        if not domain:
+            continue
+        item = result.setdefault(domain, {"start": s["startTimeUnixNano"], "end": s["endTimeUnixNano"],
+                                          "items": defaultdict(float)})
+        item["start"] = min(item["start"], s["startTimeUnixNano"])
+        item["end"] = max(item["end"], s["endTimeUnixNano"])
+        name = s["name"]
+        endpoint = s.get("attributes", {}).get("endpoint")
+        if endpoint:
+            name = f"{name} {endpoint}"
+        duration = (s["endTimeUnixNano"] - s["startTimeUnixNano"]) / 1e9
+        item["items"][name] += max(duration - children.get(s["spanId"], 0), 0)
+
+    for domain, item in result.items():
+        item["wall"] = (item["end"] - item["start"]) / 1e9
+        item["idle"] = max(item["wall"] - sum(item["items"].values()), 0)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="按域名输出 span 关键路径耗时分布")
+    parser.add_argument("path", nargs="?", default=exporter.path, help="spans.jsonl 路径")
+    parser.add_argument("--domain", help="只输出指定域名")
+    parser.add_argument("--top", type=int, default=10, help="每个域名输出耗时最多的前 N 项")
+    parser.add_argument("--since", type=float, default=24, help="只统计最近 N 小时的 span")
+    args = parser.parse_args(argv)
+
+    since = time.time_ns() - int(args.since * 3600 * 1e9)
+    report = critical_path([s for s in load_spans(args.path) if s.get("startTimeUnixNano", 0) >= since])
+    if not report:
+        print(f"{args.path} 中没有带域名的 span")
+        return
+    for domain, item in sorted(report.items(), key=lambda i: -i[1]["wall"]):
+        if args.domain and domain != args.domain:
+            continue
+        print(f"\n{domain}  总耗时 {item['wall']:.1f}s")
+        rows = sorted(item["items"].items(), key=lambda i: -i[1])[:args.top] + [("调度等待", item["idle"])]
+        for name, seconds in rows:
+            share = seconds / item["wall"] * 100 if item["wall"] else 0
+            print(f"  {name:<48} {seconds:>10.2f}s {share:>6.1f}%")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -9,8 +9,9 @@ import time
 import threading
 from datetime import datetime, timedelta
 from collections import defaultdict
-from utils.log import lg
+from utils.log import lg, log_throttled
 from utils.config import Config
+from utils.metrics import QUOTA_REMAINING, QUOTA_USED
 
 
 class UserLimiter:
@@ -77,7 +78,7 @@ class UserLimiter:
             if time_diff < self.rate_limit_interval:
                 # 计算需要等待的时间
                 wait_time = self.rate_limit_interval - time_diff
-                lg.info(f"用户 {user_name} 触发并发限制，等待 {wait_time:.1f} 秒...")
+                log_throttled(f"limiter.wait.{user_name}", f"用户 {user_name} 触发并发限制，等待 {wait_time:.1f} 秒...")
                 time.sleep(wait_time)
                 # 更新最后请求时间为当前时间
                 self.last_request_time[user_name] = time.time()
@@ -122,7 +123,7 @@ class UserLimiter:
         # 增加请求计数
         self.increment_request_count(user_name)
         
-        lg.info(f"用户 {user_name} 限制检查通过: {daily_msg}")
+        log_throttled(f"limiter.pass.{user_name}", f"用户 {user_name} 限制检查通过: {daily_msg}")
         return True, daily_msg
     
     def get_user_stats(self, user_name):
@@ -144,5 +145,12 @@ class UserLimiter:
             }
 
 
+    def quota_metrics(self, key: str) -> dict:
+        """供指标接口抓取时调用 {(用户名,): 值}，key 为 get_user_stats 中的字段"""
+        return {(user_name,): self.get_user_stats(user_name)[key] for user_name in list(self.daily_requests)}
+
+
 # 全局用户限制器实例
 user_limiter = UserLimiter()
+QUOTA_REMAINING.set_function(lambda: user_limiter.quota_metrics('remaining'))
+QUOTA_USED.set_function(lambda: user_limiter.quota_metrics('current_count'))
@@ -6,49 +6,179 @@
 # Email: leiyong711@163.com
 
 import time
+import queue
+import atexit
+import threading
 import traceback
 import requests
 from utils.config import Config
 from utils.log import lg
+from utils.metrics import API_REQUESTS, API_LATENCY
 
 config = Config()
 
+# 通知类型对应的图标，汇总时按此顺序发送
+NOTI_ICONS = {
+    "error": "❌",
+    "warning": "⚠️",
+    "success": "✅",
+}
+
+
+class WxNotiDispatcher:
+    """
+    微信通知后台发送队列
+    send_wx_noti 只负责入队，后台线程把同一时间窗口内的消息按类型合并成一条汇总发送，
+    相同内容在去重窗口内只发送一次，通知平台卡住也不会影响证书续期
+    """
+
+    def __init__(self):
+        self.batch_window = float(config.get_jsonpath("$.we_chat_noti.batch_window", 10))
+        self.dedup_window = float(config.get_jsonpath("$.we_chat_noti.dedup_window", 300))
+        self.timeout = float(config.get_jsonpath("$.we_chat_noti.timeout", 5))
+        self.retries = int(config.get_jsonpath("$.we_chat_noti.retries", 3))
+        self.queue = queue.Queue(maxsize=int(config.get_jsonpath("$.we_chat_noti.max_queue", 1000)))
+        self.recent = {}  # (类型, 内容) -> 最近一次入队时间
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        self.flushing = threading.Event()
+        self.worker = None
+
+    def _start(self):
+        with self.lock:
+            if self.worker is None or not self.worker.is_alive():
+                self.worker = threading.Thread(target=self._run, name="wx-noti", daemon=True)
+                self.worker.start()
+
+    def _is_duplicate(self, msg: str, types: str, now: float) -> bool:
+        with self.lock:
+            if len(self.recent) > 1000:
+                self.recent = {k: t for k, t in self.recent.items() if now - t < self.dedup_window}
+            last = self.recent.get((types, msg))
+            if last is not None and now - last < self.dedup_window:
+                return True
+            self.recent[(types, msg)] = now
+            return False
+
+    def submit(self, msg: str, types: str = "success") -> None:
+        """消息入队，不会阻塞调用方"""
+        now = time.time()
+        if self._is_duplicate(msg, types, now):
+            lg.debug(f"微信通知重复，已忽略: {msg}")
+            return
+        self._start()
+        try:
+            self.queue.put_nowait((now, types, msg))
+        except queue.Full:
+            lg.warning(f"微信通知队列已满，丢弃通知: {msg}")
+
+    def _collect(self) -> list:
+        """取出一个时间窗口内的全部消息"""
+        items = [self.queue.get()]
+        deadline = time.time() + self.batch_window
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0 or self.flushing.is_set():
+                break
+            try:
+                items.append(self.queue.get(timeout=min(remaining, 0.5)))
+            except queue.Empty:
+                continue
+        return items
+
+    def _run(self):
+        while True:
+            items = self._collect()
+            try:
+                grouped = {}
+                for item in items:
+                    grouped.setdefault(item[1] if item[1] in NOTI_ICONS else "error", []).append(item)
+                for types in NOTI_ICONS:
+                    if types in grouped:
+                        self._send(self._format(types, grouped[types]))
+            except Exception:
+                lg.error(f"微信通知发送失败，原因: {traceback.format_exc()}")
+            finally:
+                for _ in items:
+                    self.queue.task_done()
+
+    @staticmethod
+    def _format(types: str, items: list) -> str:
+        icon = NOTI_ICONS[types]
+        timer = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(items[0][0]))
+        if len(items) == 1:
+            return f"⏰ {timer}\n{icon} {items[0][2]}"
+        lines = [f"⏰ {timer}\n{icon} 汇总 {len(items)} 条通知"]
+        for i, (created, _, msg) in enumerate(items, start=1):
+            lines.append(f"{i}. [{time.strftime('%H:%M:%S', time.localtime(created))}] {msg}")
+        return "\n".join(lines)
+
+    def _send(self, text: str) -> bool:
+        wx_noti_host = config.get_jsonpath("$.we_chat_noti.wx_noti_host", "")
+        wx_token = config.get_jsonpath("$.we_chat_noti.wx_token", "")
+        if not wx_noti_host or not wx_token:
+            lg.error("微信通知配置错误，请检查配置文件")
+            return False
+
+        wx_room_noti = config.get_jsonpath("$.we_chat_noti.wx_room_noti", False)
+        wx_room_id = config.get_jsonpath("$.we_chat_noti.wx_room_id", "")
+        wx_id = config.get_jsonpath("$.we_chat_noti.wx_id", "")
+
+        data = {
+            "text": text,
+            "wxcode": wx_id,
+        }
+
+        if wx_room_noti and wx_room_id:
+            data['wxqun'] = wx_room_id
+
+        for attempt in range(1, self.retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(url=f"{wx_noti_host}/api/send_wx/{wx_token}", json=data, timeout=self.timeout)
+                API_REQUESTS.inc(api="wechat", endpoint="send_wx", status=resp.status_code)
+                r = resp.json()
+                if r.get("code") == 200 and r.get("message") == "ok":
+                    return True
+                lg.warning(f"微信通知失败，原因: {r.get('message')}")
+            except Exception as e:
+                if isinstance(e, requests.exceptions.RequestException):
+                    API_REQUESTS.inc(api="wechat", endpoint="send_wx", status="error")
+                lg.warning(f"微信通知失败，第 {attempt} 次，原因: {e}")
+            finally:
+                API_LATENCY.observe(time.perf_counter() - start, api="wechat", endpoint="send_wx")
+            if attempt < self.retries:
+                time.sleep(min(2 ** attempt, 30))
+        lg.error(f"微信通知重试 {self.retries} 次后仍然失败，通知内容:\n{text}")
+        return False
+
+    def flush(self, timeout: float = 30) -> bool:
+        """立即结束当前合并窗口，等待队列中的通知发送完成"""
+        self.flushing.set()
+        try:
+            deadline = time.time() + timeout
+            while self.queue.unfinished_tasks:
+                if time.time() > deadline:
+                    return False
+                time.sleep(0.1)
+            return True
+        finally:
+            self.flushing.clear()
+
+
+dispatcher = WxNotiDispatcher()
+atexit.register(dispatcher.flush, 10)
+
 
 def send_wx_noti(msg: str, types="success"):
     """
-    发送微信通知
+    发送微信通知（异步，合并、去重后由后台线程发送）
     :param msg: 通知内容
+    :param types: success / warning / error
     :return:
     """
-    wx_noti_host = config.get_jsonpath("$.we_chat_noti.wx_noti_host", "")
-    wx_token = config.get_jsonpath("$.we_chat_noti.wx_token", "")
-    if not wx_noti_host or not wx_token:
-        lg.error("微信通知配置错误，请检查配置文件")
+    # 开启日报并静音逐条通知时，只发送错误通知，其余内容以日报为准
+    if types != "error" and config.get_jsonpath("$.digest.enabled", False) and config.get_jsonpath("$.digest.mute_event_noti", False):
+        lg.debug(f"逐条通知已静音: {msg}")
         return
-
-    wx_room_noti = config.get_jsonpath("$.we_chat_noti.wx_room_noti", False)
-    wx_room_id = config.get_jsonpath("$.we_chat_noti.wx_room_id", "")
-    wx_id = config.get_jsonpath("$.we_chat_noti.wx_id", "")
-
-    timer = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
-    if types == "success":
-        msg = f"⏰ {timer}\n✅ {msg}"
-    elif types == "warning":
-        msg = f"⏰ {timer}\n⚠️ {msg}"
-    else:
-        msg = f"⏰ {timer}\n❌ {msg}"
-
-    data = {
-        "text": msg,
-        "wxcode": wx_id,
-    }
-
-    if wx_room_noti and wx_room_id:
-        data['wxqun'] = wx_room_id
-
-    try:
-        r = requests.post(url=f"{wx_noti_host}/api/send_wx/{wx_token}", json=data).json()
-        if r.get("code") != 200 or r.get("message") != "ok":
-            lg.warning(f"微信通知失败，原因: {r.get('message')}")
-    except Exception as e:
-        lg.error(f"微信通知失败，原因: {traceback.format_exc()}")
+    dispatcher.submit(msg, types)